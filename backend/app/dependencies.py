@@ -0,0 +1,31 @@
+from typing import Any, Optional
+from fastapi import Request
+from .services.llm_service import LLMService
+
+# FastAPI dependencies wiring app-lifetime state (see lifespan in main.py) into routes
+
+
+def llm_service_for(state: Any) -> LLMService:
+    """LLMService over the shared clients, caches and limiters in app.state."""
+    return LLMService(
+        clients=state.provider_clients,
+        cache=state.response_cache,
+        flights=state.single_flight,
+        limiters=state.rate_limiters,
+        router=state.provider_router,
+        semantic=state.semantic_cache,
+    )
+
+
+def get_llm_service(request: Request) -> LLMService:
+    return llm_service_for(request.app.state)
+
+
+def get_retriever(request: Request) -> Optional[Any]:
+    """The app's retrieval.Retriever, or None when RAG_INDEX_DIR is not set."""
+    return request.app.state.retriever
+
+
+def get_history(request: Request) -> Optional[Any]:
+    """The app's history.GapHistory, or None when HISTORY_SQLITE_PATH is not set."""
+    return request.app.state.gap_history
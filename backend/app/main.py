@@ -1,8 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import prompt
+from .routers import history, ingest, jobs, metrics, prompt, stats
+from .services.cache import ResponseCache
+from .services.history import GapHistory
+from .services.http_clients import ProviderClients
+from .services.jobs import JobQueue
+from .services.metrics import REGISTRY, state_collector
+from .services.prompts import config, install_reload_signal, remove_reload_signal, watch_prompts
+from .services.ratelimit import limiters_from_config
+from .services.routing import ProviderRouter
+from .services.semantic_cache import SemanticCache
+from .services.shared_state import shared_state_from_config
+from .services.singleflight import SingleFlight
+from .services.strategies import get_strategy_registry
 
-app = FastAPI(title="Cognify Backend", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Read and compile all prompt strategies once, before serving requests
+    get_strategy_registry()
+    # One pooled HTTP client per provider for the lifetime of the app
+    app.state.provider_clients = ProviderClients()
+    # Cache, single-flight and rate limits span all workers when SHARED_STATE is set
+    shared = app.state.shared_state = shared_state_from_config()
+    app.state.response_cache = ResponseCache.from_config(shared) if config.cache_enabled else None
+    app.state.single_flight = (
+        SingleFlight(shared, lease=config.shared_flight_lease) if config.singleflight_enabled else None
+    )
+    app.state.rate_limiters = limiters_from_config(shared)
+    app.state.provider_router = ProviderRouter.from_config() if config.provider_routes else None
+    app.state.embeddings = None
+    app.state.retriever = None
+    app.state.ingest_lock = asyncio.Lock()
+    if config.rag_index_dir:
+        # numpy is only needed when retrieval is configured
+        from .services.embeddings import EmbeddingService
+        from .services.retrieval import Retriever, VectorIndex
+
+        app.state.embeddings = EmbeddingService.from_config(app.state.provider_clients)
+        index = VectorIndex.open_or_create(config.rag_index_dir, app.state.embeddings.dim)
+        # Query vectors need the IDF weights the index was embedded with
+        app.state.embeddings.use_idf_file(config.rag_index_dir)
+        app.state.retriever = Retriever(
+            index,
+            app.state.embeddings,
+            top_k=config.rag_top_k,
+            nprobe=config.rag_nprobe or None,
+            min_score=config.rag_min_score,
+        )
+    app.state.semantic_cache = (
+        SemanticCache.from_config(app.state.embeddings) if config.semantic_cache_enabled else None
+    )
+    # Weaknesses per student, rolled up per class and student for dashboards
+    app.state.gap_history = GapHistory.from_config() if config.history_sqlite_path else None
+    # Background workers for submitted analyses (POST /api/prompt-test/jobs)
+    app.state.job_queue = None
+    if config.jobs_enabled:
+        app.state.job_queue = JobQueue.from_config(jobs.prompt_test_handler(app.state))
+        await app.state.job_queue.start()
+    # Component stats are read at scrape time by GET /metrics
+    collector = state_collector(app.state)
+    REGISTRY.add_collector(collector)
+    # Pick up prompt file edits without a restart (polling, and SIGHUP to force it)
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.create_task(watch_prompts(config.prompt_reload_interval)) if config.prompt_reload_interval > 0 else None
+    install_reload_signal(loop)
+    try:
+        yield
+    finally:
+        remove_reload_signal(loop)
+        if watcher is not None:
+            watcher.cancel()
+        REGISTRY.remove_collector(collector)
+        if app.state.job_queue is not None:
+            await app.state.job_queue.stop()
+        if app.state.semantic_cache is not None:
+            await app.state.semantic_cache.close()
+        if app.state.gap_history is not None:
+            await app.state.gap_history.close()
+        await app.state.provider_clients.aclose()
+        if app.state.response_cache is not None:
+            app.state.response_cache.close()
+        if app.state.retriever is not None:
+            app.state.retriever.index.close()
+        if app.state.embeddings is not None:
+            app.state.embeddings.close()
+        if shared is not None:
+            shared.close()
+
+
+app = FastAPI(title="Cognify Backend", version="0.1.0", lifespan=lifespan)
 
 # Basic CORS; tighten for production
 app.add_middleware(
@@ -14,7 +103,13 @@ app.add_middleware(
 )
 
 app.include_router(prompt.router, prefix="/api")
+app.include_router(stats.router, prefix="/api")
+app.include_router(ingest.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(history.router, prefix="/api")
+# Unprefixed, where Prometheus scrapes by default
+app.include_router(metrics.router)
 
 @app.get("/")
 def root():
-    return {"status": "ok", "service": "cognify-backend"}
\ No newline at end of file
+    return {"status": "ok", "service": "cognify-backend"}
@@ -0,0 +1,77 @@
+import time
+from typing import Any, Dict, List
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel
+from ..services.history import ReportRecord
+from ..services.report_parser import GapReport
+
+router = APIRouter()
+
+class HistoryReport(BaseModel):
+    student_id: str
+    class_id: str = ""
+    quiz_id: str = ""
+    created_at: float | None = None  # Unix time; defaults to now
+    report: GapReport
+
+class HistoryImport(BaseModel):
+    reports: List[HistoryReport]
+
+def _history(request: Request):
+    history = request.app.state.gap_history
+    if history is None:
+        raise HTTPException(status_code=404, detail="Gap history is disabled (HISTORY_SQLITE_PATH is empty)")
+    return history
+
+@router.post("/history/reports")
+async def import_reports(body: HistoryImport, request: Request) -> Dict[str, Any]:
+    """Bulk-load parsed reports (e.g. from an earlier system); written in batches, one transaction each."""
+    history = _history(request)
+    now = time.time()
+    records = [
+        ReportRecord.from_report(r.student_id, r.class_id, r.quiz_id, r.report, now if r.created_at is None else r.created_at)
+        for r in body.reports
+    ]
+    return {"imported": await history.insert_many(records)}
+
+@router.get("/history/classes/{class_id}")
+async def class_overview(
+    class_id: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000, description="weakest concepts listed"),
+) -> Dict[str, Any]:
+    """Per-concept mastery across the class, weakest first."""
+    overview = await _history(request).class_overview(class_id, limit)
+    if overview is None:
+        raise HTTPException(status_code=404, detail="No reports for this class")
+    return overview
+
+@router.get("/history/students/{student_id}")
+async def student_overview(
+    student_id: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000, description="weakest concepts listed"),
+) -> Dict[str, Any]:
+    """Per-concept mastery of one student, weakest first, with the latest confidence of each."""
+    overview = await _history(request).student_overview(student_id, limit)
+    if overview is None:
+        raise HTTPException(status_code=404, detail="No reports for this student")
+    return overview
+
+@router.get("/history/students/{student_id}/trend")
+async def student_trend(
+    student_id: str,
+    request: Request,
+    days: int = Query(0, ge=0, description="last N days only (0 = all)"),
+) -> Dict[str, Any]:
+    """Daily gap score of one student (summed weakness confidence per report), oldest first."""
+    return {"student_id": student_id, "days": await _history(request).student_trend(student_id, days or None)}
+
+@router.get("/history/students/{student_id}/reports")
+async def student_reports(
+    student_id: str,
+    request: Request,
+    limit: int = Query(20, ge=1, le=500),
+) -> Dict[str, Any]:
+    """The student's latest stored reports, newest first."""
+    return {"student_id": student_id, "reports": await _history(request).student_reports(student_id, limit)}
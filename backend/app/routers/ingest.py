@@ -0,0 +1,24 @@
+from dataclasses import asdict
+from typing import Any, Dict
+from fastapi import APIRouter, HTTPException, Request
+from ..services.prompts import config
+
+router = APIRouter()
+
+@router.post("/ingest")
+async def ingest(request: Request) -> Dict[str, Any]:
+    """Incrementally ingest RAG_CONTENT_DIR into the live retrieval index."""
+    state = request.app.state
+    if state.retriever is None or not config.rag_content_dir:
+        raise HTTPException(status_code=400, detail="Ingestion needs RAG_INDEX_DIR and RAG_CONTENT_DIR")
+    if state.ingest_lock.locked():
+        raise HTTPException(status_code=409, detail="An ingestion run is already in progress")
+    from ..services.ingestion import Ingestor
+
+    async with state.ingest_lock:
+        ingestor = Ingestor.for_index(state.retriever.index, state.embeddings)
+        try:
+            stats = await ingestor.run(config.rag_content_dir)
+        finally:
+            ingestor.close()
+    return asdict(stats)
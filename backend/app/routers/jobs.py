@@ -0,0 +1,92 @@
+from typing import Any, Dict
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import BaseModel
+from ..dependencies import llm_service_for
+from ..services.jobs import CANCELLED, INTERACTIVE, LANES, Job, JobHandler, QueueFullError
+from .prompt import PromptTestRequest, PromptTestResponse, analyze_submission, check_strategy
+
+router = APIRouter()
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    lane: str
+    status: str
+    position: int | None = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    lane: str
+    status: str  # queued, running, done, failed or cancelled
+    position: int | None = None  # place in the queue while queued
+    result: PromptTestResponse | None = None
+    error: str | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+
+def prompt_test_handler(state: Any) -> JobHandler:
+    """Job handler running a /prompt-test analysis with the app's shared services."""
+    async def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
+        body = PromptTestRequest(**payload)
+        response = await analyze_submission(body, llm_service_for(state), state.retriever, state.gap_history)
+        return response.model_dump()
+    return handle
+
+def _queue(request: Request):
+    queue = request.app.state.job_queue
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Job mode is disabled (JOBS_ENABLED=false)")
+    return queue
+
+def _status(queue, job: Job) -> JobStatus:
+    return JobStatus(
+        job_id=job.id,
+        lane=job.lane,
+        status=job.status,
+        position=queue.position(job),
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+@router.post("/prompt-test/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_prompt_test_job(
+    body: PromptTestRequest,
+    request: Request,
+    lane: str = Query(INTERACTIVE, description=f"one of {', '.join(LANES)}"),
+):
+    """Queue an analysis and return its job id immediately; poll GET /jobs/{job_id}."""
+    queue = _queue(request)
+    check_strategy(body)
+    try:
+        job = await queue.submit(body.model_dump(), lane=lane)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except QueueFullError as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+    return JobSubmitted(job_id=job.id, lane=job.lane, status=job.status, position=queue.position(job))
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(
+    job_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=60, description="long-poll: seconds to wait for the job to finish"),
+):
+    queue = _queue(request)
+    job = await queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return _status(queue, job)
+
+@router.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str, request: Request, response: Response):
+    """Cancel a queued job; running or finished jobs are left as is (409)."""
+    queue = _queue(request)
+    job = await queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if job.status != CANCELLED:
+        response.status_code = 409
+    return _status(queue, job)
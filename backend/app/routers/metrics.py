@@ -0,0 +1,11 @@
+from fastapi import APIRouter, HTTPException, Response
+from ..services.metrics import CONTENT_TYPE, REGISTRY
+
+router = APIRouter()
+
+@router.get("/metrics")
+def metrics() -> Response:
+    """Prometheus text exposition of request metrics and component stats."""
+    if not REGISTRY.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false)")
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -1,10 +1,27 @@
-from fastapi import APIRouter
+import json
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ..services.prompts import config, render_user_prompt
-from ..services.llm_service import LLMService
+from ..dependencies import get_history, get_llm_service, get_retriever
+from ..services.grading import Grading, grade
+from ..services.prompts import config
+from ..services.llm_service import GenerationRequest, LLMService
+from ..services.metrics import GRADED, STAGE_SECONDS
+from ..services.report_parser import GapReport, JSONBlockScanner, parse_report
+from ..services.semantic_cache import SemanticKey
+from ..services.packing import TrimRecord, pack_inputs
+from ..services.strategies import AUTO, PromptExample, StrategyInput, get_strategy_registry
+from ..services.tokenization import TokenEstimationOptions
 
 router = APIRouter()
 
+class PromptExampleModel(BaseModel):
+    input: str
+    output: str
+    explanation: str = ""
+
 class PromptTestRequest(BaseModel):
     answers: str
     context: str = ""
@@ -12,28 +29,393 @@ class PromptTestRequest(BaseModel):
     student_profile: str = ""
     constraints: str = ""
     temperature: float | None = None  # Optional per-request override
+    cache: bool | None = None  # True opts sampled (temperature > 0) requests into the cache
+    # default, zero_shot, one_shot, multi_shot, dynamic or auto (richest that fits the token budget)
+    strategy: str | None = None
+    examples: List[PromptExampleModel] = []  # for one/multi-shot; built-in examples if empty
+    # Fill the prompt with top-k course chunks (default: on when a RAG index is configured)
+    use_retrieval: bool | None = None
+    retrieval_query: str = ""  # defaults to the answers
+    json_mode: bool | None = None  # JSON-only provider output (default JSON_MODE)
+    quiz_id: str = ""  # groups submissions for the semantic cache and its per-quiz threshold
+    grade: bool | None = None  # grade against answer_key before calling the model (default GRADING_ENABLED)
+    # Record the report in the gap history under this student (when HISTORY_SQLITE_PATH is set)
+    student_id: str = ""
+    class_id: str = ""
+
+class TrimmedField(BaseModel):
+    field: str
+    original_tokens: int
+    kept_tokens: int
+    dropped_chars: int = 0
+    dropped_examples: int = 0
+
+class GradingSummary(BaseModel):
+    correct: int
+    total: int
+    score: float
+    incorrect: List[str] = []  # wrong or unanswered questions, the only ones sent to the model
+    ungraded: List[str] = []  # answered questions the key doesn't cover
 
 class PromptTestResponse(BaseModel):
     provider: str
     output: str
+    cached: bool = False
+    strategy: str = "default"
+    trimmed: List[TrimmedField] = []  # request fields cut to fit the token budget
+    retrieved: List[str] = []  # sources of the chunks added to the prompt
+    report: GapReport | None = None  # the parsed JSON block, when the output has one
+    usage: Dict[str, int | float] | None = None  # token counts (and timings) reported by the provider
+    similarity: float | None = None  # set when a prior analysis of near-duplicate answers was reused
+    grading: GradingSummary | None = None  # local grading against answer_key, when it applied
 
-@router.post("/prompt-test", response_model=PromptTestResponse)
-async def prompt_test(body: PromptTestRequest):
-    # Render prompts
-    system_prompt = config.system_prompt
-    user_prompt = render_user_prompt(
+class BatchPromptTestRequest(BaseModel):
+    items: List[PromptTestRequest]
+    concurrency: int | None = None  # Defaults to BATCH_CONCURRENCY
+
+class BatchItemResult(BaseModel):
+    index: int
+    provider: str
+    output: str = ""
+    cached: bool = False
+    report: GapReport | None = None
+    usage: Dict[str, int | float] | None = None
+    similarity: float | None = None
+    grading: GradingSummary | None = None
+    error: str | None = None
+
+class BatchPromptTestResponse(BaseModel):
+    results: List[BatchItemResult]
+
+def _token_options() -> TokenEstimationOptions:
+    return TokenEstimationOptions(provider=config.provider, model=LLMService.model_for(config.provider))
+
+class RenderedPrompt(NamedTuple):
+    system_prompt: str
+    user_prompt: str
+    strategy: str
+    trimmed: List[TrimmedField]
+    retrieved: List[str]
+
+async def _render_prompts(body: PromptTestRequest, retriever: Any = None) -> RenderedPrompt:
+    """Retrieve course context, pick the strategy, pack request fields into the
+    token budget and render."""
+    options = _token_options()
+    retrieval, retrieved = "", []
+    if retriever is not None and body.use_retrieval is not False:
+        with STAGE_SECONDS.time("retrieve"):
+            found = await retriever.retrieve(body.retrieval_query or body.answers, config.rag_max_tokens, options=options)
+        retrieval, retrieved = found.text, [str(h.meta.get("source", "")) for h in found.hits]
+    inputs = StrategyInput(
         answers=body.answers,
         context=body.context,
         answer_key=body.answer_key,
         student_profile=body.student_profile,
         constraints=body.constraints,
+        examples=[PromptExample(e.input, e.output, e.explanation) for e in body.examples] or None,
+        retrieval=retrieval,
+    )
+    with STAGE_SECONDS.time("render"):
+        try:
+            strategy = get_strategy_registry().resolve(body.strategy, inputs, options)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        trimmed: List[TrimRecord] = []
+        if config.packing_enabled:
+            packed = pack_inputs(strategy, inputs, options=options)
+            inputs, trimmed = packed.inputs, packed.trimmed
+        system_prompt, user_prompt = strategy.render(inputs)
+    return RenderedPrompt(
+        system_prompt, user_prompt, strategy.name, [TrimmedField(**asdict(t)) for t in trimmed], retrieved
+    )
+
+def semantic_key(body: PromptTestRequest, prompt: RenderedPrompt) -> SemanticKey:
+    """The answers plus everything else in the request that shapes the analysis."""
+    scope = json.dumps(
+        [
+            body.quiz_id,
+            prompt.strategy,
+            body.context,
+            body.answer_key,
+            body.student_profile,
+            body.constraints,
+            [e.model_dump() for e in body.examples],
+            body.use_retrieval,
+            body.retrieval_query,
+        ],
+        ensure_ascii=False,
     )
+    return SemanticKey(body.answers, scope, body.quiz_id)
+
+# Reported as the provider of reports built by local grading alone
+GRADER = "grader"
+
+def pregrade(body: PromptTestRequest) -> Tuple[PromptTestRequest, Optional[Grading]]:
+    """Grade the answers against the answer key. Returns the request with
+    answers and key reduced to the items the model still has to analyze
+    (unchanged when the submission can't be graded) and the grading."""
+    if not body.answer_key or not (config.grading_enabled if body.grade is None else body.grade):
+        return body, None
+    with STAGE_SECONDS.time("grade"):
+        grading = grade(body.answers, body.answer_key)
+    if grading is None:
+        GRADED.inc("ungradable")
+        return body, None
+    GRADED.inc("perfect" if grading.all_correct else "partial")
+    if short_circuits(grading):
+        return body, grading
+    answers, answer_key = grading.focus()
+    return body.model_copy(update={"answers": answers, "answer_key": answer_key}), grading
+
+def short_circuits(grading: Optional[Grading]) -> bool:
+    """Whether the grading alone answers the request (no model call): every
+    item matched conclusively, since a fuzzy match can hide e.g. a negation."""
+    return grading is not None and grading.all_conclusive and config.grading_short_circuit
+
+def _grading_summary(grading: Optional[Grading]) -> GradingSummary | None:
+    return GradingSummary(**grading.summary()) if grading is not None else None
+
+def record_history(history: Any, body: PromptTestRequest, report: Optional[GapReport]) -> None:
+    """Queue the report in the gap history when it is enabled and the request names a student."""
+    if history is not None and report is not None and body.student_id:
+        history.record(body.student_id, body.class_id, body.quiz_id, report)
+
+def check_strategy(body: PromptTestRequest) -> None:
+    """Reject an unknown strategy name up front (HTTP 400)."""
+    name = (body.strategy or config.prompt_strategy).lower()
+    if name != AUTO:
+        try:
+            get_strategy_registry().get(name)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+@router.post("/prompt-test", response_model=PromptTestResponse)
+async def prompt_test(
+    body: PromptTestRequest,
+    svc: LLMService = Depends(get_llm_service),
+    retriever: Any = Depends(get_retriever),
+    history: Any = Depends(get_history),
+):
+    return await analyze_submission(body, svc, retriever, history)
+
+async def analyze_submission(
+    body: PromptTestRequest, svc: LLMService, retriever: Any = None, history: Any = None
+) -> PromptTestResponse:
+    """One full analysis; shared by /prompt-test and the job workers."""
+    body, grading = pregrade(body)
+    if short_circuits(grading):
+        output, report = grading.report()
+        record_history(history, body, report)
+        return PromptTestResponse(provider=GRADER, output=output, report=report, grading=_grading_summary(grading))
+
+    # Render prompts
+    prompt = await _render_prompts(body, retriever)
 
     # Call provider with optional temperature override
-    svc = LLMService()
-    result = await svc.generate(system_prompt, user_prompt, temperature=body.temperature)
+    result = await svc.generate(
+        prompt.system_prompt,
+        prompt.user_prompt,
+        temperature=body.temperature,
+        cache=body.cache,
+        json_mode=body.json_mode,
+        similar=semantic_key(body, prompt),
+    )
+
+    if "error" in result:
+        return PromptTestResponse(
+            provider=config.provider,
+            output=f"ERROR: {result['error']}",
+            strategy=prompt.strategy,
+            trimmed=prompt.trimmed,
+            retrieved=prompt.retrieved,
+            grading=_grading_summary(grading),
+        )
+
+    output = result.get("text", "")
+    with STAGE_SECONDS.time("parse"):
+        report = parse_report(output)
+    record_history(history, body, report)
+    return PromptTestResponse(
+        provider=result.get("provider", config.provider),
+        output=output,
+        cached=result.get("cached", False),
+        strategy=prompt.strategy,
+        trimmed=prompt.trimmed,
+        retrieved=prompt.retrieved,
+        report=report,
+        usage=result.get("usage"),
+        similarity=result.get("similarity"),
+        grading=_grading_summary(grading),
+    )
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+@router.post("/prompt-test/stream")
+async def prompt_test_stream(
+    body: PromptTestRequest,
+    request: Request,
+    svc: LLMService = Depends(get_llm_service),
+    retriever: Any = Depends(get_retriever),
+    history: Any = Depends(get_history),
+):
+    """Relay tokens as NDJSON lines while the provider generates.
 
+    Lines are {"type": "token", "text"} followed by one final
+    {"type": "report", "provider", "output", "report", "usage", "grading"}
+    (report is the validated JSON block or null) or {"type": "error", "error"}.
+    Tokens are pulled from the provider only as fast as the client reads them,
+    and the upstream request is closed as soon as the client disconnects. A
+    fully correct submission gets its templated report line alone.
+    """
+    body, grading = pregrade(body)
+    summary = _grading_summary(grading)
+    if short_circuits(grading):
+        output, report = grading.report()
+        record_history(history, body, report)
+
+        async def graded() -> AsyncIterator[bytes]:
+            yield _ndjson({
+                "type": "report",
+                "provider": GRADER,
+                "output": output,
+                "report": report.model_dump(),
+                "grading": summary.model_dump(),
+            })
+
+        return StreamingResponse(graded(), media_type="application/x-ndjson")
+    prompt = await _render_prompts(body, retriever)
+
+    async def events() -> AsyncIterator[bytes]:
+        scanner = JSONBlockScanner()
+        upstream = svc.stream(prompt.system_prompt, prompt.user_prompt, temperature=body.temperature, json_mode=body.json_mode)
+        try:
+            async for event in upstream:
+                if await request.is_disconnected():
+                    break
+                if event["type"] == "token":
+                    scanner.feed(event["text"])
+                    yield _ndjson(event)
+                elif event["type"] == "error":
+                    yield _ndjson({"type": "error", "error": event["error"]})
+                    return
+                else:
+                    with STAGE_SECONDS.time("parse"):
+                        report = scanner.report()
+                    record_history(history, body, report)
+                    yield _ndjson({
+                        "type": "report",
+                        "provider": event.get("provider", config.provider),
+                        "strategy": prompt.strategy,
+                        "trimmed": [t.model_dump() for t in prompt.trimmed],
+                        "retrieved": prompt.retrieved,
+                        "output": scanner.text,
+                        "report": report.model_dump() if report else None,
+                        "usage": event.get("usage"),
+                        "grading": summary.model_dump() if summary else None,
+                    })
+        finally:
+            await upstream.aclose()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+class BatchPlan(NamedTuple):
+    requests: List[GenerationRequest]
+    indices: List[int]  # item index of each request
+    gradings: List[Optional[Grading]]  # per item
+    resolved: Dict[int, BatchItemResult]  # items answered without a model call: by grading alone, or their error
+
+async def _batch_requests(body: BatchPromptTestRequest, retriever: Any, history: Any = None) -> BatchPlan:
+    if len(body.items) > config.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds BATCH_MAX_ITEMS ({config.batch_max_items})")
+    plan = BatchPlan([], [], [], {})
+    for index, item in enumerate(body.items):
+        item, grading = pregrade(item)
+        plan.gradings.append(grading)
+        if short_circuits(grading):
+            output, report = grading.report()
+            record_history(history, item, report)
+            plan.resolved[index] = BatchItemResult(
+                index=index, provider=GRADER, output=output, report=report, grading=_grading_summary(grading)
+            )
+            continue
+        try:
+            prompt = await _render_prompts(item, retriever)
+        except HTTPException as exc:
+            # e.g. an unknown strategy: this item fails, the rest of the batch still runs
+            plan.resolved[index] = BatchItemResult(
+                index=index, provider=config.provider, error=str(exc.detail), grading=_grading_summary(grading)
+            )
+            continue
+        plan.indices.append(index)
+        plan.requests.append(GenerationRequest(
+            prompt.system_prompt,
+            prompt.user_prompt,
+            temperature=item.temperature,
+            cache=item.cache,
+            json_mode=item.json_mode,
+            similar=semantic_key(item, prompt),
+        ))
+    return plan
+
+def _batch_item(index: int, result: Dict[str, Any], grading: Optional[Grading] = None) -> BatchItemResult:
     if "error" in result:
-        return PromptTestResponse(provider=config.provider, output=f"ERROR: {result['error']}")
+        return BatchItemResult(
+            index=index, provider=config.provider, error=str(result["error"]), grading=_grading_summary(grading)
+        )
+    output = result.get("text", "")
+    with STAGE_SECONDS.time("parse"):
+        report = parse_report(output)
+    return BatchItemResult(
+        index=index,
+        provider=result.get("provider", config.provider),
+        output=output,
+        cached=result.get("cached", False),
+        report=report,
+        usage=result.get("usage"),
+        similarity=result.get("similarity"),
+        grading=_grading_summary(grading),
+    )
+
+@router.post("/prompt-test/batch", response_model=BatchPromptTestResponse)
+async def prompt_test_batch(
+    body: BatchPromptTestRequest,
+    svc: LLMService = Depends(get_llm_service),
+    retriever: Any = Depends(get_retriever),
+    history: Any = Depends(get_history),
+):
+    """Analyze many submissions in one call; results are returned in input order
+    and a failing item carries its own error instead of failing the batch."""
+    plan = await _batch_requests(body, retriever, history)
+    results = await svc.generate_batch(plan.requests, concurrency=body.concurrency)
+    items = dict(plan.resolved)
+    for index, result in zip(plan.indices, results):
+        items[index] = _batch_item(index, result, plan.gradings[index])
+        record_history(history, body.items[index], items[index].report)
+    return BatchPromptTestResponse(results=[items[i] for i in range(len(body.items))])
+
+@router.post("/prompt-test/batch/stream")
+async def prompt_test_batch_stream(
+    body: BatchPromptTestRequest,
+    svc: LLMService = Depends(get_llm_service),
+    retriever: Any = Depends(get_retriever),
+    history: Any = Depends(get_history),
+):
+    """Same as /prompt-test/batch but emits one NDJSON line per item as it
+    completes (completion order, use `index` to correlate)."""
+    plan = await _batch_requests(body, retriever, history)
+
+    async def events() -> AsyncIterator[bytes]:
+        for item in plan.resolved.values():
+            yield _ndjson(item.model_dump())
+        results = svc.iter_batch(plan.requests, concurrency=body.concurrency)
+        try:
+            async for position, result in results:
+                index = plan.indices[position]
+                item = _batch_item(index, result, plan.gradings[index])
+                record_history(history, body.items[index], item.report)
+                yield _ndjson(item.model_dump())
+        finally:
+            await results.aclose()
 
-    return PromptTestResponse(provider=result.get("provider", config.provider), output=result.get("text", ""))
\ No newline at end of file
+    return StreamingResponse(events(), media_type="application/x-ndjson")
@@ -0,0 +1,67 @@
+from typing import Any, Dict
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+@router.get("/stats/cache")
+def cache_stats(request: Request) -> Dict[str, Any]:
+    cache = request.app.state.response_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@router.get("/stats/singleflight")
+def singleflight_stats(request: Request) -> Dict[str, Any]:
+    flights = request.app.state.single_flight
+    if flights is None:
+        return {"enabled": False}
+    return {"enabled": True, **flights.stats()}
+
+@router.get("/stats/semantic-cache")
+def semantic_cache_stats(request: Request) -> Dict[str, Any]:
+    semantic = request.app.state.semantic_cache
+    if semantic is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic.stats()}
+
+@router.get("/stats/routing")
+def routing_stats(request: Request) -> Dict[str, Any]:
+    provider_router = request.app.state.provider_router
+    if provider_router is None:
+        return {"enabled": False}
+    return {"enabled": True, **provider_router.stats()}
+
+@router.get("/stats/jobs")
+def job_stats(request: Request) -> Dict[str, Any]:
+    queue = request.app.state.job_queue
+    if queue is None:
+        return {"enabled": False}
+    return {"enabled": True, **queue.stats()}
+
+@router.get("/stats/embeddings")
+def embedding_stats(request: Request) -> Dict[str, Any]:
+    embeddings = request.app.state.embeddings
+    if embeddings is None:
+        return {"enabled": False}
+    return {"enabled": True, "backend": embeddings.backend.name, **embeddings.stats()}
+
+@router.get("/stats/ratelimit")
+def ratelimit_stats(request: Request) -> Dict[str, Any]:
+    limiters = request.app.state.rate_limiters
+    return {"providers": {provider: limiter.stats() for provider, limiter in limiters.items()}}
+
+@router.get("/stats/shared-state")
+def shared_state_stats(request: Request) -> Dict[str, Any]:
+    shared = request.app.state.shared_state
+    if shared is None:
+        return {"enabled": False}
+    # redis.Redis clients have no stats(); the local backends report their key count
+    stats = shared.stats() if hasattr(shared, "stats") else {"backend": type(shared).__name__}
+    return {"enabled": True, **stats}
+
+@router.get("/stats/history")
+def history_stats(request: Request) -> Dict[str, Any]:
+    history = request.app.state.gap_history
+    if history is None:
+        return {"enabled": False}
+    return {"enabled": True, **history.stats()}
@@ -0,0 +1,96 @@
+"""
+Multi-worker launcher: runs app.main:app under uvicorn with one worker process
+per usable CPU core.
+
+    python -m app.serve --port 8000          # workers = usable cores
+    python -m app.serve --workers 4          # or cognify-serve --workers 4
+
+Usable cores honour the CPU affinity mask and a cgroup CPU quota (containers),
+so a pod limited to 2 CPUs on a 64-core node gets 2 workers. With more than
+one worker and SHARED_STATE unset, the workers share cache, single-flight
+and rate limit state through SQLite on /dev/shm (see
+services/shared_state.py); SHARED_STATE=redis shares it between machines
+instead and SHARED_STATE=none opts out. The semantic cache stays per worker.
+
+Jobs need one queue for all workers (a status poll can land on any of them),
+so with more than one worker and JOBS_SQLITE_PATH unset the workers share a
+SQLite job store on /dev/shm, where each job is claimed by exactly one
+worker (see services/jobs.py); across machines, point JOBS_SQLITE_PATH at
+shared storage or route job polls back to the same machine. Ingestion runs
+(POST /api/ingest on any worker, or the CLI) take turns through a file lock
+in the index directory.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _cgroup_quota() -> Optional[float]:
+    """CPUs allowed by the cgroup (v2 cpu.max or v1 cfs quota), None when unlimited."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def usable_cores() -> int:
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        cores = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota is not None:
+        cores = min(cores, max(1, math.ceil(quota)))
+    return max(1, cores)
+
+
+def main(argv: Optional[list] = None) -> None:
+    import uvicorn
+
+    from .services.jobs import DEFAULT_SQLITE_PATH as DEFAULT_JOBS_PATH
+    from .services.prompts import config
+    from .services.shared_state import DEFAULT_SQLITE_PATH
+
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--workers", type=int, default=0, help="worker processes (default: usable CPU cores)")
+    p.add_argument("--log-level", default="info")
+    p.add_argument("--no-shared-state", action="store_true", help="keep per-worker state even with several workers")
+    args = p.parse_args(argv)
+
+    # uvicorn configures its own loggers only inside run(); this covers the banner
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(message)s")
+    workers = args.workers or usable_cores()
+    # Workers inherit the environment, so this reaches their config
+    if args.no_shared_state:
+        os.environ["SHARED_STATE"] = "none"
+    elif workers > 1 and not config.shared_state:
+        os.environ["SHARED_STATE"] = "sqlite"
+        os.environ.setdefault("SHARED_STATE_URL", DEFAULT_SQLITE_PATH)
+    # Unlike the state above, a per-worker job queue is wrong, not just slower
+    if workers > 1 and config.jobs_enabled and not config.jobs_sqlite_path:
+        os.environ["JOBS_SQLITE_PATH"] = DEFAULT_JOBS_PATH
+    logger.info(
+        "Starting %d worker(s), shared state: %s",
+        workers, os.environ.get("SHARED_STATE") or config.shared_state or "none",
+    )
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Pure-Python byte-level BPE tokenizer (GPT-2 style vocab.json + merges.txt).
+
+Loads a local merges file (and optionally the vocab) without network access.
+Merge ranks are held in a dict keyed by symbol pair, and the BPE result of
+each pre-tokenized piece is memoized, so repeated words are counted with a
+single dict lookup. Used by tokenization.py as the "bpe" backend.
+"""
+from __future__ import annotations
+
+from collections import Counter
+import json
+from pathlib import Path
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# GPT-2 pre-tokenization without the third-party `regex` module:
+# contractions, letter runs, digit runs, punctuation runs, whitespace.
+PRETOKENIZE_RE = re.compile(
+    r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\w\s]|_)+|\s+(?!\S)|\s+""",
+    re.UNICODE,
+)
+
+# Memoized pieces kept per tokenizer before the cache is reset
+MAX_CACHE_ENTRIES = 200_000
+
+
+def bytes_to_unicode() -> Dict[int, str]:
+    """GPT-2's reversible byte -> printable unicode char table."""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, (chr(c) for c in cs)))
+
+
+_BYTE_ENCODER = bytes_to_unicode()
+
+
+def _to_symbols(piece: str) -> str:
+    return "".join(_BYTE_ENCODER[b] for b in piece.encode("utf-8"))
+
+
+def read_merges(path: str) -> List[Tuple[str, str]]:
+    merges: List[Tuple[str, str]] = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#version"):
+                continue
+            parts = line.split(" ")
+            if len(parts) == 2:
+                merges.append((parts[0], parts[1]))
+    return merges
+
+
+def write_merges(path: str, merges: Sequence[Tuple[str, str]]) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("#version: 0.2\n")
+        for a, b in merges:
+            fh.write(f"{a} {b}\n")
+
+
+class BPETokenizer:
+    name = "bpe"
+
+    def __init__(self, merges: Sequence[Tuple[str, str]], vocab: Optional[Dict[str, int]] = None):
+        # Rank table: lower rank merges first
+        self.ranks: Dict[Tuple[str, str], int] = {pair: i for i, pair in enumerate(merges)}
+        self.vocab = vocab
+        self._cache: Dict[str, Tuple[str, ...]] = {}
+
+    @classmethod
+    def from_files(cls, merges_path: str, vocab_path: Optional[str] = None) -> "BPETokenizer":
+        vocab = None
+        if vocab_path and Path(vocab_path).exists():
+            with open(vocab_path, encoding="utf-8") as fh:
+                vocab = json.load(fh)
+        return cls(read_merges(merges_path), vocab)
+
+    def bpe(self, piece: str) -> Tuple[str, ...]:
+        """Apply merges to one pre-tokenized piece; result is memoized."""
+        cached = self._cache.get(piece)
+        if cached is not None:
+            return cached
+        word = list(_to_symbols(piece))
+        ranks = self.ranks
+        while len(word) > 1:
+            best_rank = None
+            best_i = -1
+            for i in range(len(word) - 1):
+                rank = ranks.get((word[i], word[i + 1]))
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_i = rank, i
+            if best_rank is None:
+                break
+            first, second = word[best_i], word[best_i + 1]
+            merged: List[str] = []
+            i = 0
+            # Merge every occurrence of the best pair in one sweep
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == first and word[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(word[i])
+                    i += 1
+            word = merged
+        result = tuple(word)
+        if len(self._cache) >= MAX_CACHE_ENTRIES:
+            self._cache.clear()
+        self._cache[piece] = result
+        return result
+
+    def tokenize(self, text: str) -> List[str]:
+        out: List[str] = []
+        for piece in PRETOKENIZE_RE.findall(text or ""):
+            out.extend(self.bpe(piece))
+        return out
+
+    def encode(self, text: str) -> List[int]:
+        if self.vocab is None:
+            raise ValueError("encode() needs a vocab file; count() works with merges only")
+        return [self.vocab[token] for token in self.tokenize(text)]
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        bpe = self.bpe
+        return sum(len(bpe(piece)) for piece in PRETOKENIZE_RE.findall(text))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """Count many strings, running BPE once per distinct piece in the batch."""
+        pieces_per_text = [PRETOKENIZE_RE.findall(t) if t else [] for t in texts]
+        lengths: Dict[str, int] = {}
+        for pieces in pieces_per_text:
+            for piece in pieces:
+                if piece not in lengths:
+                    lengths[piece] = len(self.bpe(piece))
+        return [sum(map(lengths.__getitem__, pieces)) for pieces in pieces_per_text]
+
+
+def learn_merges(texts: Iterable[str], num_merges: int) -> List[Tuple[str, str]]:
+    """Learn a merges table from a local corpus (for offline setups and benchmarks).
+
+    Straightforward BPE training over pre-tokenized piece frequencies; not
+    tuned for very large corpora.
+    """
+    freqs: Counter = Counter()
+    for text in texts:
+        freqs.update(PRETOKENIZE_RE.findall(text))
+    words = {tuple(_to_symbols(piece)): count for piece, count in freqs.items()}
+    merges: List[Tuple[str, str]] = []
+    for _ in range(num_merges):
+        pairs: Counter = Counter()
+        for symbols, count in words.items():
+            for pair in zip(symbols, symbols[1:]):
+                pairs[pair] += count
+        if not pairs:
+            break
+        best = max(pairs.items(), key=lambda kv: kv[1])[0]
+        merges.append(best)
+        joined = best[0] + best[1]
+        updated: Dict[Tuple[str, ...], int] = {}
+        for symbols, count in words.items():
+            if len(symbols) > 1:
+                out: List[str] = []
+                i = 0
+                while i < len(symbols):
+                    if i < len(symbols) - 1 and symbols[i] == best[0] and symbols[i + 1] == best[1]:
+                        out.append(joined)
+                        i += 2
+                    else:
+                        out.append(symbols[i])
+                        i += 1
+                symbols = tuple(out)
+            updated[symbols] = updated.get(symbols, 0) + count
+        words = updated
+    return merges
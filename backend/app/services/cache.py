@@ -0,0 +1,269 @@
+"""
+Content-addressed cache for LLM generations.
+
+Keys are a SHA-256 over (provider, model, temperature, system_prompt,
+user_prompt). Lookups go through an in-memory LRU tier first, then the
+cross-process shared state when SHARED_STATE is set (so every worker reuses
+every other worker's generations), then an optional on-disk SQLite tier
+(CACHE_SQLITE_PATH). All tiers expire entries after a TTL; the memory and
+disk tiers also evict least-recently-used entries past a size limit.
+
+Hit/miss counters, plus the upstream latency and estimated tokens that hits
+avoided, are available from ResponseCache.stats().
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .prompts import config
+from .shared_state import NAMESPACE
+
+
+def make_cache_key(
+    provider: str,
+    model: str,
+    temperature: float,
+    system_prompt: str,
+    user_prompt: str,
+    json_mode: bool = False,
+) -> str:
+    parts = [provider, model, round(float(temperature), 6), system_prompt, user_prompt]
+    if json_mode:
+        parts.append("json")  # appended only when set so existing keys stay valid
+    payload = json.dumps(
+        parts,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    shared_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    # Upstream cost avoided by hits
+    saved_seconds: float = 0.0
+    saved_tokens: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.shared_hits + self.disk_hits
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        lookups = self.hits + self.misses
+        data["hits"] = self.hits
+        data["hit_rate"] = (self.hits / lookups) if lookups else 0.0
+        return data
+
+
+class MemoryLRU:
+    """OrderedDict-backed LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, stats: CacheStats) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires <= time.time():
+            del self._data[key]
+            stats.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], stats: CacheStats, expires: Optional[float] = None) -> None:
+        if self.max_entries == 0:
+            return
+        self._data[key] = (expires if expires is not None else time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            stats.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SQLiteTier:
+    """On-disk tier; calls are blocking and meant to run in a worker thread."""
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache(last_access)")
+        self._conn.commit()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[1], json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]) -> int:
+        """Store value; returns the number of rows evicted."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+            )
+            self._writes += 1
+            evicted = 0
+            # Amortize eviction: sweep every 64 writes rather than on each insert
+            if self._writes % 64 == 0:
+                evicted = self._evict(now)
+            self._conn.commit()
+        return evicted
+
+    def _evict(self, now: float) -> int:
+        cur = self._conn.execute("DELETE FROM llm_cache WHERE expires <= ?", (now,))
+        evicted = cur.rowcount
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            cur = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            evicted += cur.rowcount
+        return evicted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedTier:
+    """Tier in the shared state (see shared_state.py); calls are blocking and meant to run in a worker thread."""
+
+    def __init__(self, state: Any, ttl: float):
+        self.state = state
+        self.ttl = float(ttl)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.state.get(NAMESPACE + "cache:" + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.state.set(NAMESPACE + "cache:" + key, json.dumps(value, ensure_ascii=False), px=int(self.ttl * 1000))
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        sqlite_path: Optional[str] = None,
+        sqlite_max_entries: int = 100_000,
+        shared: Optional[Any] = None,
+    ):
+        self.stats_data = CacheStats()
+        self.memory = MemoryLRU(max_entries, ttl)
+        self.shared = SharedTier(shared, ttl) if shared is not None else None
+        self.disk = SQLiteTier(sqlite_path, sqlite_max_entries, ttl) if sqlite_path else None
+
+    @classmethod
+    def from_config(cls, shared: Optional[Any] = None) -> "ResponseCache":
+        return cls(
+            max_entries=config.cache_max_entries,
+            ttl=config.cache_ttl_seconds,
+            sqlite_path=config.cache_sqlite_path or None,
+            sqlite_max_entries=config.cache_sqlite_max_entries,
+            shared=shared,
+        )
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key, self.stats_data)
+        if value is not None:
+            self.stats_data.memory_hits += 1
+            self._record_saving(value)
+            return value
+        if self.shared is not None:
+            value = await asyncio.to_thread(self.shared.get, key)
+            if value is not None:
+                self.memory.set(key, value, self.stats_data)
+                self.stats_data.shared_hits += 1
+                self._record_saving(value)
+                return value
+        if self.disk is not None:
+            found = await asyncio.to_thread(self.disk.get, key)
+            if found is not None:
+                expires, value = found
+                # Promote to memory, keeping the disk entry's expiry
+                self.memory.set(key, value, self.stats_data, expires=expires)
+                self.stats_data.disk_hits += 1
+                self._record_saving(value)
+                return value
+        self.stats_data.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value, self.stats_data)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, value)
+        if self.disk is not None:
+            self.stats_data.evictions += await asyncio.to_thread(self.disk.set, key, value)
+        self.stats_data.stores += 1
+
+    def record_bypass(self) -> None:
+        self.stats_data.bypassed += 1
+
+    def _record_saving(self, value: Dict[str, Any]) -> None:
+        meta = value.get("cache_meta") or {}
+        self.stats_data.saved_seconds += float(meta.get("elapsed", 0.0))
+        self.stats_data.saved_tokens += int(meta.get("tokens", 0))
+
+    def stats(self) -> Dict[str, Any]:
+        data = self.stats_data.as_dict()
+        data["memory_entries"] = len(self.memory)
+        data["shared_enabled"] = self.shared is not None
+        data["disk_enabled"] = self.disk is not None
+        return data
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,309 @@
+"""
+Embedding computation for retrieval.
+
+EmbeddingService sits in front of a backend and:
+- de-duplicates the texts of a call and sends misses in batches
+  (EMBED_BATCH_SIZE texts per backend request),
+- caches vectors on disk by content hash (EMBED_CACHE_PATH, SQLite) so
+  unchanged course material is never embedded twice,
+- stores vectors as float16 or float32 blobs (EMBED_CACHE_DTYPE) and always
+  returns float32 numpy arrays.
+Cache keys include the backend, model, dimension and, once fitted, a hash of
+the IDF weights, so unweighted and weighted vectors never mix.
+
+Backends:
+- "hashing": dependency-free hashing-trick bag of words/bigrams with
+  sublinear TF and IDF weights; deterministic, for offline use. The IDF is
+  fitted on the chunks of the first ingestion into an empty index and saved
+  next to it (idf.npy), so ingestion and query embeddings use the same
+  weights; it then stays frozen, since refitting would change every stored
+  vector. An index built without one stays unweighted.
+- "ollama": Ollama's local /api/embed endpoint (OLLAMA_EMBED_MODEL), which
+  accepts a list of inputs per request.
+
+Requires numpy (pip install ".[rag]").
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import asdict, dataclass
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from .http_clients import ProviderClients
+from .prompts import config
+from .tokenization import tokenize_words
+
+# Embed in a worker thread when a hashing call is larger than this
+_THREAD_THRESHOLD = 32
+
+# IDF weights of the hashing backend, stored in the index directory
+IDF_FILE = "idf.npy"
+
+
+class EmbeddingBackend(Protocol):
+    name: str
+    dim: int
+
+    async def embed_batch(self, texts: Sequence[str]) -> np.ndarray: ...
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbeddingBackend:
+    """Hashing-trick embedder over lowercase words and word bigrams.
+
+    Each feature is hashed to a (bucket, sign) pair; counts use sublinear TF
+    (1 + log tf) and are scaled by per-bucket IDF weights once fit_idf() has
+    seen the corpus. Not semantic, but cheap and stable across runs.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256, bigrams: bool = True):
+        self.dim = dim
+        self.bigrams = bigrams
+        self.idf: Optional[np.ndarray] = None
+        self._fingerprint: Tuple[Optional[np.ndarray], str] = (None, "")
+        self._features: Dict[str, int] = {}  # feature -> signed bucket (+/- (bucket + 1))
+
+    def _feature(self, feature: str) -> int:
+        signed = self._features.get(feature)
+        if signed is None:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            bucket = h % self.dim + 1
+            signed = bucket if (h >> 63) & 1 else -bucket
+            if len(self._features) < 500_000:
+                self._features[feature] = signed
+        return signed
+
+    def _features_of(self, text: str) -> List[int]:
+        words = tokenize_words(text.lower())
+        feats = [self._feature(w) for w in words]
+        if self.bigrams:
+            feats.extend(self._feature(f"{a} {b}") for a, b in zip(words, words[1:]))
+        return feats
+
+    def fit_idf(self, texts: Iterable[str]) -> None:
+        """Learn per-bucket inverse document frequencies from a corpus."""
+        df = np.zeros(self.dim, dtype=np.float64)
+        n = 0
+        for text in texts:
+            buckets = {abs(f) - 1 for f in self._features_of(text)}
+            if buckets:
+                df[list(buckets)] += 1
+            n += 1
+        self.idf = np.log((1 + n) / (1 + df)).astype(np.float32) + 1.0
+
+    @property
+    def fingerprint(self) -> str:
+        """Short hash of the IDF weights, "" while unweighted."""
+        if self.idf is None:
+            return ""
+        if self._fingerprint[0] is not self.idf:  # hashed once per set of weights
+            self._fingerprint = (self.idf, hashlib.sha256(self.idf.tobytes()).hexdigest()[:16])
+        return self._fingerprint[1]
+
+    def embed_sync(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            feats = np.fromiter(self._features_of(text), dtype=np.int64)
+            if not len(feats):
+                continue
+            buckets = np.abs(feats) - 1
+            counts = np.bincount(buckets, minlength=self.dim).astype(np.float32)
+            signs = np.bincount(buckets, weights=np.sign(feats), minlength=self.dim).astype(np.float32)
+            nz = counts > 0
+            # Sublinear TF, keeping the net sign of the colliding features
+            out[row, nz] = (1.0 + np.log(counts[nz])) * np.sign(signs[nz])
+        if self.idf is not None:
+            out *= self.idf
+        return normalize_rows(out)
+
+    async def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        if len(texts) > _THREAD_THRESHOLD:
+            return await asyncio.to_thread(self.embed_sync, texts)
+        return self.embed_sync(texts)
+
+
+class OllamaEmbeddingBackend:
+    name = "ollama"
+
+    def __init__(self, clients: ProviderClients, model: str, dim: int):
+        self.clients = clients
+        self.model = model
+        self.dim = dim
+
+    async def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        client = self.clients.get("ollama")
+        resp = await client.post("/api/embed", json={"model": self.model, "input": list(texts)})
+        data = resp.json()
+        if resp.status_code >= 400:
+            raise RuntimeError(f"Ollama embed failed: {data}")
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        if vectors.shape != (len(texts), self.dim):
+            raise ValueError(f"Expected {len(texts)} x {self.dim} embeddings from {self.model}, got {vectors.shape}")
+        return vectors
+
+
+class EmbeddingCache:
+    """SQLite store of vectors keyed by content hash; blocking, used via threads."""
+
+    def __init__(self, path: str, dtype: str = "float16"):
+        if dtype not in ("float16", "float32"):
+            raise ValueError("dtype must be float16 or float32")
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, dtype TEXT NOT NULL, vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        rows = [(k, int(v.shape[-1]), self.dtype.name, v.astype(self.dtype).tobytes()) for k, v in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, dtype, vec) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class EmbeddingStats:
+    requested: int = 0
+    cache_hits: int = 0
+    embedded: int = 0
+    batches: int = 0
+
+
+class EmbeddingService:
+    def __init__(self, backend: EmbeddingBackend, cache: Optional[EmbeddingCache] = None, batch_size: int = 64):
+        self.backend = backend
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.stats_data = EmbeddingStats()
+        self._idf_path: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, clients: Optional[ProviderClients] = None) -> "EmbeddingService":
+        if config.embed_backend == "ollama":
+            if clients is None:
+                raise ValueError("The ollama embedding backend needs ProviderClients")
+            backend: EmbeddingBackend = OllamaEmbeddingBackend(clients, config.ollama_embed_model, config.rag_embed_dim)
+        elif config.embed_backend == "hashing":
+            backend = HashingEmbeddingBackend(config.rag_embed_dim)
+        else:
+            raise ValueError(f"Unsupported embedding backend: {config.embed_backend}")
+        cache = EmbeddingCache(config.embed_cache_path, config.embed_cache_dtype) if config.embed_cache_path else None
+        return cls(backend, cache, config.embed_batch_size)
+
+    @property
+    def dim(self) -> int:
+        return self.backend.dim
+
+    @property
+    def _namespace(self) -> str:
+        namespace = f"{self.backend.name}:{getattr(self.backend, 'model', '')}:{self.backend.dim}"
+        fingerprint = getattr(self.backend, "fingerprint", "")
+        return f"{namespace}:idf={fingerprint}" if fingerprint else namespace
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self._namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    # -- IDF weights (hashing backend) --
+    @property
+    def weighted(self) -> bool:
+        """Whether the backend learns IDF weights, i.e. fit_idf() applies."""
+        return hasattr(self.backend, "fit_idf")
+
+    def use_idf_file(self, index_dir: str) -> None:
+        """Take the IDF weights saved in index_dir, now or once another process saves them."""
+        if self.weighted:
+            self._idf_path = os.path.join(index_dir, IDF_FILE)
+            self._load_idf()
+
+    def _load_idf(self) -> None:
+        if self._idf_path is not None and self.backend.idf is None and os.path.exists(self._idf_path):
+            idf = np.load(self._idf_path)
+            if idf.shape == (self.dim,):
+                self.backend.idf = idf
+
+    def fit_idf(self, texts: Iterable[str]) -> None:
+        """Fit the IDF weights on a corpus and save them to the use_idf_file() directory."""
+        self.backend.fit_idf(texts)
+        if self._idf_path is not None:
+            tmp = self._idf_path + ".tmp.npy"
+            np.save(tmp, self.backend.idf)
+            os.replace(tmp, self._idf_path)
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a len(texts) x dim float32 matrix of L2-normalized vectors."""
+        if self._idf_path is not None and self.backend.idf is None:
+            # One stat per call until the weights exist (e.g. the CLI fits them on a fresh index)
+            await asyncio.to_thread(self._load_idf)
+        self.stats_data.requested += len(texts)
+        keys = [self.key(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None and keys:
+            vectors = await asyncio.to_thread(self.cache.get_many, sorted(set(keys)))
+            self.stats_data.cache_hits += sum(1 for k in keys if k in vectors)
+
+        # Unique misses only, in first-seen order
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            new: Dict[str, np.ndarray] = {}
+            pending = list(missing.items())
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                embedded = normalize_rows(await self.backend.embed_batch([t for _, t in batch]))
+                self.stats_data.batches += 1
+                self.stats_data.embedded += len(batch)
+                for (key, _), vec in zip(batch, embedded):
+                    new[key] = vec
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, new)
+            vectors.update(new)
+
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, key in enumerate(keys):
+            out[row] = vectors[key]
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return asdict(self.stats_data)
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,274 @@
+"""
+Deterministic grading of answers against the answer key.
+
+Runs before the prompt is rendered. Both `answers` and `answer_key` are
+parsed into question -> answer pairs ("Q1: B", "Question 2) 4/8", "3. x = 4",
+"B for Q1, C for Q2", one-/multi-shot style "Q1: ... Student: 4/8. Key: 1")
+and every keyed question is scored:
+
+- multiple-choice letters and short answers must match exactly after
+  normalization (case, whitespace, punctuation, "(b)" / "option b" -> "b");
+  a lone letter is compared with the letter of a key like "B) Mitochondria";
+- numbers compare by value ("0.5" == "1/2" == "x = .5", "1,000" == "1000"),
+  but "3,4" or "3 4" are two numbers, never 34;
+- longer free-text answers match when their difflib ratio reaches
+  GRADING_FUZZY_THRESHOLD;
+- "|" in a key answer separates accepted alternatives.
+
+A fuzzy match is only likely correct: "X is not Y" is close to "X is Y".
+With GRADING_SHORT_CIRCUIT, a submission whose every item matched exactly,
+by value or by choice letter gets a templated report without calling the
+model. Otherwise only the incorrect, missing, fuzzily matched and unkeyed
+items, with the key entries they need, are sent to the model, so the prompt
+no longer carries the whole transcript. Text that does not parse into pairs
+(or leaves most keyed questions unanswered) is not graded and goes to the
+model unchanged.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from fractions import Fraction
+from functools import lru_cache
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from .prompts import config
+from .report_parser import GapReport
+
+# "Q1", "q 2a", "Question #3", or a line starting with "4." / "4)" / "4:"
+_MARKER_RE = re.compile(
+    r"(?<![\w/])(?:q(?:uestion)?\s*#?\s*)(\d+[a-z]?)\b|^[ \t]*(\d+[a-z]?)[.):](?=\s)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# "B for Q1, C for Q2"
+_INVERTED_RE = re.compile(r"(?<![\w])([^\s,;:]+)\s+(?:for|on)\s+q(?:uestion)?\s*#?\s*(\d+[a-z]?)\b", re.IGNORECASE)
+# A key written next to the answer ("... Student: 4/8. Key: 1.") ends the answer
+_KEY_LABEL_RE = re.compile(r"\b(?:key|correct answer|expected)\s*[:=]", re.IGNORECASE)
+# The answer follows the last of these labels when the question text is included
+_ANSWER_LABEL_RE = re.compile(r"\b(?:student(?:'s answer)?|answer|ans|response)\s*:\s*", re.IGNORECASE)
+_VARIABLE_RE = re.compile(r"^[a-z]\s*=\s*")
+_CHOICE_RE = re.compile(r"(?:option\s+|choice\s+)?\(?([a-h])\)?[.)]?")
+# A choice letter and a delimiter, then an explanation ("B) because...", "C. ...", "D: ...", "A - ...");
+# a bare "A cell wall" is a sentence, not choice A
+_CHOICE_PREFIX_RE = re.compile(r"\(?([A-Ha-h])(?:\)|[.:,]|\s+[-–])\s")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?(?:/\d+)?")
+# Thousands separators; any other comma separates values
+_THOUSANDS_RE = re.compile(r"\b\d{1,3}(?:,\d{3})+\b")
+# Spaces that can go ("photo synthesis" == "photosynthesis"), i.e. all but those between two digits
+_JOINABLE_SPACE_RE = re.compile(r"(?<!\d) | (?!\d)")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Keyed questions that must be answered for the submission to be graded locally
+MIN_COVERAGE = 0.5
+
+
+def _question_id(match: re.Match) -> str:
+    return (match.group(1) or match.group(2)).lower()
+
+
+def _answer_of(segment: str) -> str:
+    segment = _KEY_LABEL_RE.split(segment, 1)[0]
+    labels = list(_ANSWER_LABEL_RE.finditer(segment))
+    if labels:
+        segment = segment[labels[-1].end():]
+    return segment.strip().lstrip(":.)-=").strip().rstrip(",;.").strip()
+
+
+def parse_pairs(text: str) -> Dict[str, str]:
+    """Question id ("1", "2a") -> answer text, in order of appearance."""
+    markers = list(_MARKER_RE.finditer(text))
+    if not markers:
+        return {}
+    inverted = {m.group(2).lower(): m.group(1).rstrip(",;.") for m in _INVERTED_RE.finditer(text)}
+    if inverted and len(inverted) == len({_question_id(m) for m in markers}):
+        return inverted
+    pairs: Dict[str, str] = {}
+    for m, following in zip(markers, markers[1:] + [None]):
+        segment = text[m.end():following.start() if following else len(text)]
+        pairs.setdefault(_question_id(m), _answer_of(segment))
+    return pairs
+
+
+def normalize_answer(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace; "(B)" -> "b"."""
+    text = _VARIABLE_RE.sub("", unicodedata.normalize("NFKC", text).strip().lower())
+    choice = _CHOICE_RE.fullmatch(text)
+    if choice:
+        return choice.group(1)
+    return " ".join(_WORD_RE.findall(text))
+
+
+def _squash(text: str) -> str:
+    return _JOINABLE_SPACE_RE.sub("", text)
+
+
+def _number(text: str) -> Optional[Fraction]:
+    text = _VARIABLE_RE.sub("", text.strip().lower())
+    text = _squash(_THOUSANDS_RE.sub(lambda m: m.group().replace(",", ""), text))
+    if not _NUMBER_RE.fullmatch(text):
+        return None
+    try:
+        return Fraction(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _choice(text: str) -> Optional[str]:
+    m = _CHOICE_PREFIX_RE.match(text.strip() + " ")
+    return m.group(1).lower() if m else None
+
+
+def _letter(normalized: str, text: str) -> Optional[str]:
+    """The choice letter of an answer or key: a bare "b" or the "B) ..." prefix."""
+    if len(normalized) == 1 and "a" <= normalized <= "h":
+        return normalized
+    return _choice(text)
+
+
+def match_answer(answer: str, expected: str, fuzzy_threshold: float) -> Tuple[str, float]:
+    """How an answer matches the key: (exact|numeric|choice|fuzzy|wrong|missing, score)."""
+    given = normalize_answer(answer)
+    if not given:
+        return "missing", 0.0
+    best = 0.0
+    for alternative in expected.split("|"):
+        wanted = normalize_answer(alternative)
+        if not wanted:
+            continue
+        # Numbers first: normalization drops signs and separators ("-5" -> "5")
+        wanted_number, given_number = _number(alternative), _number(answer)
+        if wanted_number is not None or given_number is not None:
+            if wanted_number == given_number:
+                return ("exact" if given == wanted else "numeric"), 1.0
+            continue
+        if given == wanted or _squash(given) == _squash(wanted):
+            return "exact", 1.0
+        wanted_letter, given_letter = _letter(wanted, alternative), _letter(given, answer)
+        if wanted_letter is not None and given_letter is not None:
+            # Letter to letter: "B" against "B) Mitochondria", or "C) ..." against "B) ..."
+            if wanted_letter == given_letter:
+                return "choice", 1.0
+            continue
+        if len(wanted) == 1:
+            continue
+        if len(given) <= 2 or len(wanted) <= 2:
+            continue
+        matcher = SequenceMatcher(None, given, wanted, autojunk=False)
+        if matcher.real_quick_ratio() < fuzzy_threshold or matcher.quick_ratio() < fuzzy_threshold:
+            continue
+        best = max(best, matcher.ratio())
+    if best >= fuzzy_threshold:
+        return "fuzzy", best
+    return "wrong", best
+
+
+@dataclass
+class GradedItem:
+    question: str
+    answer: str  # as written, "" when unanswered
+    expected: str
+    match: str  # exact, numeric, choice, fuzzy, wrong or missing
+    score: float
+
+    @property
+    def correct(self) -> bool:
+        return self.match not in ("wrong", "missing")
+
+    @property
+    def conclusive(self) -> bool:
+        """Correct beyond doubt; a fuzzy match may still differ in meaning (e.g. a negation)."""
+        return self.match in ("exact", "numeric", "choice")
+
+
+@dataclass
+class Grading:
+    items: List[GradedItem]
+    ungraded: Dict[str, str] = field(default_factory=dict)  # answered questions the key doesn't cover
+
+    @property
+    def total(self) -> int:
+        return len(self.items)
+
+    @property
+    def correct(self) -> int:
+        return sum(1 for item in self.items if item.correct)
+
+    @property
+    def incorrect(self) -> List[GradedItem]:
+        return [item for item in self.items if not item.correct]
+
+    @property
+    def all_correct(self) -> bool:
+        return bool(self.items) and not self.ungraded and self.correct == self.total
+
+    @property
+    def all_conclusive(self) -> bool:
+        """Every item matched exactly, by value or by choice letter: safe to answer without the model."""
+        return self.all_correct and all(item.conclusive for item in self.items)
+
+    @property
+    def uncertain(self) -> List[GradedItem]:
+        """Fuzzily matched items, counted as correct but for the model to confirm."""
+        return [item for item in self.items if item.correct and not item.conclusive]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "correct": self.correct,
+            "total": self.total,
+            "score": self.correct / self.total if self.total else 0.0,
+            "incorrect": [f"Q{item.question}" for item in self.incorrect],
+            "ungraded": [f"Q{q}" for q in self.ungraded],
+        }
+
+    def focus(self) -> Tuple[str, str]:
+        """(answers, answer_key) reduced to the items the model still has to look at."""
+        correct = [f"Q{item.question}" for item in self.items if item.conclusive]
+        lines = [f"Graded against the answer key: {len(correct)} of {self.total} correct"
+                 + (f" ({', '.join(correct)})." if correct else ".")]
+        if self.incorrect:
+            lines.append("Incorrect answers:")
+            lines.extend(f"Q{item.question}: {item.answer or '(no answer)'}" for item in self.incorrect)
+        if self.uncertain:
+            lines.append("Answers close to the key wording (check they mean the same):")
+            lines.extend(f"Q{item.question}: {item.answer}" for item in self.uncertain)
+        if self.ungraded:
+            lines.append("Answers to questions not in the answer key:")
+            lines.extend(f"Q{q}: {answer}" for q, answer in self.ungraded.items())
+        key = "\n".join(f"Q{item.question}: {item.expected}" for item in self.incorrect + self.uncertain)
+        return "\n".join(lines), key
+
+    def report(self) -> Tuple[str, GapReport]:
+        """Templated output and report for a fully correct submission."""
+        summary = f"All answers match the answer key ({self.total}/{self.total}); no concept gaps detected."
+        report = GapReport(summary=summary)
+        output = (
+            f"{report.summary} The submission was graded against the answer key, so no model analysis was needed.\n"
+            f"```json\n{json.dumps(report.model_dump(), ensure_ascii=False)}\n```"
+        )
+        return output, report
+
+
+@lru_cache(maxsize=1024)
+def _parse_key(answer_key: str) -> Tuple[Tuple[str, str], ...]:
+    # Submissions to the same quiz share the key text
+    return tuple(parse_pairs(answer_key).items())
+
+
+def grade(answers: str, answer_key: str, fuzzy_threshold: Optional[float] = None) -> Optional[Grading]:
+    """Grade parsed answers against the parsed key, or None when the submission
+    can't be graded locally (no pairs on either side, or most keyed questions
+    unanswered, e.g. answers written as prose)."""
+    key = dict(_parse_key(answer_key))
+    if not key:
+        return None
+    given = parse_pairs(answers)
+    if sum(1 for q in key if given.get(q)) < MIN_COVERAGE * len(key):
+        return None
+    threshold = config.grading_fuzzy_threshold if fuzzy_threshold is None else fuzzy_threshold
+    items = [
+        GradedItem(q, given.get(q, ""), expected, *match_answer(given.get(q, ""), expected, threshold))
+        for q, expected in key.items()
+    ]
+    return Grading(items, {q: a for q, a in given.items() if q not in key})
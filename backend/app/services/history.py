@@ -0,0 +1,507 @@
+"""
+Student gap history: parsed weaknesses per student and quiz, with rollups
+for dashboards.
+
+Every analysis with a student_id is stored in SQLite (HISTORY_SQLITE_PATH):
+
+    reports     one row per analysis (student, class, quiz, time, summary)
+    weaknesses  (report, concept, confidence, evidence); concepts are
+                interned in `concepts` by their case/space-folded name
+
+Rollups are maintained incrementally in the same transaction as the
+inserts, so dashboard queries read O(concepts) rows instead of scanning
+reports:
+
+    class_totals      reports per class
+    class_students    reports per (class, student)
+    class_concepts    per (class, concept): times flagged, summed confidence
+    student_totals    reports per student
+    student_concepts  per (student, concept): flagged, summed and latest confidence
+    student_daily     per (student, UTC day): reports, weaknesses, summed confidence
+
+Mastery of a concept is 1 - its mean weakness confidence over all reports
+of the class (or student), a report that doesn't flag it counting as 0.
+
+GapHistoryStore.insert_many writes any number of reports in one
+transaction, aggregating the rollup deltas in Python first so each rollup
+row is upserted once per batch. GapHistory is the app's async front: record()
+only buffers, and a background flush writes whatever arrived in the last
+HISTORY_FLUSH_INTERVAL seconds as one batch (group commit). Writes take
+SQLite's write lock (BEGIN IMMEDIATE), so several workers can share a file.
+rebuild_rollups() recomputes every rollup from the raw rows.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+import datetime as dt
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .prompts import config
+from .report_parser import GapReport
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS concepts (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY, student_id TEXT NOT NULL, class_id TEXT NOT NULL, quiz_id TEXT NOT NULL,
+    created_at REAL NOT NULL, summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_student ON reports(student_id, created_at);
+CREATE INDEX IF NOT EXISTS reports_class ON reports(class_id, created_at);
+CREATE TABLE IF NOT EXISTS weaknesses (
+    report_id INTEGER NOT NULL, concept_id INTEGER NOT NULL, confidence REAL NOT NULL, evidence TEXT NOT NULL,
+    PRIMARY KEY (report_id, concept_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS class_totals (
+    class_id TEXT PRIMARY KEY, reports INTEGER NOT NULL, first_at REAL NOT NULL, last_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS class_students (
+    class_id TEXT NOT NULL, student_id TEXT NOT NULL, reports INTEGER NOT NULL,
+    PRIMARY KEY (class_id, student_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS class_concepts (
+    class_id TEXT NOT NULL, concept_id INTEGER NOT NULL, flagged INTEGER NOT NULL, confidence_sum REAL NOT NULL,
+    last_at REAL NOT NULL, PRIMARY KEY (class_id, concept_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS student_totals (
+    student_id TEXT PRIMARY KEY, reports INTEGER NOT NULL, first_at REAL NOT NULL, last_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS student_concepts (
+    student_id TEXT NOT NULL, concept_id INTEGER NOT NULL, flagged INTEGER NOT NULL, confidence_sum REAL NOT NULL,
+    last_confidence REAL NOT NULL, first_at REAL NOT NULL, last_at REAL NOT NULL,
+    PRIMARY KEY (student_id, concept_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS student_daily (
+    student_id TEXT NOT NULL, day INTEGER NOT NULL, reports INTEGER NOT NULL, weaknesses INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL, PRIMARY KEY (student_id, day)
+) WITHOUT ROWID;
+"""
+
+# Additive upserts; timestamps keep the extremes, last_confidence follows the newest report
+_UPSERTS = {
+    "class_totals": (
+        "INSERT INTO class_totals VALUES (?, ?, ?, ?) ON CONFLICT(class_id) DO UPDATE SET"
+        " reports = reports + excluded.reports, first_at = MIN(first_at, excluded.first_at),"
+        " last_at = MAX(last_at, excluded.last_at)"
+    ),
+    "class_students": (
+        "INSERT INTO class_students VALUES (?, ?, ?) ON CONFLICT(class_id, student_id) DO UPDATE SET"
+        " reports = reports + excluded.reports"
+    ),
+    "class_concepts": (
+        "INSERT INTO class_concepts VALUES (?, ?, ?, ?, ?) ON CONFLICT(class_id, concept_id) DO UPDATE SET"
+        " flagged = flagged + excluded.flagged, confidence_sum = confidence_sum + excluded.confidence_sum,"
+        " last_at = MAX(last_at, excluded.last_at)"
+    ),
+    "student_totals": (
+        "INSERT INTO student_totals VALUES (?, ?, ?, ?) ON CONFLICT(student_id) DO UPDATE SET"
+        " reports = reports + excluded.reports, first_at = MIN(first_at, excluded.first_at),"
+        " last_at = MAX(last_at, excluded.last_at)"
+    ),
+    "student_concepts": (
+        "INSERT INTO student_concepts VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(student_id, concept_id) DO UPDATE SET"
+        " flagged = flagged + excluded.flagged, confidence_sum = confidence_sum + excluded.confidence_sum,"
+        " last_confidence = CASE WHEN excluded.last_at >= last_at THEN excluded.last_confidence ELSE last_confidence END,"
+        " first_at = MIN(first_at, excluded.first_at), last_at = MAX(last_at, excluded.last_at)"
+    ),
+    "student_daily": (
+        "INSERT INTO student_daily VALUES (?, ?, ?, ?, ?) ON CONFLICT(student_id, day) DO UPDATE SET"
+        " reports = reports + excluded.reports, weaknesses = weaknesses + excluded.weaknesses,"
+        " confidence_sum = confidence_sum + excluded.confidence_sum"
+    ),
+}
+
+# The same rollups recomputed from reports and weaknesses
+_REBUILD = (
+    "INSERT INTO class_totals SELECT class_id, COUNT(*), MIN(created_at), MAX(created_at) FROM reports GROUP BY class_id",
+    "INSERT INTO class_students SELECT class_id, student_id, COUNT(*) FROM reports GROUP BY class_id, student_id",
+    "INSERT INTO class_concepts SELECT r.class_id, w.concept_id, COUNT(*), SUM(w.confidence), MAX(r.created_at)"
+    " FROM weaknesses w JOIN reports r ON r.id = w.report_id GROUP BY r.class_id, w.concept_id",
+    "INSERT INTO student_totals SELECT student_id, COUNT(*), MIN(created_at), MAX(created_at) FROM reports GROUP BY student_id",
+    # last_confidence: the newest report's, the later insert on a tie (as the upserts do)
+    "INSERT INTO student_concepts SELECT student_id, concept_id, COUNT(*), SUM(confidence),"
+    " MAX(CASE WHEN newest = 1 THEN confidence END), MIN(created_at), MAX(created_at) FROM ("
+    " SELECT r.student_id, w.concept_id, w.confidence, r.created_at, ROW_NUMBER() OVER ("
+    " PARTITION BY r.student_id, w.concept_id ORDER BY r.created_at DESC, r.id DESC) AS newest"
+    " FROM weaknesses w JOIN reports r ON r.id = w.report_id) GROUP BY student_id, concept_id",
+    "INSERT INTO student_daily SELECT r.student_id, CAST(r.created_at / 86400 AS INTEGER) AS day, COUNT(*),"
+    " COALESCE(SUM(w.n), 0), COALESCE(SUM(w.total), 0.0) FROM reports r LEFT JOIN ("
+    " SELECT report_id, COUNT(*) AS n, SUM(confidence) AS total FROM weaknesses GROUP BY report_id) w"
+    " ON w.report_id = r.id GROUP BY r.student_id, day",
+)
+
+
+def concept_key(name: str) -> str:
+    """Case- and whitespace-insensitive identity of a concept name."""
+    return " ".join(name.lower().split())
+
+
+@dataclass
+class ReportRecord:
+    student_id: str
+    class_id: str
+    quiz_id: str
+    created_at: float
+    summary: str = ""
+    # (concept, confidence, evidence)
+    weaknesses: List[Tuple[str, float, str]] = field(default_factory=list)
+
+    @classmethod
+    def from_report(
+        cls, student_id: str, class_id: str, quiz_id: str, report: GapReport, created_at: Optional[float] = None
+    ) -> "ReportRecord":
+        return cls(
+            student_id,
+            class_id,
+            quiz_id,
+            time.time() if created_at is None else created_at,
+            report.summary,
+            [(w.concept, w.confidence, w.evidence) for w in report.weaknesses if w.concept.strip()],
+        )
+
+
+class GapHistoryStore:
+    """SQLite storage and rollup queries; calls are blocking and meant to run in a worker thread."""
+
+    def __init__(self, path: str, busy_timeout: float = 30.0, cache_mb: int = 64):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Per-student index and rollup rows are written in random order; keep their pages in memory
+        # and checkpoint less often, so a page rewritten by consecutive batches reaches the file once
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_mb) * 1024}")
+        self._conn.execute("PRAGMA wal_autocheckpoint=10000")
+        self._conn.executescript(SCHEMA)
+        # Concept ids never change, so they are cached, by name as written and by key
+        self._concept_ids: Dict[str, int] = {}
+        self._key_ids: Dict[str, int] = {}
+
+    def _concepts(self, names: Iterable[str]) -> Dict[str, int]:
+        """Concept id per name, interning unseen concepts."""
+        new_names = {name for name in names if name not in self._concept_ids}
+        unseen: Dict[str, str] = {}
+        for name in new_names:
+            key = concept_key(name)
+            if key not in self._key_ids:
+                unseen.setdefault(key, name.strip())
+        if unseen:
+            self._conn.executemany("INSERT OR IGNORE INTO concepts (key, name) VALUES (?, ?)", list(unseen.items()))
+            keys = list(unseen)
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, id FROM concepts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                self._key_ids.update(rows)
+        for name in new_names:
+            self._concept_ids[name] = self._key_ids[concept_key(name)]
+        return self._concept_ids
+
+    def insert_many(self, records: Sequence[ReportRecord]) -> int:
+        """Store reports and fold them into the rollups in one transaction; returns the count."""
+        if not records:
+            return 0
+        class_totals: Dict[str, List[Any]] = {}
+        student_totals: Dict[str, List[Any]] = {}
+        class_students: Dict[Tuple[str, str], int] = defaultdict(int)
+        class_concepts: Dict[Tuple[str, int], List[Any]] = {}
+        student_concepts: Dict[Tuple[str, int], List[Any]] = {}
+        student_daily: Dict[Tuple[str, int], List[Any]] = {}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                concept_ids = self._concepts(name for r in records for name, _, _ in r.weaknesses)
+                (next_id,) = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM reports").fetchone()
+                report_rows, weakness_rows = [], []
+                for report_id, r in enumerate(records, next_id):
+                    at = r.created_at
+                    report_rows.append((report_id, r.student_id, r.class_id, r.quiz_id, at, r.summary))
+                    # One row per concept and report; a repeated concept keeps its highest confidence
+                    flagged: Dict[int, Tuple[float, str]] = {}
+                    for name, confidence, evidence in r.weaknesses:
+                        concept_id = concept_ids[name]
+                        if concept_id not in flagged or confidence > flagged[concept_id][0]:
+                            flagged[concept_id] = (float(confidence), evidence)
+                    for concept_id, (confidence, evidence) in flagged.items():
+                        weakness_rows.append((report_id, concept_id, confidence, evidence))
+                        _add(class_concepts, (r.class_id, concept_id), [1, confidence, at], last=2)
+                        _add(
+                            student_concepts, (r.student_id, concept_id), [1, confidence, confidence, at, at],
+                            first=3, last=4, latest=2,
+                        )
+                    _add(class_totals, r.class_id, [1, at, at], first=1, last=2)
+                    _add(student_totals, r.student_id, [1, at, at], first=1, last=2)
+                    class_students[(r.class_id, r.student_id)] += 1
+                    total = sum(c for c, _ in flagged.values())
+                    _add(student_daily, (r.student_id, int(at // DAY)), [1, len(flagged), total])
+                self._conn.executemany("INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?)", report_rows)
+                self._conn.executemany("INSERT INTO weaknesses VALUES (?, ?, ?, ?)", weakness_rows)
+                for table, rows in (
+                    ("class_totals", ((k, *v) for k, v in class_totals.items())),
+                    ("class_students", ((*k, v) for k, v in class_students.items())),
+                    ("class_concepts", ((*k, *v) for k, v in class_concepts.items())),
+                    ("student_totals", ((k, *v) for k, v in student_totals.items())),
+                    ("student_concepts", ((*k, *v) for k, v in student_concepts.items())),
+                    ("student_daily", ((*k, *v) for k, v in student_daily.items())),
+                ):
+                    self._conn.executemany(_UPSERTS[table], rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # Ids of concepts interned by the rolled back transaction are gone
+                self._concept_ids.clear()
+                self._key_ids.clear()
+                raise
+        return len(records)
+
+    def rebuild_rollups(self) -> None:
+        """Recompute every rollup table from reports and weaknesses."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in _UPSERTS:
+                    self._conn.execute(f"DELETE FROM {table}")
+                for statement in _REBUILD:
+                    self._conn.execute(statement)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # -----------------------------
+    # Dashboard queries
+    # -----------------------------
+    def class_overview(self, class_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """Class totals and its `limit` weakest concepts, weakest first."""
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT reports, first_at, last_at FROM class_totals WHERE class_id = ?", (class_id,)
+            ).fetchone()
+            if totals is None:
+                return None
+            (students,) = self._conn.execute(
+                "SELECT COUNT(*) FROM class_students WHERE class_id = ?", (class_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT c.name, cc.flagged, cc.confidence_sum, cc.last_at FROM class_concepts cc"
+                " JOIN concepts c ON c.id = cc.concept_id WHERE cc.class_id = ?"
+                " ORDER BY cc.confidence_sum DESC LIMIT ?",
+                (class_id, limit),
+            ).fetchall()
+        reports = totals[0]
+        return {
+            "class_id": class_id,
+            "reports": reports,
+            "students": students,
+            "first_at": totals[1],
+            "last_at": totals[2],
+            "concepts": [_concept(row, reports) for row in rows],
+        }
+
+    def student_overview(self, student_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """Student totals and their `limit` weakest concepts, with the latest confidence of each."""
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT reports, first_at, last_at FROM student_totals WHERE student_id = ?", (student_id,)
+            ).fetchone()
+            if totals is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT c.name, sc.flagged, sc.confidence_sum, sc.last_at, sc.last_confidence, sc.first_at"
+                " FROM student_concepts sc JOIN concepts c ON c.id = sc.concept_id WHERE sc.student_id = ?"
+                " ORDER BY sc.confidence_sum DESC LIMIT ?",
+                (student_id, limit),
+            ).fetchall()
+        reports = totals[0]
+        concepts = []
+        for row in rows:
+            item = _concept(row[:4], reports)
+            item["last_confidence"] = row[4]
+            item["first_seen"] = row[5]
+            concepts.append(item)
+        return {
+            "student_id": student_id,
+            "reports": reports,
+            "first_at": totals[1],
+            "last_at": totals[2],
+            "concepts": concepts,
+        }
+
+    def student_trend(self, student_id: str, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per-day reports, weaknesses and gap score (summed confidence per report), oldest first."""
+        since = int(time.time() // DAY) - days + 1 if days else 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, reports, weaknesses, confidence_sum FROM student_daily"
+                " WHERE student_id = ? AND day >= ? ORDER BY day",
+                (student_id, since),
+            ).fetchall()
+        return [
+            {
+                "date": _date(day),
+                "reports": reports,
+                "weaknesses": weaknesses,
+                "gap_score": total / reports,
+                "mean_confidence": total / weaknesses if weaknesses else 0.0,
+            }
+            for day, reports, weaknesses, total in rows
+        ]
+
+    def student_reports(self, student_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """The student's latest reports with their weaknesses, newest first."""
+        with self._lock:
+            reports = self._conn.execute(
+                "SELECT id, class_id, quiz_id, created_at, summary FROM reports"
+                " WHERE student_id = ? ORDER BY created_at DESC LIMIT ?",
+                (student_id, limit),
+            ).fetchall()
+            ids = [r[0] for r in reports]
+            weaknesses: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+            if ids:
+                rows = self._conn.execute(
+                    "SELECT w.report_id, c.name, w.confidence, w.evidence FROM weaknesses w"
+                    f" JOIN concepts c ON c.id = w.concept_id WHERE w.report_id IN ({','.join('?' * len(ids))})",
+                    ids,
+                )
+                for report_id, concept, confidence, evidence in rows:
+                    weaknesses[report_id].append({"concept": concept, "confidence": confidence, "evidence": evidence})
+        return [
+            {
+                "class_id": class_id,
+                "quiz_id": quiz_id,
+                "created_at": created_at,
+                "summary": summary,
+                "weaknesses": sorted(weaknesses[report_id], key=lambda w: -w["confidence"]),
+            }
+            for report_id, class_id, quiz_id, created_at, summary in reports
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (reports,) = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM reports").fetchone()
+            (concepts,) = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM concepts").fetchone()
+        return {"path": self.path, "reports": reports, "concepts": concepts}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _add(rollup: Dict[Any, List[Any]], key: Any, delta: List[Any], first: int = -1, last: int = -1, latest: int = -1) -> None:
+    """Merge a rollup delta into the batch: sums, except min at `first`, max at
+    `last`, and at `latest` the value that goes with the newest `last`."""
+    current = rollup.get(key)
+    if current is None:
+        rollup[key] = delta
+        return
+    for i, value in enumerate(delta):
+        if i == first:
+            current[i] = min(current[i], value)
+        elif i == last:
+            if latest >= 0 and value >= current[i]:
+                current[latest] = delta[latest]
+            current[i] = max(current[i], value)
+        elif i != latest:
+            current[i] += value
+
+
+def _concept(row: Sequence[Any], reports: int) -> Dict[str, Any]:
+    name, flagged, total, last_at = row
+    return {
+        "concept": name,
+        "mastery": 1.0 - total / reports,
+        "flag_rate": flagged / reports,
+        "flagged": flagged,
+        "mean_confidence": total / flagged,
+        "last_seen": last_at,
+    }
+
+
+def _date(day: int) -> str:
+    return dt.datetime.fromtimestamp(day * DAY, dt.timezone.utc).date().isoformat()
+
+
+@dataclass
+class HistoryStats:
+    recorded: int = 0
+    written: int = 0
+    flushes: int = 0
+    failed: int = 0  # reports lost to a failed write
+
+
+class GapHistory:
+    """Async front of a GapHistoryStore that batches writes from concurrent requests."""
+
+    def __init__(self, store: GapHistoryStore, flush_interval: float = 0.05, batch_size: int = 10000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.stats_data = HistoryStats()
+        self._buffer: List[ReportRecord] = []
+        self._flusher: Optional["asyncio.Task[None]"] = None
+
+    @classmethod
+    def from_config(cls) -> "GapHistory":
+        return cls(GapHistoryStore(config.history_sqlite_path), flush_interval=config.history_flush_interval)
+
+    def record(self, student_id: str, class_id: str, quiz_id: str, report: GapReport) -> None:
+        """Queue a report; it is written with everything else recorded within flush_interval."""
+        self._buffer.append(ReportRecord.from_report(student_id, class_id, quiz_id, report))
+        self.stats_data.recorded += 1
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                self.stats_data.written += await asyncio.to_thread(self.store.insert_many, batch)
+                self.stats_data.flushes += 1
+            except Exception:
+                self.stats_data.failed += len(batch)
+                logger.exception("Could not write %d reports to the gap history", len(batch))
+
+    async def insert_many(self, records: Sequence[ReportRecord]) -> int:
+        """Write a bulk import directly, in batches of batch_size."""
+        written = 0
+        for start in range(0, len(records), self.batch_size):
+            written += await asyncio.to_thread(self.store.insert_many, records[start:start + self.batch_size])
+        return written
+
+    async def class_overview(self, class_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.class_overview, class_id, limit)
+
+    async def student_overview(self, student_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.student_overview, student_id, limit)
+
+    async def student_trend(self, student_id: str, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.student_trend, student_id, days)
+
+    async def student_reports(self, student_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.student_reports, student_id, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        # In-memory counters only: this runs on the event loop (and /metrics scrapes), where the store may be busy writing
+        return {**asdict(self.stats_data), "buffered": len(self._buffer)}
+
+    async def close(self) -> None:
+        # Let a pending flush finish (at most flush_interval away) rather than cut a write short
+        if self._flusher is not None:
+            await self._flusher
+        await self.flush()
+        self.store.close()
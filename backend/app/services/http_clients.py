@@ -0,0 +1,115 @@
+"""
+Shared HTTP clients for LLM providers.
+
+One pooled httpx.AsyncClient per provider, opened once for the lifetime of
+the app (see the lifespan hook in app.main) instead of a new client per call.
+Connection limits, keep-alive and per-phase timeouts come from PromptConfig.
+
+HTTP/2 is enabled when requested and the optional `h2` package is installed
+(pip install "httpx[http2]"); otherwise clients fall back to HTTP/1.1.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+import importlib.util
+from typing import Dict, Optional
+
+import httpx
+
+from .prompts import config
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+
+PROVIDERS = ("gemini", "ollama")
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class ClientSettings:
+    base_url: str
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 10.0
+    http2: bool = True
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def settings_for(provider: str) -> ClientSettings:
+    """Build client settings for a provider from the current config."""
+    if provider == "gemini":
+        base_url, read_timeout = config.gemini_base_url or GEMINI_BASE_URL, config.gemini_read_timeout
+    elif provider == "ollama":
+        base_url, read_timeout = config.ollama_host, config.ollama_read_timeout
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+    return ClientSettings(
+        base_url=base_url,
+        max_connections=config.http_max_connections,
+        max_keepalive_connections=config.http_max_keepalive,
+        keepalive_expiry=config.http_keepalive_expiry,
+        connect_timeout=config.http_connect_timeout,
+        read_timeout=read_timeout,
+        write_timeout=config.http_write_timeout,
+        pool_timeout=config.http_pool_timeout,
+        http2=config.http2,
+    )
+
+
+def build_client(settings: ClientSettings) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=settings.base_url,
+        limits=settings.limits(),
+        timeout=settings.timeout(),
+        http2=settings.http2 and http2_available(),
+    )
+
+
+class ProviderClients:
+    """Holds one long-lived AsyncClient per provider.
+
+    Clients are created lazily on first use so an app configured for a single
+    provider never opens a pool for the other one.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, ClientSettings]] = None):
+        self._settings: Dict[str, ClientSettings] = dict(settings or {})
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._closed = False
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        if self._closed:
+            raise RuntimeError("ProviderClients is closed")
+        client = self._clients.get(provider)
+        if client is None:
+            settings = self._settings.get(provider) or settings_for(provider)
+            self._settings[provider] = settings
+            client = build_client(settings)
+            self._clients[provider] = client
+        return client
+
+    async def aclose(self) -> None:
+        self._closed = True
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
@@ -0,0 +1,492 @@
+"""
+Incremental ingestion of course content into the retrieval index.
+
+A run walks a content directory and only does work for what changed:
+- files whose size and mtime match the manifest are skipped without reading;
+- otherwise the file is hashed (streamed in blocks) and, if the content
+  changed, re-chunked; chunks are fingerprinted by content hash so only new
+  chunks are embedded and only vanished ones are deleted;
+- files that disappeared have all of their rows deleted.
+
+Files are read in blocks and chunked at paragraph boundaries (a chunk closes
+at the end of a paragraph once it holds min_tokens), so one edit only changes
+the chunks around it instead of shifting every chunk after it. Files are
+processed by a pool of workers (reading and chunking run in threads,
+embedding concurrently); index and manifest writes are serialized. When
+tombstoned rows exceed INGEST_COMPACT_RATIO of the index, it is compacted.
+A run holds a flock on ingest.lock in the index directory, so a CLI run next
+to a live server (or a second worker's run) waits for the other one instead
+of working from manifest row ids the other run is moving.
+
+With the hashing embedder, the first run into an empty index fits its IDF
+weights on all chunks before embedding any (see embeddings.py).
+
+The manifest is a SQLite file next to the index (manifest.sqlite3).
+
+CLI (from the backend directory):
+    python -m app.services.ingestion path/to/course --index path/to/index
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .prompts import config
+from .retrieval import Chunk, Embedder, VectorIndex, file_lock
+from .tokenization import TokenEstimationOptions, estimate_llm_tokens, fit_prefix, iter_sentence_spans
+
+MANIFEST_FILE = "manifest.sqlite3"
+RUN_LOCK_FILE = "ingest.lock"
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+READ_BLOCK = 1 << 18  # chars per read while chunking, bytes per read while hashing
+
+
+# -----------------------------
+# Streaming chunker
+# -----------------------------
+def iter_file_chunks(
+    path: str,
+    max_tokens: int = 200,
+    min_tokens: Optional[int] = None,
+    options: Optional[TokenEstimationOptions] = None,
+    block_chars: int = READ_BLOCK,
+) -> Iterator[Chunk]:
+    """Yield sentence-aligned chunks of a text file without reading it whole.
+
+    Only text still needed by the pending chunk is kept between reads. A
+    sentence longer than max_tokens is hard-cut into several chunks.
+    """
+    min_tokens = max_tokens // 4 if min_tokens is None else min_tokens
+    buffer, base = "", 0  # buffer holds the file text from absolute offset `base`
+    done = 0  # absolute offset up to which text has been chunked
+    window: List[Tuple[int, int, int]] = []  # (start, end, tokens) of sentences in the pending chunk
+    total = 0
+
+    def flush() -> Optional[Chunk]:
+        nonlocal window, total
+        if not window:
+            return None
+        start, end = window[0][0], window[-1][1]
+        chunk = Chunk(buffer[start - base:end - base], start, end, total)
+        window, total = [], 0
+        return chunk
+
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        eof = False
+        while not eof:
+            block = fh.read(block_chars)
+            eof = not block
+            buffer += block
+            end = len(buffer)
+            if not eof:
+                # Only chunk up to the last complete paragraph
+                last = None
+                for last in PARAGRAPH_RE.finditer(buffer, done - base):
+                    pass
+                if last is not None:
+                    end = last.start()
+                elif len(buffer) < 8 * block_chars:
+                    continue
+            for para_start, para_end in _paragraphs(buffer, done - base, end):
+                paragraph = buffer[para_start:para_end]
+                for s, e in iter_sentence_spans(paragraph):
+                    start = base + para_start + s
+                    tokens = estimate_llm_tokens(paragraph[s:e], options)
+                    if tokens > max_tokens:
+                        chunk = flush()
+                        if chunk:
+                            yield chunk
+                        yield from _hard_cut(paragraph[s:e], start, max_tokens, options)
+                        continue
+                    if window and total + tokens > max_tokens:
+                        chunk = flush()
+                        if chunk:
+                            yield chunk
+                    window.append((start, start + e - s, tokens))
+                    total += tokens
+                if total >= min_tokens:
+                    chunk = flush()
+                    if chunk:
+                        yield chunk
+            done = base + end
+            # Drop text that neither the pending chunk nor the next region needs
+            keep = window[0][0] if window else done
+            buffer, base = buffer[keep - base:], keep
+    chunk = flush()
+    if chunk:
+        yield chunk
+
+
+def _paragraphs(text: str, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    pos = start
+    for m in PARAGRAPH_RE.finditer(text, start, end):
+        yield pos, m.start()
+        pos = m.end()
+    yield pos, end
+
+
+def _hard_cut(sentence: str, start: int, max_tokens: int, options: Optional[TokenEstimationOptions]) -> Iterator[Chunk]:
+    pos = 0
+    while pos < len(sentence):
+        n = max(1, fit_prefix(sentence[pos:], max_tokens, options))
+        piece = sentence[pos:pos + n]
+        yield Chunk(piece, start + pos, start + pos + n, estimate_llm_tokens(piece, options))
+        pos += n
+
+
+def chunk_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> Tuple[str, int]:
+    """sha256 of a file's bytes and its size, read in blocks."""
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(READ_BLOCK), b""):
+            h.update(block)
+            size += len(block)
+    return h.hexdigest(), size
+
+
+# -----------------------------
+# Manifest
+# -----------------------------
+class IngestManifest:
+    """What was ingested: file fingerprints and the index row of each chunk."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (path TEXT NOT NULL, digest TEXT NOT NULL, row INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+            """
+        )
+        self._conn.commit()
+
+    def file(self, path: str) -> Optional[Tuple[int, int, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (path,)).fetchone()
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT path FROM files")]
+
+    def chunks(self, path: str) -> List[Tuple[str, int]]:
+        with self._lock:
+            return self._conn.execute("SELECT digest, row FROM chunks WHERE path = ?", (path,)).fetchall()
+
+    def touch(self, path: str, size: int, mtime_ns: int) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, path))
+            self._conn.commit()
+
+    def replace(self, path: str, size: int, mtime_ns: int, digest: str, chunks: Sequence[Tuple[str, int]]) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, size, mtime_ns, digest))
+            self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", [(path, d, r) for d, r in chunks])
+            self._conn.commit()
+
+    def remove(self, path: str) -> List[int]:
+        with self._lock:
+            rows = [r[0] for r in self._conn.execute("SELECT row FROM chunks WHERE path = ?", (path,))]
+            self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._conn.commit()
+            return rows
+
+    def remap(self, mapping: np.ndarray) -> None:
+        """Apply an old-row -> new-row mapping from VectorIndex.compact()."""
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid, row FROM chunks").fetchall()
+            self._conn.executemany("UPDATE chunks SET row = ? WHERE rowid = ?", [(int(mapping[r]), i) for i, r in rows])
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# -----------------------------
+# Ingestion
+# -----------------------------
+@dataclass
+class IngestStats:
+    files_seen: int = 0
+    files_unchanged: int = 0
+    files_changed: int = 0
+    files_new: int = 0
+    files_removed: int = 0
+    files_failed: int = 0
+    bytes_read: int = 0
+    chunks_added: int = 0
+    chunks_kept: int = 0
+    chunks_deleted: int = 0
+    compacted: bool = False
+    # Seconds per stage; worker stages are summed across workers
+    timings: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+
+@dataclass
+class IngestProgress:
+    files_done: int
+    files_total: int
+    chunks_added: int
+    elapsed: float
+
+
+class Ingestor:
+    def __init__(
+        self,
+        index: VectorIndex,
+        embedder: Embedder,
+        manifest: IngestManifest,
+        max_tokens: int = 200,
+        workers: int = 4,
+        extensions: Sequence[str] = (".md", ".txt", ".rst"),
+        compact_ratio: float = 0.3,
+        options: Optional[TokenEstimationOptions] = None,
+    ):
+        self.index = index
+        self.embedder = embedder
+        self.manifest = manifest
+        self.max_tokens = max_tokens
+        self.workers = max(1, workers)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.compact_ratio = compact_ratio
+        self.options = options
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    def for_index(cls, index: VectorIndex, embedder: Embedder) -> "Ingestor":
+        manifest = IngestManifest(str(index.path / MANIFEST_FILE))
+        return cls(
+            index,
+            embedder,
+            manifest,
+            max_tokens=config.rag_chunk_tokens,
+            workers=config.ingest_workers,
+            extensions=config.ingest_extensions,
+            compact_ratio=config.ingest_compact_ratio,
+        )
+
+    def scan(self, root: str) -> List[Tuple[str, str, os.stat_result]]:
+        """(relative path, absolute path, stat) of every content file under root, sorted."""
+        found = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for name in sorted(filenames):
+                if name.startswith(".") or not name.lower().endswith(self.extensions):
+                    continue
+                full = os.path.join(dirpath, name)
+                found.append((Path(os.path.relpath(full, root)).as_posix(), full, os.stat(full)))
+        return found
+
+    async def run(self, root: str, progress: Optional[Callable[[IngestProgress], None]] = None) -> IngestStats:
+        with ExitStack() as stack:
+            # Blocks while another process ingests into the same index
+            await asyncio.to_thread(stack.enter_context, file_lock(self.index.path / RUN_LOCK_FILE, exclusive=True))
+            return await self._run(root, progress)
+
+    async def _run(self, root: str, progress: Optional[Callable[[IngestProgress], None]]) -> IngestStats:
+        stats = IngestStats()
+        started = time.perf_counter()
+        t = time.perf_counter()
+        files = await asyncio.to_thread(self.scan, root)
+        stats.add_time("scan", time.perf_counter() - t)
+        stats.files_seen = len(files)
+        if files and getattr(self.embedder, "weighted", False):
+            t = time.perf_counter()
+            await asyncio.to_thread(self._fit_idf, files)
+            stats.add_time("idf", time.perf_counter() - t)
+
+        pending = iter(files)
+        done = 0
+
+        async def worker() -> None:
+            nonlocal done
+            for rel, full, st in pending:
+                try:
+                    await self._ingest_file(rel, full, st, stats)
+                except Exception as e:  # one bad file must not stop the run
+                    stats.files_failed += 1
+                    stats.errors[rel] = f"{type(e).__name__}: {e}"
+                done += 1
+                if progress:
+                    progress(IngestProgress(done, len(files), stats.chunks_added, time.perf_counter() - started))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(files)) or 1)))
+
+        t = time.perf_counter()
+        seen = {rel for rel, _, _ in files}
+        for rel in await asyncio.to_thread(self.manifest.paths):
+            if rel not in seen:
+                rows = await asyncio.to_thread(self.manifest.remove, rel)
+                stats.chunks_deleted += await asyncio.to_thread(self.index.delete, rows)
+                stats.files_removed += 1
+        deleted = self.index.deleted_count  # refreshes count from the header first
+        if self.index.count and deleted > self.compact_ratio * self.index.count:
+            mapping = await asyncio.to_thread(self.index.compact)
+            await asyncio.to_thread(self.manifest.remap, mapping)
+            stats.compacted = True
+        stats.add_time("cleanup", time.perf_counter() - t)
+        stats.add_time("total", time.perf_counter() - started)
+        return stats
+
+    def _fit_idf(self, files: Sequence[Tuple[str, str, os.stat_result]]) -> None:
+        """Fit IDF weights on the first ingestion into an empty index; later runs keep them."""
+        self.embedder.use_idf_file(str(self.index.path))
+        if self.embedder.backend.idf is not None or self.index.live_count or self.index.count:
+            return  # already fitted, or rows embedded without weights that must stay comparable
+        self.embedder.fit_idf(
+            chunk.text for _, full, _ in files for chunk in iter_file_chunks(full, self.max_tokens, options=self.options)
+        )
+
+    async def _ingest_file(self, rel: str, full: str, st: os.stat_result, stats: IngestStats) -> None:
+        known = await asyncio.to_thread(self.manifest.file, rel)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            stats.files_unchanged += 1
+            return
+
+        t = time.perf_counter()
+        digest, size = await asyncio.to_thread(file_digest, full)
+        stats.add_time("hash", time.perf_counter() - t)
+        stats.bytes_read += size
+        if known and known[2] == digest:
+            # Touched but not modified
+            await asyncio.to_thread(self.manifest.touch, rel, st.st_size, st.st_mtime_ns)
+            stats.files_unchanged += 1
+            return
+
+        t = time.perf_counter()
+        chunks = await asyncio.to_thread(
+            lambda: list(iter_file_chunks(full, self.max_tokens, options=self.options))
+        )
+        stats.add_time("chunk", time.perf_counter() - t)
+
+        old: Dict[str, List[int]] = {}
+        for chunk_hash, row in await asyncio.to_thread(self.manifest.chunks, rel):
+            old.setdefault(chunk_hash, []).append(row)
+        digests = [chunk_digest(c.text) for c in chunks]
+        kept: List[Tuple[str, int]] = []
+        new: List[int] = []  # positions in chunks that need embedding
+        for i, d in enumerate(digests):
+            rows = old.get(d)
+            if rows:
+                kept.append((d, rows.pop()))
+            else:
+                new.append(i)
+        stale = [row for rows in old.values() for row in rows]
+
+        vectors = None
+        if new:
+            t = time.perf_counter()
+            vectors = await self.embedder.embed([chunks[i].text for i in new])
+            stats.add_time("embed", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        async with self._write_lock:
+            added: List[int] = []
+            if vectors is not None:
+                metas = [
+                    {
+                        "source": rel,
+                        "start": chunks[i].start,
+                        "end": chunks[i].end,
+                        "tokens": chunks[i].tokens,
+                        "chunk": digests[i],
+                        "text": chunks[i].text,
+                    }
+                    for i in new
+                ]
+                added = await asyncio.to_thread(self.index.add, vectors, metas)
+            if stale:
+                await asyncio.to_thread(self.index.delete, stale)
+            entries = kept + [(digests[i], row) for i, row in zip(new, added)]
+            await asyncio.to_thread(self.manifest.replace, rel, st.st_size, st.st_mtime_ns, digest, entries)
+        stats.add_time("write", time.perf_counter() - t)
+
+        stats.chunks_added += len(added)
+        stats.chunks_kept += len(kept)
+        stats.chunks_deleted += len(stale)
+        if known:
+            stats.files_changed += 1
+        else:
+            stats.files_new += 1
+
+    def close(self) -> None:
+        self.manifest.close()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+async def _main(args: argparse.Namespace) -> IngestStats:
+    from .embeddings import EmbeddingService
+    from .http_clients import ProviderClients
+
+    clients = ProviderClients()
+    embeddings = EmbeddingService.from_config(clients)
+    index = VectorIndex.open_or_create(args.index, embeddings.dim)
+    ingestor = Ingestor.for_index(index, embeddings)
+    if args.workers:
+        ingestor.workers = args.workers
+    if args.max_tokens:
+        ingestor.max_tokens = args.max_tokens
+
+    def report(p: IngestProgress) -> None:
+        if not args.quiet:
+            print(f"\r{p.files_done}/{p.files_total} files, {p.chunks_added} chunks added, {p.elapsed:.1f}s",
+                  end="", file=sys.stderr, flush=True)
+
+    try:
+        stats = await ingestor.run(args.content_dir, report)
+    finally:
+        ingestor.close()
+        embeddings.close()
+        await clients.aclose()
+    if not args.quiet:
+        print(file=sys.stderr)
+    return stats
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Incrementally ingest a content directory into the retrieval index.")
+    p.add_argument("content_dir", nargs="?", default=config.rag_content_dir)
+    p.add_argument("--index", default=config.rag_index_dir, help="index directory (default RAG_INDEX_DIR)")
+    p.add_argument("--workers", type=int, default=0, help="files processed concurrently (default INGEST_WORKERS)")
+    p.add_argument("--max-tokens", type=int, default=0, help="chunk size (default RAG_CHUNK_TOKENS)")
+    p.add_argument("--quiet", action="store_true")
+    args = p.parse_args()
+    if not args.content_dir or not args.index:
+        p.error("a content directory and --index (or RAG_CONTENT_DIR / RAG_INDEX_DIR) are required")
+    print(json.dumps(asdict(asyncio.run(_main(args))), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Asynchronous jobs for long-running analyses.
+
+Submitting a job returns its id at once; a bounded pool of JOBS_WORKERS
+workers drains the queue and clients poll (or long-poll) for the result, so
+no HTTP connection is held open for the length of an LLM call.
+
+Jobs go into priority lanes: "interactive" jobs are always dequeued before
+"batch" jobs, and at most JOBS_BATCH_MAX_RUNNING batch jobs run at once so a
+worker is left free for interactive work while bulk runs drain.
+
+Jobs live in memory by default. With JOBS_SQLITE_PATH they are also written
+to SQLite, which several worker processes can share (app.serve points them
+all at one file when it starts more than one). Every unfinished row carries
+an owner and a lease of JOBS_LEASE seconds that the owning process renews:
+- a worker runs a job only after claiming its row (UPDATE ... WHERE status =
+  'queued'), so a job is never run by two workers at once;
+- status lookups, long-polls and cancels read and write the shared rows, so
+  they work on whichever worker the request lands;
+- rows whose lease ran out (their process died) are adopted and re-queued by
+  another worker, or by the next process on start. A clean shutdown releases
+  its leases so that happens at once.
+Finished jobs are kept for JOBS_RESULT_TTL seconds.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import uuid
+
+from .prompts import config
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)  # dequeue order
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Where app.serve puts the queue shared by its workers when JOBS_SQLITE_PATH is unset
+DEFAULT_SQLITE_PATH = str(
+    Path("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()) / "cognify-jobs.db"
+)
+# How often a worker polls the store while long-polling a job another worker runs
+POLL_INTERVAL = 0.25
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    lane: str
+    payload: Dict[str, Any]
+    status: str = QUEUED
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+
+# -----------------------------
+# Stores
+# -----------------------------
+class MemoryJobStore:
+    shared = False  # only this process sees the jobs
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def claim(self, job_id: str) -> bool:
+        """Take a queued job for running; False if it was cancelled or taken meanwhile."""
+        job = self._jobs.get(job_id)
+        return job is not None and job.status == QUEUED
+
+    def cancel_queued(self, job_id: str) -> bool:
+        """Mark a job cancelled if nobody has started it yet."""
+        return self.claim(job_id)
+
+    def renew(self) -> None:
+        pass
+
+    def adopt(self) -> List[Job]:
+        """Unfinished jobs without a live owner, now owned by this process."""
+        return []  # nothing survives a restart
+
+    def release(self) -> None:
+        pass
+
+    def prune(self, finished_before: float) -> int:
+        old = [j.id for j in self._jobs.values() if j.finished and (j.finished_at or 0) < finished_before]
+        for job_id in old:
+            del self._jobs[job_id]
+        return len(old)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """Write-through durable store, shareable between processes.
+
+    Finished jobs are served from memory when this process has them; anything
+    else is read from the table, where another process may have changed it.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, lease: float = 60.0, owner: Optional[str] = None):
+        super().__init__()
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                lane TEXT NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                owner TEXT,
+                lease_until REAL
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:  # a store written before leases
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def save(self, job: Job) -> None:
+        super().save(job)
+        with self._lock:
+            # A new row is leased to this process; updates leave owner and lease alone
+            self._conn.execute(
+                "INSERT INTO jobs (id, lane, status, data, created_at, finished_at, owner, lease_until)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET"
+                " status = excluded.status, data = excluded.data, finished_at = excluded.finished_at",
+                (job.id, job.lane, job.status, json.dumps(asdict(job)), job.created_at, job.finished_at,
+                 self.owner, time.time() + self.lease),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = super().get(job_id)
+        if job is not None and job.finished:
+            return job
+        with self._lock:
+            row = self._conn.execute("SELECT data, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return job
+        stored = Job(**json.loads(row[0]))
+        stored.status = row[1]  # claims and cancels only update the column
+        return stored
+
+    def claim(self, job_id: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ? WHERE id = ? AND status = ?",
+                (RUNNING, self.owner, time.time() + self.lease, job_id, QUEUED),
+            )
+            self._conn.commit()
+        return cur.rowcount == 1
+
+    def cancel_queued(self, job_id: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (CANCELLED, job_id, QUEUED)
+            )
+            self._conn.commit()
+        return cur.rowcount == 1
+
+    def renew(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + self.lease, self.owner, QUEUED, RUNNING),
+            )
+            self._conn.commit()
+
+    def adopt(self) -> List[Job]:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't adopt the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM jobs WHERE status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)"
+                    " ORDER BY created_at",
+                    (QUEUED, RUNNING, now),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_until = ? WHERE id = ?",
+                    [(QUEUED, self.owner, now + self.lease, job_id) for job_id, _ in rows],
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        jobs = [Job(**json.loads(data)) for _, data in rows]
+        for job in jobs:
+            job.status, job.started_at = QUEUED, None
+            super().save(job)
+        return jobs
+
+    def release(self) -> None:
+        """Expire this process's leases so another worker adopts its jobs right away."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = 0 WHERE owner = ? AND status IN (?, ?)", (self.owner, QUEUED, RUNNING)
+            )
+            self._conn.commit()
+
+    def prune(self, finished_before: float) -> int:
+        super().prune(finished_before)
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before,)
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# -----------------------------
+# Queue
+# -----------------------------
+@dataclass
+class LaneStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))  # seconds queued, recent jobs
+    runs: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))  # seconds running, recent jobs
+
+
+def _pct(values: Deque[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int = 4,
+        batch_max_running: Optional[int] = None,
+        max_queued: int = 10_000,
+        result_ttl: float = 3600.0,
+        store: Optional[MemoryJobStore] = None,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        # Leave one worker for interactive jobs unless told otherwise
+        self.batch_max_running = batch_max_running or max(1, self.workers - 1)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.store = store or MemoryJobStore()
+        self._lanes: Dict[str, Deque[str]] = {lane: deque() for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._stats: Dict[str, LaneStats] = {lane: LaneStats() for lane in LANES}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._cond = asyncio.Condition()
+        self._tasks: List[asyncio.Task] = []
+        self._finished_since_prune = 0
+
+    @classmethod
+    def from_config(cls, handler: JobHandler) -> "JobQueue":
+        store = (
+            SQLiteJobStore(config.jobs_sqlite_path, lease=config.jobs_lease)
+            if config.jobs_sqlite_path else MemoryJobStore()
+        )
+        return cls(
+            handler,
+            workers=config.jobs_workers,
+            batch_max_running=config.jobs_batch_max_running or None,
+            max_queued=config.jobs_max_queued,
+            result_ttl=config.jobs_result_ttl,
+            store=store,
+        )
+
+    # -- lifecycle --
+    async def start(self) -> None:
+        await self._adopt()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.store.shared:
+            self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        """Stop the workers; in a durable store their running jobs are left for
+        another worker (or the next start) to re-run."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.store.release)
+        await asyncio.to_thread(self.store.close)
+
+    # -- client API --
+    def depth(self) -> int:
+        return sum(len(q) for q in self._lanes.values())
+
+    async def submit(self, payload: Dict[str, Any], lane: str = INTERACTIVE) -> Job:
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane {lane!r}; use one of {', '.join(LANES)}")
+        if self.depth() >= self.max_queued:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} queued)")
+        job = Job(uuid.uuid4().hex, lane, payload)
+        await asyncio.to_thread(self.store.save, job)
+        async with self._cond:
+            self._enqueue(job)
+            self._stats[lane].submitted += 1
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Return the job once it finishes or after timeout seconds, whichever is first."""
+        job = self.get(job_id)
+        deadline = time.monotonic() + timeout
+        while job is not None and not job.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = self._events.get(job_id)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            elif self.store.shared:
+                # Queued or running on another worker: poll the shared store
+                await asyncio.sleep(min(remaining, POLL_INTERVAL))
+            else:
+                break
+            job = self.get(job_id)
+        return job
+
+    def position(self, job: Job) -> Optional[int]:
+        """0-based place of a queued job in the dequeue order, else None."""
+        if job.status != QUEUED:
+            return None
+        ahead = 0
+        for lane in LANES:
+            if lane == job.lane:
+                try:
+                    return ahead + self._lanes[lane].index(job.id)
+                except ValueError:
+                    return None
+            ahead += len(self._lanes[lane])
+        return None
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job; running and finished jobs are returned unchanged."""
+        async with self._cond:
+            job = self.get(job_id)
+            if job is None or job.status != QUEUED:
+                return job
+            if not await asyncio.to_thread(self.store.cancel_queued, job_id):
+                return self.get(job_id)  # a worker claimed it meanwhile
+            if job_id in self._lanes[job.lane]:  # else it is queued on another worker, which skips it
+                self._lanes[job.lane].remove(job_id)
+            await self._finish(job, CANCELLED)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane in LANES:
+            s = self._stats[lane]
+            lanes[lane] = {
+                "queued": len(self._lanes[lane]),
+                "running": self._running[lane],
+                "submitted": s.submitted,
+                "completed": s.completed,
+                "failed": s.failed,
+                "cancelled": s.cancelled,
+                "wait_p50_ms": round(_pct(s.waits, 50) * 1000, 1),
+                "wait_p95_ms": round(_pct(s.waits, 95) * 1000, 1),
+                "run_p50_ms": round(_pct(s.runs, 50) * 1000, 1),
+                "run_p95_ms": round(_pct(s.runs, 95) * 1000, 1),
+            }
+        return {
+            "workers": self.workers,
+            "batch_max_running": self.batch_max_running,
+            "depth": self.depth(),
+            "running": sum(self._running.values()),
+            "lanes": lanes,
+        }
+
+    # -- internals --
+    def _enqueue(self, job: Job) -> None:
+        self._lanes[job.lane].append(job.id)
+        self._events[job.id] = asyncio.Event()
+
+    async def _adopt(self) -> None:
+        adopted = await asyncio.to_thread(self.store.adopt)
+        if not adopted:
+            return
+        async with self._cond:
+            for job in adopted:
+                if job.id not in self._events:
+                    self._enqueue(job)
+            self._cond.notify_all()
+        logger.info("Re-queued %d unfinished jobs", len(adopted))
+
+    async def _heartbeat(self) -> None:
+        """Keep this process's leases alive and pick up jobs of workers that died."""
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            try:
+                await asyncio.to_thread(self.store.renew)
+                await self._adopt()
+            except Exception:  # retried on the next beat
+                logger.exception("Job lease renewal failed")
+
+    def _next(self) -> Optional[str]:
+        if self._lanes[INTERACTIVE]:
+            return self._lanes[INTERACTIVE].popleft()
+        if self._lanes[BATCH] and self._running[BATCH] < self.batch_max_running:
+            return self._lanes[BATCH].popleft()
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._cond:
+                job_id = self._next()
+                while job_id is None:
+                    await self._cond.wait()
+                    job_id = self._next()
+                job = self.get(job_id)
+                if job is None:  # pruned meanwhile
+                    continue
+                self._running[job.lane] += 1
+            if not await asyncio.to_thread(self.store.claim, job_id):
+                # Cancelled or taken by another worker since it was queued here
+                async with self._cond:
+                    self._running[job.lane] -= 1
+                    self._cond.notify_all()
+                event = self._events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+                continue
+            job.status, job.started_at = RUNNING, time.time()
+            self._stats[job.lane].waits.append(job.started_at - job.created_at)
+            await asyncio.to_thread(self.store.save, job)
+            try:
+                result = await self.handler(job.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # the job fails, the worker keeps going
+                job.error = f"{type(e).__name__}: {e}"
+                await self._finish(job, FAILED)
+            else:
+                job.result = result
+                await self._finish(job, DONE)
+            finally:
+                async with self._cond:
+                    self._running[job.lane] -= 1
+                    self._cond.notify_all()
+
+    async def _finish(self, job: Job, status: str) -> None:
+        job.status, job.finished_at = status, time.time()
+        stats = self._stats[job.lane]
+        if status == DONE:
+            stats.completed += 1
+        elif status == FAILED:
+            stats.failed += 1
+        else:
+            stats.cancelled += 1
+        if job.started_at is not None:
+            stats.runs.append(job.finished_at - job.started_at)
+        await asyncio.to_thread(self.store.save, job)
+        event = self._events.pop(job.id, None)
+        if event is not None:
+            event.set()
+        self._finished_since_prune += 1
+        if self._finished_since_prune >= 64:
+            self._finished_since_prune = 0
+            await asyncio.to_thread(self.store.prune, time.time() - self.result_ttl)
@@ -1,28 +1,420 @@
 import os
 import json
-from typing import Dict, Any, Optional
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Tuple
 import httpx
 from .prompts import config
+from .cache import ResponseCache, make_cache_key
+from .http_clients import ProviderClients, build_client, settings_for
+from .metrics import FIRST_TOKEN_SECONDS, REGISTRY, STAGE_SECONDS, UPSTREAM_SECONDS, record_usage
+from .ratelimit import RETRY_STATUSES, ProviderLimiter, retry_after_seconds, retry_delay
+from .routing import ProviderRouter
+from .semantic_cache import SemanticCache, SemanticHit, SemanticKey
+from .singleflight import SingleFlight
+from .tokenization import TokenEstimationOptions, estimate_llm_tokens, estimate_prompt_tokens
+
+# Transport failures that happen before the provider did any work, so retrying is cheap
+TRANSIENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
 
 # Simple abstraction over providers
 
+@dataclass
+class GenerationRequest:
+    system_prompt: str
+    user_prompt: str
+    temperature: Optional[float] = None
+    cache: Optional[bool] = None
+    json_mode: Optional[bool] = None
+    similar: Optional[SemanticKey] = None
+
+
 class LLMService:
-    async def generate(self, system_prompt: str, user_prompt: str, temperature: Optional[float] = None) -> Dict[str, Any]:
+    def __init__(
+        self,
+        clients: Optional[ProviderClients] = None,
+        cache: Optional[ResponseCache] = None,
+        flights: Optional[SingleFlight] = None,
+        limiters: Optional[Dict[str, ProviderLimiter]] = None,
+        router: Optional[ProviderRouter] = None,
+        semantic: Optional[SemanticCache] = None,
+    ):
+        # Shared app-lifetime clients; without them each call opens its own client
+        self.clients = clients
+        self.cache = cache
+        self.flights = flights
+        self.limiters = limiters or {}
+        # With a router, calls go to its backends instead of config.provider
+        self.router = router
+        self.semantic = semantic
+
+    @staticmethod
+    def model_for(provider: str) -> str:
+        return config.gemini_model if provider == "gemini" else config.ollama_model
+
+    @asynccontextmanager
+    async def _client(self, provider: str) -> AsyncIterator[httpx.AsyncClient]:
+        if self.clients is not None:
+            yield self.clients.get(provider)
+            return
+        async with build_client(settings_for(provider)) as client:
+            yield client
+
+    async def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: Optional[float] = None,
+        cache: Optional[bool] = None,
+        json_mode: Optional[bool] = None,
+        similar: Optional[SemanticKey] = None,
+    ) -> Dict[str, Any]:
+        """Generate a completion, serving repeats from the response cache and
+        collapsing concurrent identical requests into one upstream call.
+
+        Sampled generations (temperature > 0) bypass both unless cache=True or
+        CACHE_NONDETERMINISTIC is set; cache=False always bypasses. json_mode
+        (default JSON_MODE) asks the provider for JSON-only output.
+
+        With a semantic cache and `similar` (the request's answers and scope),
+        a prior result for near-duplicate answers is returned with its
+        "similarity"; enabling the semantic cache is itself the opt-in, so
+        this applies at any temperature unless cache=False.
+        """
         provider = config.provider
         temp = config.temperature if temperature is None else float(temperature)
+        as_json = config.json_mode if json_mode is None else bool(json_mode)
+        if self.semantic is None or similar is None or cache is False:
+            return await self._generate_exact(provider, system_prompt, user_prompt, temp, cache, as_json)
+
+        # Same answers under another prompt, model or temperature are a different analysis
+        similar = SemanticKey(similar.answers, self._cache_key(provider, temp, system_prompt, similar.scope, as_json), similar.quiz)
+        with STAGE_SECONDS.time("semantic_lookup"):
+            hit = await self.semantic.get(similar)
+        if hit is not None:
+            if self.semantic.should_audit():
+                self.semantic.spawn(self._audit(similar, hit, provider, system_prompt, user_prompt, temp, as_json))
+            return {**hit.value, "cached": True, "similarity": round(hit.similarity, 4)}
+        result = await self._generate_exact(provider, system_prompt, user_prompt, temp, cache, as_json)
+        if "error" not in result and not result.get("coalesced"):
+            await self.semantic.set(similar, result)
+        return result
+
+    async def _audit(
+        self, similar: SemanticKey, hit: SemanticHit, provider: str, system_prompt: str, user_prompt: str, temp: float, json_mode: bool
+    ) -> None:
+        """Regenerate a semantic hit and compare it with the reused analysis."""
+        fresh = await self._dispatch(provider, system_prompt, user_prompt, temp, json_mode)
+        if "error" not in fresh:
+            self.semantic.record_audit(similar, hit, fresh)
+
+    def _cache_key(self, provider: str, temp: float, system_prompt: str, user_prompt: str, json_mode: bool) -> str:
+        if self.router is not None:
+            return make_cache_key("router", self.router.key, temp, system_prompt, user_prompt, json_mode)
+        return make_cache_key(provider, self.model_for(provider), temp, system_prompt, user_prompt, json_mode)
+
+    async def _generate_exact(
+        self, provider: str, system_prompt: str, user_prompt: str, temp: float, cache: Optional[bool], as_json: bool
+    ) -> Dict[str, Any]:
+        reusable = cache is not False and (temp <= 0 or bool(cache) or config.cache_nondeterministic)
+        if not reusable or (self.cache is None and self.flights is None):
+            if self.cache is not None:
+                self.cache.record_bypass()
+            return await self._dispatch(provider, system_prompt, user_prompt, temp, as_json)
+
+        key = self._cache_key(provider, temp, system_prompt, user_prompt, as_json)
+        if self.cache is not None:
+            with STAGE_SECONDS.time("cache_lookup"):
+                hit = await self.cache.get(key)
+            if hit is not None:
+                result = {k: v for k, v in hit.items() if k != "cache_meta"}
+                result["cached"] = True
+                return result
+
+        if self.flights is None:
+            return await self._generate_and_store(key, provider, system_prompt, user_prompt, temp, as_json)
+        result, shared = await self.flights.do(
+            key, lambda: self._generate_and_store(key, provider, system_prompt, user_prompt, temp, as_json)
+        )
+        return {**result, "coalesced": True} if shared else result
+
+    async def _generate_and_store(
+        self, key: str, provider: str, system_prompt: str, user_prompt: str, temp: float, json_mode: bool = False
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await self._dispatch(provider, system_prompt, user_prompt, temp, json_mode)
+        if self.cache is not None and "error" not in result:
+            provider = result.get("provider", provider)
+            opts = TokenEstimationOptions(provider=provider, model=self.model_for(provider))
+            tokens = sum(estimate_llm_tokens(t, opts) for t in (system_prompt, user_prompt, result.get("text", "")))
+            meta = {"elapsed": time.perf_counter() - started, "tokens": tokens}
+            await self.cache.set(key, {**result, "cache_meta": meta})
+        return result
+
+    async def generate_batch(self, requests: Sequence[GenerationRequest], concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Run many generations with bounded concurrency; results keep input order.
+
+        A failing item yields {"error": ...} in its slot instead of failing the batch.
+        """
+        results: List[Dict[str, Any]] = [{} for _ in requests]
+        async for index, result in self.iter_batch(requests, concurrency):
+            results[index] = result
+        return results
+
+    async def iter_batch(self, requests: Sequence[GenerationRequest], concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (index, result) pairs as generations complete.
+
+        At most `concurrency` generations are in flight (BATCH_CONCURRENCY by
+        default); closing the iterator early cancels the remaining work.
+        """
+        total = len(requests)
+        if total == 0:
+            return
+        limit = max(1, min(concurrency or config.batch_concurrency, total))
+        pending = iter(enumerate(requests))
+        done: "asyncio.Queue[Tuple[int, Dict[str, Any]]]" = asyncio.Queue()
+
+        async def worker() -> None:
+            # Workers share one iterator, so only `limit` items are ever in flight
+            for index, req in pending:
+                try:
+                    result = await self.generate(
+                        req.system_prompt,
+                        req.user_prompt,
+                        temperature=req.temperature,
+                        cache=req.cache,
+                        json_mode=req.json_mode,
+                        similar=req.similar,
+                    )
+                except Exception as exc:
+                    result = {"error": f"{type(exc).__name__}: {exc}"}
+                await done.put((index, result))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+        try:
+            for _ in range(total):
+                yield await done.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _dispatch(
+        self, provider: str, system_prompt: str, user_prompt: str, temp: float, json_mode: bool = False
+    ) -> Dict[str, Any]:
+        if self.router is None:
+            return await self._call_provider(provider, system_prompt, user_prompt, temp, json_mode)
+        # Failing over beats waiting out a backoff when there is another backend
+        retries = 0 if len(self.router.backends) > 1 else None
+        return await self.router.call(
+            lambda b: self._call_provider(b.provider, system_prompt, user_prompt, temp, json_mode, b.model, retries)
+        )
+
+    def _estimate_tokens(self, provider: str, model: Optional[str], system_prompt: str, user_prompt: str) -> int:
+        """Estimated prompt tokens, when a token limit or metrics need them (else 0)."""
+        limiter = self.limiters.get(provider)
+        if not REGISTRY.enabled and (limiter is None or limiter.tokens is None):
+            return 0
+        opts = TokenEstimationOptions(provider=provider, model=model or self.model_for(provider))
+        return estimate_prompt_tokens(system_prompt, user_prompt, opts)["total"]
+
+    def _record_usage(self, provider: str, model: Optional[str], estimate: int, text: str, usage: Optional[Dict[str, float]]) -> None:
+        if REGISTRY.enabled and usage:
+            opts = TokenEstimationOptions(provider=provider, model=model or self.model_for(provider))
+            record_usage(provider, usage, estimate, estimate_llm_tokens(text, opts))
+
+    def _retry_wait(self, attempt: int, retries: Optional[int], retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to sleep before the next attempt, or None to give up."""
+        if attempt >= (config.retry_max_attempts if retries is None else retries):
+            return None
+        if retry_after is not None and retry_after > config.retry_max_delay:
+            return None  # the quota resets later than we are willing to hold the request
+        return retry_delay(attempt, config.retry_base_delay, config.retry_max_delay, retry_after)
+
+    @staticmethod
+    def _settle(limiter: Optional[ProviderLimiter], estimate: int, outcome: Dict[str, Any]) -> None:
+        """Feed a result (or final stream event) to the provider's limiter."""
+        if limiter is None:
+            return
+        if outcome.get("status") == 429:
+            limiter.on_throttle(outcome.get("retry_after"))
+        elif "error" not in outcome:
+            limiter.on_success()
+            used = (outcome.get("usage") or {}).get("total_tokens")
+            if used is not None:
+                limiter.charge(used - estimate)
+
+    async def _call_provider(
+        self,
+        provider: str,
+        system_prompt: str,
+        user_prompt: str,
+        temp: float,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+        retries: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Call a provider paced by its limiter, retrying 429/5xx responses and
+        connection failures up to `retries` times (RETRY_MAX_ATTEMPTS by default)."""
+        if provider == "gemini":
+            call = self._call_gemini
+        elif provider == "ollama":
+            call = self._call_ollama
+        else:
+            raise ValueError(f"Unsupported provider: {provider}")
+        limiter = self.limiters.get(provider)
+        estimate = self._estimate_tokens(provider, model, system_prompt, user_prompt)
+        attempt = 0
+        while True:
+            if limiter is not None:
+                STAGE_SECONDS.observe(await limiter.acquire(estimate), "limiter_wait")
+            started = time.perf_counter()
+            try:
+                result = await call(system_prompt, user_prompt, temp, json_mode, model)
+            except Exception as exc:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider, "error")
+                wait = self._retry_wait(attempt, retries) if isinstance(exc, TRANSIENT_ERRORS) else None
+                if wait is None:
+                    raise
+            else:
+                status = result.get("status") if "error" in result else None
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider, "error" if "error" in result else "ok")
+                if "error" not in result:
+                    self._record_usage(provider, model, estimate, result.get("text", ""), result.get("usage"))
+                self._settle(limiter, estimate, result)
+                wait = self._retry_wait(attempt, retries, result.get("retry_after")) if status in RETRY_STATUSES else None
+                if wait is None:
+                    return result
+            if limiter is not None:
+                limiter.retries += 1
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: Optional[float] = None,
+        json_mode: Optional[bool] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield events as the provider generates: {"type": "token", "text"},
+        then a final {"type": "done", "provider", "raw"} or {"type": "error", "error"}.
+
+        Upstream bytes are only read when the consumer asks for the next event,
+        and closing the generator early closes the upstream response. With a
+        router, a backend that fails before its first token is replaced by the
+        next one (streams are not hedged).
+        """
+        temp = config.temperature if temperature is None else float(temperature)
+        as_json = config.json_mode if json_mode is None else bool(json_mode)
+        if self.router is None:
+            events = self._stream_provider(config.provider, system_prompt, user_prompt, temp, as_json)
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+            return
+
+        failed: Dict[str, Any] = {"type": "error", "error": "No provider backend available"}
+        for backend in self.router.ranked():
+            events = self._stream_provider(backend.provider, system_prompt, user_prompt, temp, as_json, backend.model)
+            started = False
+            try:
+                async for event in events:
+                    if not started:
+                        if event["type"] == "error":
+                            self.router.record(backend, ok=False)
+                            failed = {**event, "backend": backend.name}
+                            break
+                        started = True
+                        self.router.record(backend, ok=True)
+                    yield event
+            except httpx.HTTPError as exc:
+                if started:
+                    raise
+                self.router.record(backend, ok=False)
+                failed = {"type": "error", "error": f"{type(exc).__name__}: {exc}", "backend": backend.name}
+            finally:
+                await events.aclose()
+            if started:
+                return
+        yield failed
+
+    async def _stream_provider(
+        self,
+        provider: str,
+        system_prompt: str,
+        user_prompt: str,
+        temp: float,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream from one provider, retrying like _call_provider as long as
+        nothing has been yielded yet."""
         if provider == "gemini":
-            return await self._call_gemini(system_prompt, user_prompt, temp)
+            open_stream = self._stream_gemini
         elif provider == "ollama":
-            return await self._call_ollama(system_prompt, user_prompt, temp)
+            open_stream = self._stream_ollama
         else:
             raise ValueError(f"Unsupported provider: {provider}")
+        limiter = self.limiters.get(provider)
+        estimate = self._estimate_tokens(provider, model, system_prompt, user_prompt)
+        # A router fails over to its next backend instead of retrying
+        retries = 0 if self.router is not None and len(self.router.backends) > 1 else None
+        attempt = 0
+        while True:
+            if limiter is not None:
+                STAGE_SECONDS.observe(await limiter.acquire(estimate), "limiter_wait")
+            events = open_stream(system_prompt, user_prompt, temp, json_mode, model)
+            started = time.perf_counter()
+            parts: List[str] = []
+            yielded = False
+            wait: Optional[float] = None
+            try:
+                async for event in events:
+                    if event["type"] == "token":
+                        if not parts:
+                            FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, provider)
+                        parts.append(event["text"])
+                    elif event["type"] == "error":
+                        status = event.get("status")
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider, "error")
+                        self._settle(limiter, estimate, event)
+                        if not yielded and status in RETRY_STATUSES:
+                            wait = self._retry_wait(attempt, retries, event.get("retry_after"))
+                            if wait is not None:
+                                break
+                    elif event["type"] == "done":
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider, "ok")
+                        self._record_usage(provider, model, estimate, "".join(parts), event.get("usage"))
+                        self._settle(limiter, estimate, event)
+                    yielded = True
+                    yield event
+            except TRANSIENT_ERRORS:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider, "error")
+                wait = None if yielded else self._retry_wait(attempt, retries)
+                if wait is None:
+                    raise
+            finally:
+                await events.aclose()
+            if wait is None:
+                return
+            if limiter is not None:
+                limiter.retries += 1
+            await asyncio.sleep(wait)
+            attempt += 1
 
-    async def _call_gemini(self, system_prompt: str, user_prompt: str, temperature: float) -> Dict[str, Any]:
+    async def _call_gemini(
+        self, system_prompt: str, user_prompt: str, temperature: float, json_mode: bool = False, model: Optional[str] = None
+    ) -> Dict[str, Any]:
         api_key = config.gemini_api_key
         if not api_key:
             return {"error": "Missing GEMINI_API_KEY"}
         # Gemini Generative Language API (v1beta) - text responses
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        url = f"/v1beta/models/{model or config.gemini_model}:generateContent"
         headers = {"Content-Type": "application/json"}
         payload = {
             "contents": [
@@ -32,23 +424,28 @@ class LLMService:
                 "temperature": float(temperature)
             }
         }
+        if json_mode:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
         params = {"key": api_key}
-        async with httpx.AsyncClient(timeout=60) as client:
+        async with self._client("gemini") as client:
             resp = await client.post(url, headers=headers, params=params, json=payload)
-            data = resp.json()
             if resp.status_code >= 400:
-                return {"error": data}
+                error = _decode_error(resp.content)
+                return {"error": error, "status": resp.status_code, "retry_after": retry_after_seconds(resp.headers)}
+            data = resp.json()
             # Extract text
             try:
                 text = data["candidates"][0]["content"]["parts"][0]["text"]
             except Exception:
                 text = json.dumps(data)
-            return {"provider": "gemini", "text": text, "raw": data}
+            return {"provider": "gemini", "text": text, "raw": data, "usage": _usage(data)}
 
-    async def _call_ollama(self, system_prompt: str, user_prompt: str, temperature: float) -> Dict[str, Any]:
-        url = f"{config.ollama_host}/api/generate"
+    async def _call_ollama(
+        self, system_prompt: str, user_prompt: str, temperature: float, json_mode: bool = False, model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        url = "/api/generate"
         payload = {
-            "model": config.ollama_model,
+            "model": model or config.ollama_model,
             "prompt": user_prompt,
             "system": system_prompt,
             "stream": False,
@@ -56,10 +453,128 @@ class LLMService:
                 "temperature": float(temperature)
             }
         }
-        async with httpx.AsyncClient(timeout=120) as client:
+        if json_mode:
+            payload["format"] = "json"
+        async with self._client("ollama") as client:
             resp = await client.post(url, json=payload)
-            data = resp.json()
             if resp.status_code >= 400:
-                return {"error": data}
+                error = _decode_error(resp.content)
+                return {"error": error, "status": resp.status_code, "retry_after": retry_after_seconds(resp.headers)}
+            data = resp.json()
             text = data.get("response", "")
-            return {"provider": "ollama", "text": text, "raw": data}
\ No newline at end of file
+            return {"provider": "ollama", "text": text, "raw": data, "usage": _usage(data)}
+
+    async def _stream_gemini(
+        self, system_prompt: str, user_prompt: str, temperature: float, json_mode: bool = False, model: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        api_key = config.gemini_api_key
+        if not api_key:
+            yield {"type": "error", "error": "Missing GEMINI_API_KEY"}
+            return
+        # Server-sent events variant of generateContent
+        url = f"/v1beta/models/{model or config.gemini_model}:streamGenerateContent"
+        payload = {
+            "contents": [
+                {"role": "user", "parts": [{"text": f"System: {system_prompt}\nUser: {user_prompt}"}]}
+            ],
+            "generationConfig": {
+                "temperature": float(temperature)
+            }
+        }
+        if json_mode:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
+        params = {"key": api_key, "alt": "sse"}
+        last: Dict[str, Any] = {}
+        async with self._client("gemini") as client:
+            async with client.stream("POST", url, params=params, json=payload) as resp:
+                if resp.status_code >= 400:
+                    yield {
+                        "type": "error",
+                        "error": _decode_error(await resp.aread()),
+                        "status": resp.status_code,
+                        "retry_after": retry_after_seconds(resp.headers),
+                    }
+                    return
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = json.loads(line[5:])
+                    last = data
+                    try:
+                        parts = data["candidates"][0]["content"]["parts"]
+                    except (KeyError, IndexError, TypeError):
+                        continue
+                    text = "".join(part.get("text", "") for part in parts)
+                    if text:
+                        yield {"type": "token", "text": text}
+        yield {"type": "done", "provider": "gemini", "raw": last, "usage": _usage(last)}
+
+    async def _stream_ollama(
+        self, system_prompt: str, user_prompt: str, temperature: float, json_mode: bool = False, model: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        url = "/api/generate"
+        payload = {
+            "model": model or config.ollama_model,
+            "prompt": user_prompt,
+            "system": system_prompt,
+            "stream": True,
+            "options": {
+                "temperature": float(temperature)
+            }
+        }
+        if json_mode:
+            payload["format"] = "json"
+        async with self._client("ollama") as client:
+            async with client.stream("POST", url, json=payload) as resp:
+                if resp.status_code >= 400:
+                    yield {
+                        "type": "error",
+                        "error": _decode_error(await resp.aread()),
+                        "status": resp.status_code,
+                        "retry_after": retry_after_seconds(resp.headers),
+                    }
+                    return
+                # Newline-delimited JSON objects, the last one has done=true
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        yield {"type": "error", "error": data["error"]}
+                        return
+                    text = data.get("response", "")
+                    if text:
+                        yield {"type": "token", "text": text}
+                    if data.get("done"):
+                        yield {"type": "done", "provider": "ollama", "raw": data, "usage": _usage(data)}
+                        return
+
+
+def _decode_error(body: bytes) -> Any:
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _usage(raw: Any) -> Optional[Dict[str, float]]:
+    """Token counts (and Ollama's timings, in seconds) reported in a provider response."""
+    if not isinstance(raw, dict):
+        return None
+    meta = raw.get("usageMetadata")
+    if isinstance(meta, dict):
+        usage = {
+            "prompt_tokens": meta.get("promptTokenCount"),
+            "output_tokens": meta.get("candidatesTokenCount"),
+            "total_tokens": meta.get("totalTokenCount"),
+        }
+    elif "eval_count" in raw or "prompt_eval_count" in raw:
+        prompt, output = raw.get("prompt_eval_count", 0), raw.get("eval_count", 0)
+        usage = {"prompt_tokens": prompt, "output_tokens": output, "total_tokens": prompt + output}
+        for phase in ("load", "prompt_eval", "eval", "total"):
+            ns = raw.get(f"{phase}_duration")
+            if ns is not None:
+                usage[f"{phase}_seconds"] = ns / 1e9
+    else:
+        return None
+    return {k: v for k, v in usage.items() if v is not None}
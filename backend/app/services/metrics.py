@@ -0,0 +1,294 @@
+"""
+Process-local metrics exposed in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label values and are updated
+in place on the request path: no locks (everything runs on the event loop),
+no background threads and no dependency on prometheus_client. A histogram
+observation is one bisect and three additions, so instrumenting every stage
+of a request costs a few microseconds (see benchmarks/bench_metrics.py).
+
+Components that already keep their own stats (response cache, semantic
+cache, single-flight, job queue, rate limiters, router, embeddings, gap
+history) are not duplicated here; a collector reads their stats() at scrape
+time and exports the numeric fields as gauges.
+
+The series recorded by the app are defined at the bottom of this module:
+- cognify_stage_seconds{stage}: grade, retrieve, render, cache_lookup, semantic_lookup, limiter_wait, parse
+- cognify_graded_total{outcome}: submissions graded locally: perfect (no model call), partial or ungradable
+- cognify_upstream_seconds{provider,outcome}: each provider call (retries count separately)
+- cognify_first_token_seconds{provider}: time to first streamed token
+- cognify_tokens_total{provider,kind,source}: estimated vs provider-reported prompt/output tokens
+- cognify_token_estimate_ratio{provider,kind}: estimated / actual tokens, to calibrate tokenization.py
+- cognify_provider_reported_seconds{provider,phase}: Ollama's own load/prompt_eval/eval/total durations
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .prompts import config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATIO_BUCKETS = (0.5, 0.67, 0.8, 0.9, 0.95, 1.0, 1.05, 1.1, 1.25, 1.5, 2.0)
+
+LabelValues = Tuple[str, ...]
+# (name suffix, labels, value) of each sample in a metric family
+Samples = List[Tuple[str, Dict[str, str], float]]
+# name, type, help, samples; what collectors return
+Family = Tuple[str, str, str, Samples]
+Collector = Callable[[], Iterable[Family]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if self._registry.enabled:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> Samples:
+        return [("", dict(zip(self.labelnames, labels)), value) for labels, value in self.values.items()]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # per bucket, last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: "Histogram", labels: LabelValues):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not self._registry.enabled:
+            return
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def time(self, *labels: str) -> _Timer:
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, labels)
+
+    def samples(self) -> Samples:
+        out: Samples = []
+        for labels, series in self.series.items():
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series.counts):
+                cumulative += count
+                out.append(("_bucket", {**base, "le": _format_value(bound)}, cumulative))
+            out.append(("_sum", base, series.sum))
+            out.append(("_count", base, series.count))
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: Optional[bool] = True):
+        # None = METRICS_ENABLED, read on first use so importing doesn't load the config
+        self._enabled = enabled
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Collector] = []
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = config.metrics_enabled
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._enabled = value
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(self, name, help, labelnames)
+        return self._metrics[name]
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(self, name, help, labelnames, buckets)
+        return self._metrics[name]
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Collector) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def reset(self) -> None:
+        """Drop all recorded values (metric definitions and collectors stay)."""
+        for metric in self._metrics.values():
+            if isinstance(metric, Histogram):
+                metric.series.clear()
+            else:
+                metric.values.clear()
+
+    def families(self) -> List[Family]:
+        families: List[Family] = [(m.name, m.kind, m.help, m.samples()) for m in self._metrics.values()]
+        for collector in self._collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, kind, help, samples in self.families():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Stats of app components as gauges
+# -----------------------------
+# Nested stats dicts whose keys become a label
+_NESTED_LABELS = {"lanes": "lane", "providers": "provider", "backends": "backend"}
+
+
+def _flatten(component: str, data: Dict[str, Any], labels: Dict[str, str], out: Dict[str, Family]) -> None:
+    for key, value in data.items():
+        if key in _NESTED_LABELS and isinstance(value, dict):
+            for item, nested in value.items():
+                if isinstance(nested, dict):
+                    _flatten(component, nested, {**labels, _NESTED_LABELS[key]: str(item)}, out)
+        elif isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value)):
+            name = f"cognify_{component}_{key}"
+            if name not in out:
+                out[name] = (name, "gauge", f"{key} from the {component} stats", [])
+            out[name][3].append(("", labels, float(value)))
+
+
+def state_collector(state: Any) -> Collector:
+    """Collector exporting the stats() of the components in app.state."""
+    def collect() -> List[Family]:
+        sources = {
+            "cache": getattr(state, "response_cache", None),
+            "singleflight": getattr(state, "single_flight", None),
+            "semantic_cache": getattr(state, "semantic_cache", None),
+            "jobs": getattr(state, "job_queue", None),
+            "routing": getattr(state, "provider_router", None),
+            "embeddings": getattr(state, "embeddings", None),
+            "history": getattr(state, "gap_history", None),
+        }
+        out: Dict[str, Family] = {}
+        for component, source in sources.items():
+            if source is not None:
+                _flatten(component, source.stats(), {}, out)
+        limiters = getattr(state, "rate_limiters", None) or {}
+        _flatten("ratelimit", {"providers": {p: l.stats() for p, l in limiters.items()}}, {}, out)
+        return list(out.values())
+    return collect
+
+
+# -----------------------------
+# App metrics
+# -----------------------------
+REGISTRY = MetricsRegistry(enabled=None)
+
+STAGE_SECONDS = REGISTRY.histogram("cognify_stage_seconds", "Time spent in each request pipeline stage", ("stage",))
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "cognify_upstream_seconds", "Latency of provider calls", ("provider", "outcome")
+)
+FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "cognify_first_token_seconds", "Time from opening a provider stream to its first token", ("provider",)
+)
+GRADED = REGISTRY.counter(
+    "cognify_graded_total", "Submissions graded against the answer key before calling the model", ("outcome",)
+)
+TOKENS = REGISTRY.counter(
+    "cognify_tokens_total", "Prompt and output tokens, estimated locally or reported by the provider", ("provider", "kind", "source")
+)
+TOKEN_ESTIMATE_RATIO = REGISTRY.histogram(
+    "cognify_token_estimate_ratio", "Estimated over provider-reported tokens per call", ("provider", "kind"), RATIO_BUCKETS
+)
+PROVIDER_REPORTED_SECONDS = REGISTRY.histogram(
+    "cognify_provider_reported_seconds", "Durations reported by the provider itself", ("provider", "phase")
+)
+
+
+def record_usage(provider: str, usage: Optional[Dict[str, float]], estimated_prompt: int, estimated_output: int) -> None:
+    """Record estimated vs actual tokens and provider-side timings of one call."""
+    if not REGISTRY.enabled or not usage:
+        return
+    for kind, estimated in (("prompt", estimated_prompt), ("output", estimated_output)):
+        actual = usage.get(f"{kind}_tokens")
+        if actual is None:
+            continue
+        TOKENS.inc(provider, kind, "estimated", amount=estimated)
+        TOKENS.inc(provider, kind, "actual", amount=actual)
+        if actual > 0:
+            TOKEN_ESTIMATE_RATIO.observe(estimated / actual, provider, kind)
+    for phase in ("load", "prompt_eval", "eval", "total"):
+        seconds = usage.get(f"{phase}_seconds")
+        if seconds is not None:
+            PROVIDER_REPORTED_SECONDS.observe(seconds, provider, phase)
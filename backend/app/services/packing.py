@@ -0,0 +1,107 @@
+"""
+Token-budget-aware prompt packing.
+
+Runs after a strategy is chosen and before its template is rendered. The
+fixed cost of the strategy (system prompt + template literals) is subtracted
+from the prompt budget (CONTEXT_WINDOW - OUTPUT_TOKEN_RESERVE), then the rest
+is handed out to the request fields in PACKING_PRIORITY order in one pass:
+each field gets what it needs while budget remains, and any field that
+doesn't fit is cut once with sentence-aware truncation (examples are dropped
+whole, last first). Every cut is reported so it can be audited.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .prompts import config
+from .strategies import PromptStrategy, StrategyInput, format_examples, prompt_token_budget
+from .tokenization import TokenEstimationOptions, estimate_llm_tokens, split_text_to_fit_tokens
+
+TEXT_FIELDS = ("answers", "answer_key", "context", "retrieval", "student_profile", "constraints")
+EXAMPLES = "examples"
+
+
+@dataclass
+class TrimRecord:
+    field: str
+    original_tokens: int
+    kept_tokens: int
+    dropped_chars: int = 0
+    dropped_examples: int = 0
+
+
+@dataclass
+class PackResult:
+    inputs: StrategyInput
+    budget: int
+    estimated_tokens: int
+    trimmed: List[TrimRecord]
+
+
+def pack_inputs(
+    strategy: PromptStrategy,
+    inputs: StrategyInput,
+    budget: Optional[int] = None,
+    priority: Optional[Sequence[str]] = None,
+    options: Optional[TokenEstimationOptions] = None,
+) -> PackResult:
+    budget = prompt_token_budget() if budget is None else budget
+    order = [f for f in (priority or config.packing_priority) if f in TEXT_FIELDS or f == EXAMPLES]
+    # Fields missing from the priority list go last, in their default order
+    order += [f for f in TEXT_FIELDS + (EXAMPLES,) if f not in order]
+
+    examples = strategy.examples_for(inputs)
+    empty = replace(inputs, examples=[], **{f: "" for f in TEXT_FIELDS})
+    overhead = strategy.estimate_tokens(empty, options)
+
+    needs: Dict[str, int] = {f: estimate_llm_tokens(getattr(inputs, f), options) for f in TEXT_FIELDS}
+    example_costs = [estimate_llm_tokens(format_examples([ex]), options) for ex in examples]
+    total_need = overhead + sum(needs.values()) + sum(example_costs)
+    if total_need <= budget:
+        return PackResult(replace(inputs, examples=examples), budget, total_need, [])
+
+    available = remaining = max(0, budget - overhead)
+    values: Dict[str, str] = {}
+    kept_examples = examples
+    trimmed: List[TrimRecord] = []
+    for name in order:
+        if name == EXAMPLES:
+            kept_examples, used = _fit_examples(examples, example_costs, remaining)
+            remaining -= used
+            if len(kept_examples) < len(examples):
+                trimmed.append(TrimRecord(
+                    field=EXAMPLES,
+                    original_tokens=sum(example_costs),
+                    kept_tokens=used,
+                    dropped_examples=len(examples) - len(kept_examples),
+                ))
+            continue
+        text, need = getattr(inputs, name), needs[name]
+        if need <= remaining:
+            values[name] = text
+            remaining -= need
+            continue
+        cut = split_text_to_fit_tokens(text, remaining, options)
+        kept = estimate_llm_tokens(cut, options)
+        values[name] = cut
+        remaining -= min(kept, remaining)
+        trimmed.append(TrimRecord(
+            field=name,
+            original_tokens=need,
+            kept_tokens=kept,
+            dropped_chars=len(text) - len(cut),
+        ))
+
+    packed = replace(inputs, examples=kept_examples, **values)
+    return PackResult(packed, budget, overhead + available - remaining, trimmed)
+
+
+def _fit_examples(examples: List, costs: List[int], remaining: int) -> Tuple[List, int]:
+    """Keep examples in order while they fit; later examples are dropped first."""
+    used = 0
+    for i, cost in enumerate(costs):
+        if used + cost > remaining:
+            return examples[:i], used
+        used += cost
+    return examples, used
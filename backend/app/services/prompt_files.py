@@ -0,0 +1,39 @@
+"""
+Read prompt constants from the prompt modules at the backend root
+(e.g. "Zero-Shot Prompt.py") without executing them.
+
+The files only assign string literals, so they are parsed with `ast` and
+each top-level NAME = "<literal>" assignment is evaluated with
+ast.literal_eval. Anything that is not a literal string is ignored.
+"""
+from __future__ import annotations
+
+import ast
+from pathlib import Path
+from typing import Dict
+
+# Directory holding the prompt modules (backend/)
+PROMPT_DIR = Path(__file__).resolve().parents[2]
+
+
+def read_prompt_constants(path: Path) -> Dict[str, str]:
+    """Return the top-level string constants assigned in a prompt module."""
+    tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+    constants: Dict[str, str] = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        try:
+            literal = ast.literal_eval(value)
+        except (ValueError, TypeError, SyntaxError):
+            continue
+        if not isinstance(literal, str):
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name):
+                constants[target.id] = literal
+    return constants
@@ -1,55 +1,364 @@
-from dataclasses import dataclass
+"""
+Application config and the default system/user prompts.
+
+Nothing is read at import time. The first access to `config` (or a call to
+get_config) loads .env, builds a PromptConfig from the environment (each
+field from the upper-cased variable of the same name) and overlays
+SYSTEM_PROMPT / USER_PROMPT_TEMPLATE from "System and User Prompt.py", which
+is parsed rather than executed (see prompt_files.py).
+
+reload_prompts re-reads the prompt modules when they changed (the app polls
+their mtimes every PROMPT_RELOAD_INTERVAL seconds and forces a reload on
+SIGHUP). The new config is built and its template compiled before being
+swapped in as a whole, so requests in flight are never blocked and a prompt
+edit with a bad template keeps the previous config. Environment variables
+are read once; settings baked into clients, caches and limiters at startup
+still need a restart.
+"""
+import asyncio
+from dataclasses import dataclass, fields, replace
+import logging
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-import importlib.util
+import signal
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from .prompt_files import PROMPT_DIR, read_prompt_constants
+from .templates import CompiledTemplate, compile_template
+from .tokenization import TokenEstimationOptions
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Load prompts from Python code file at backend root
-PROMPT_PY_FILE = Path(__file__).resolve().parents[2] / "System and User Prompt.py"
 
-def _load_prompts_from_python_file():
-    system = None
-    user = None
-    try:
-        if PROMPT_PY_FILE.exists():
-            spec = importlib.util.spec_from_file_location("cognify_prompts", str(PROMPT_PY_FILE))
-            if spec and spec.loader:
-                mod = importlib.util.module_from_spec(spec)  # type: ignore
-                spec.loader.exec_module(mod)  # type: ignore
-                system = getattr(mod, "SYSTEM_PROMPT", None)
-                user = getattr(mod, "USER_PROMPT_TEMPLATE", None)
-    except Exception:
-        pass
-    return system, user
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Prompt module at the backend root whose constants override the env prompts
+PROMPT_PY_FILE = PROMPT_DIR / "System and User Prompt.py"
+
+# Fields compared case-insensitively
+_LOWERCASE = ("provider", "prompt_strategy", "embed_backend", "shared_state", "tokenizer_backend")
+
 
 @dataclass
 class PromptConfig:
-    provider: str = os.getenv("PROVIDER", "gemini").lower()
+    provider: str = "gemini"
     # Default temperature for sampling (can be overridden per-request)
-    temperature: float = float(os.getenv("TEMPERATURE", "0.7"))
-    system_prompt: str = os.getenv(
-        "SYSTEM_PROMPT",
-        "You are an AI tutor that analyzes student answers, detects concept gaps, and suggests targeted learning resources.",
+    temperature: float = 0.7
+    system_prompt: str = (
+        "You are an AI tutor that analyzes student answers, detects concept gaps, and suggests targeted learning resources."
     )
-    user_prompt_template: str = os.getenv(
-        "USER_PROMPT_TEMPLATE",
-        "Given the following quiz answers and context, identify weak concepts and recommend resources. Answers: {answers}. Context: {context}.",
+    user_prompt_template: str = (
+        "Given the following quiz answers and context, identify weak concepts and recommend resources. Answers: {answers}. Context: {context}."
     )
+    # Seconds between checks of the prompt files for edits (0 = reload on SIGHUP only)
+    prompt_reload_interval: float = 2.0
     # Gemini
-    gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
+    gemini_api_key: str = ""
+    gemini_model: str = "gemini-1.5-flash"
+    gemini_base_url: str = ""  # empty = Google's endpoint; e.g. benchmarks/mock_provider.py
+    # Route across several "provider[:model]" backends with hedging and failover (see routing.py); empty = PROVIDER only
+    provider_routes: str = ""
+    hedge_enabled: bool = True
+    hedge_delay: float = 2.0  # seconds, until enough latency samples exist
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_max_ratio: float = 0.2
+    breaker_failures: int = 5
+    breaker_cooldown: float = 30.0
     # Ollama
-    ollama_host: str = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
-    ollama_model: str = os.getenv("OLLAMA_MODEL", "llama3")
+    ollama_host: str = "http://127.0.0.1:11434"
+    ollama_model: str = "llama3"
+    # Shared HTTP client pool (one per provider, see http_clients.py)
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_connect_timeout: float = 5.0
+    http_write_timeout: float = 10.0
+    http_pool_timeout: float = 10.0
+    http2: bool = True
+    gemini_read_timeout: float = 60.0
+    ollama_read_timeout: float = 120.0
+    # Response cache (see cache.py); temperature > 0 bypasses it unless opted in
+    cache_enabled: bool = True
+    cache_max_entries: int = 1024
+    cache_ttl_seconds: float = 3600.0
+    cache_sqlite_path: str = ""
+    cache_sqlite_max_entries: int = 100000
+    cache_nondeterministic: bool = False
+    # Collapse concurrent identical requests into one upstream call
+    singleflight_enabled: bool = True
+    # State shared by all workers (see shared_state.py): sqlite, redis or memory; empty or none = per process
+    shared_state: str = ""
+    shared_state_url: str = ""  # SQLite file or redis:// URL; empty = the backend's default
+    shared_state_max_keys: int = 100000  # SQLite backend
+    shared_flight_lease: float = 180.0  # seconds before another worker may redo a call whose worker died
+    # Reuse analyses across near-duplicate answers to the same quiz (see semantic_cache.py); opt-in
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.9  # answer shingle Jaccard
+    semantic_cache_thresholds: str = ""  # per quiz: "quiz_id=0.95,..."
+    semantic_cache_max_entries: int = 200000
+    semantic_cache_ttl: float = 86400.0
+    semantic_cache_shingle: int = 2  # words per shingle
+    semantic_cache_min_cosine: float = 0.0  # > 0 also checks embeddings
+    semantic_cache_audit_rate: float = 0.01
+    # Grade answers against answer_key locally before calling the model (see grading.py); per request: "grade"
+    grading_enabled: bool = True
+    grading_fuzzy_threshold: float = 0.85  # free-text answers
+    grading_short_circuit: bool = False  # all matched exactly/by value/by letter: templated report, no model call
+    # Per-student gap history with class/student rollups (see history.py); disabled when HISTORY_SQLITE_PATH is empty
+    history_sqlite_path: str = ""
+    history_flush_interval: float = 0.05  # seconds reports are buffered to be written as one transaction
+    # Ask providers for JSON-only output (Ollama format=json, Gemini responseMimeType); per request: "json_mode"
+    json_mode: bool = False
+    # Prompt strategy: default, zero_shot, one_shot, multi_shot, dynamic or auto (see strategies.py)
+    prompt_strategy: str = "default"
+    strategy_preference: Tuple[str, ...] = ("multi_shot", "one_shot", "zero_shot")
+    # Token counting (see tokenization.py): heuristic, or bpe with local GPT-2 style merges/vocab files
+    tokenizer_backend: str = "heuristic"
+    tokenizer_bpe_merges: str = ""
+    tokenizer_bpe_vocab: str = ""
+    # Model context window and the part of it reserved for the generated output
+    context_window: int = 8192
+    output_token_reserve: int = 1024
+    # Trim request fields to fit the prompt budget, highest priority first (see packing.py)
+    packing_enabled: bool = True
+    packing_priority: Tuple[str, ...] = (
+        "answers", "answer_key", "context", "retrieval", "student_profile", "constraints", "examples"
+    )
+    # Retrieval over a local vector index (see retrieval.py); disabled when RAG_INDEX_DIR is empty
+    rag_index_dir: str = ""
+    rag_top_k: int = 5
+    rag_max_tokens: int = 1024
+    rag_nprobe: int = 0  # > 0 searches only that many IVF lists
+    rag_min_score: float = 0.0
+    rag_embed_dim: int = 256
+    # Embeddings (see embeddings.py); RAG_EMBED_DIM must match the model's output size
+    embed_backend: str = "hashing"  # hashing | ollama
+    ollama_embed_model: str = "nomic-embed-text"
+    embed_batch_size: int = 64
+    embed_cache_path: str = ""  # SQLite file; empty disables the cache
+    embed_cache_dtype: str = "float16"  # float16 | float32
+    # Incremental ingestion of a content directory into the index (see ingestion.py)
+    rag_content_dir: str = ""
+    rag_chunk_tokens: int = 200
+    ingest_workers: int = 4
+    ingest_extensions: Tuple[str, ...] = (".md", ".txt", ".rst")
+    ingest_compact_ratio: float = 0.3
+    # Batch analysis fan-out and per-provider request rate limits (0 = unlimited)
+    batch_concurrency: int = 8
+    batch_max_items: int = 5000
+    gemini_rpm: float = 0.0
+    ollama_rpm: float = 0.0
+    # Estimated tokens/min per provider (0 = unlimited); rates adapt down on 429s (see ratelimit.py)
+    gemini_tpm: float = 0.0
+    ollama_tpm: float = 0.0
+    limiter_min_factor: float = 0.1  # lowest fraction of the configured rate
+    limiter_recovery: float = 0.25  # fraction of the rate regained per healthy minute
+    # Retries on 429/5xx and connection errors, full-jitter exponential backoff honouring Retry-After
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 30.0
+    # Prometheus-style metrics at GET /metrics (see metrics.py)
+    metrics_enabled: bool = True
+    # Asynchronous job queue (see jobs.py); JOBS_BATCH_MAX_RUNNING 0 = workers - 1
+    jobs_enabled: bool = True
+    jobs_workers: int = 4
+    jobs_batch_max_running: int = 0
+    jobs_max_queued: int = 10000
+    jobs_result_ttl: float = 3600.0
+    jobs_sqlite_path: str = ""  # durable queue; empty keeps jobs in memory
+    jobs_lease: float = 60.0  # seconds before another worker re-queues the jobs of a worker that died
+
+    @classmethod
+    def from_env(cls) -> "PromptConfig":
+        """Defaults overridden by the environment variable named after each field."""
+        values: Dict[str, Any] = {}
+        for f in fields(cls):
+            name = f.name.upper()
+            raw = os.getenv(name)
+            if raw is None:
+                continue
+            if f.type is bool:
+                values[f.name] = _env_bool(name, f.default)
+            elif f.type in (int, float):
+                values[f.name] = f.type(raw)
+            elif f.type is str:
+                values[f.name] = raw.lower() if f.name in _LOWERCASE else raw
+            else:  # comma-separated tuple
+                values[f.name] = tuple(s.strip() for s in raw.split(",") if s.strip())
+        return cls(**values)
+
+
+_env_config: Optional[PromptConfig] = None  # environment only, read once
+_current: Optional[PromptConfig] = None
+_mtimes: Dict[Path, int] = {}
+_lock = threading.Lock()
+_reload_listeners: List[Callable[[], None]] = []
+_signal_tasks: Set["asyncio.Task[bool]"] = set()
+
+
+def _prompt_mtimes() -> Dict[Path, int]:
+    """mtime of every prompt module at the backend root (strategies.py reads the others)."""
+    mtimes: Dict[Path, int] = {}
+    for path in PROMPT_DIR.glob("*.py"):
+        try:
+            mtimes[path] = path.stat().st_mtime_ns
+        except OSError:
+            continue
+    return mtimes
+
+
+def _with_prompt_file(base: PromptConfig) -> PromptConfig:
+    """`base` with the prompts PROMPT_PY_FILE sets; raises if the file can't be parsed."""
+    constants = read_prompt_constants(PROMPT_PY_FILE) if PROMPT_PY_FILE.exists() else {}
+    overrides = {}
+    if constants.get("SYSTEM_PROMPT"):
+        overrides["system_prompt"] = constants["SYSTEM_PROMPT"]
+    if constants.get("USER_PROMPT_TEMPLATE"):
+        overrides["user_prompt_template"] = constants["USER_PROMPT_TEMPLATE"]
+    return replace(base, **overrides)
+
+
+def get_config() -> PromptConfig:
+    """Return the current config, loading .env, the environment and the prompt file on first use."""
+    global _env_config, _current, _mtimes
+    current = _current
+    if current is None:
+        with _lock:
+            if _current is None:
+                from dotenv import load_dotenv
+
+                load_dotenv()
+                _env_config = PromptConfig.from_env()
+                _mtimes = _prompt_mtimes()
+                try:
+                    _current = _with_prompt_file(_env_config)
+                except (OSError, SyntaxError, ValueError) as exc:
+                    logger.warning("Ignoring %s: %s", PROMPT_PY_FILE.name, exc)
+                    _current = _env_config
+            current = _current
+    return current
+
+
+def on_reload(listener: Callable[[], None]) -> None:
+    """Call `listener` after each successful reload_prompts (e.g. to re-read strategy files)."""
+    _reload_listeners.append(listener)
+
+
+def reload_prompts(force: bool = False) -> bool:
+    """Swap in a config with freshly read prompts if a prompt module changed (or `force`).
+
+    The new config and its compiled user template are built before the swap, so
+    readers see either the old or the new config, never a mix. Returns False when
+    nothing changed or the edit doesn't parse or compile (the current config stays).
+    """
+    global _current, _mtimes, _compiled_user_prompt
+    get_config()
+    with _lock:
+        mtimes = _prompt_mtimes()
+        if not force and mtimes == _mtimes:
+            return False
+        _mtimes = mtimes
+        try:
+            updated = _with_prompt_file(_env_config)
+            compiled = compile_template(updated.user_prompt_template, USER_PROMPT_FIELDS, USER_PROMPT_REQUIRED)
+        except (OSError, SyntaxError, ValueError) as exc:  # TemplateError is a ValueError
+            logger.warning("Keeping the current prompts, reload failed: %s", exc)
+            return False
+        _current = updated
+        _compiled_user_prompt = compiled
+    for listener in list(_reload_listeners):
+        try:
+            listener()
+        except Exception:
+            logger.exception("Prompt reload listener %r failed", listener)
+    logger.info("Reloaded prompts")
+    return True
+
+
+async def watch_prompts(interval: float) -> None:
+    """Check the prompt modules every `interval` seconds and reload edits; run as a task."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(reload_prompts)
+        except Exception:
+            logger.exception("Prompt reload failed")
 
-# Initialize config and override from Python file if present
-config = PromptConfig()
-file_system, file_user = _load_prompts_from_python_file()
-if file_system:
-    config.system_prompt = file_system
-if file_user:
-    config.user_prompt_template = file_user
+
+def install_reload_signal(loop: asyncio.AbstractEventLoop) -> bool:
+    """Force reload_prompts on SIGHUP. False where the loop can't handle signals
+    (Windows, or a loop outside the main thread)."""
+    sighup = getattr(signal, "SIGHUP", None)
+    if sighup is None:
+        return False
+
+    def handle() -> None:
+        task = loop.create_task(asyncio.to_thread(reload_prompts, True))
+        _signal_tasks.add(task)
+        task.add_done_callback(_signal_tasks.discard)
+
+    try:
+        loop.add_signal_handler(sighup, handle)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+    return True
+
+
+def remove_reload_signal(loop: asyncio.AbstractEventLoop) -> None:
+    sighup = getattr(signal, "SIGHUP", None)
+    if sighup is not None:
+        try:
+            loop.remove_signal_handler(sighup)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+
+
+class _ConfigProxy:
+    """The module-level `config`: reads and writes go to the current PromptConfig.
+
+    Modules keep `from .prompts import config` and always see the latest
+    reload, without anything being loaded until the first attribute access.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_config(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_config(), name, value)
+
+    def __repr__(self) -> str:
+        return repr(get_config())
+
+
+config: PromptConfig = _ConfigProxy()  # type: ignore[assignment]
+
+# Placeholders render_user_prompt can fill; the template must use {answers}
+USER_PROMPT_FIELDS = ("answers", "context", "answer_key", "student_profile", "constraints")
+USER_PROMPT_REQUIRED = ("answers",)
+
+_compiled_user_prompt: Optional[CompiledTemplate] = None
+
+
+def get_user_prompt_template() -> CompiledTemplate:
+    """Return the compiled user prompt template, recompiling if the config changed.
+
+    Raises TemplateError if the template uses unknown placeholders or omits {answers}.
+    """
+    global _compiled_user_prompt
+    compiled = _compiled_user_prompt
+    template = get_config().user_prompt_template
+    if compiled is None or compiled.source is not template:
+        compiled = compile_template(template, USER_PROMPT_FIELDS, USER_PROMPT_REQUIRED)
+        _compiled_user_prompt = compiled
+    return compiled
 
 
 def render_user_prompt(
@@ -60,16 +369,22 @@ def render_user_prompt(
     constraints: str = "",
 ) -> str:
     """Render the user prompt template with available placeholders.
-    Falls back gracefully if some placeholders are not present in template.
+    Placeholders not used by the template are simply ignored.
     """
-    template = config.user_prompt_template
-    try:
-        return template.format(
-            answers=answers,
-            context=context,
-            answer_key=answer_key,
-            student_profile=student_profile,
-            constraints=constraints,
-        )
-    except KeyError:
-        return template.format(answers=answers, context=context)
\ No newline at end of file
+    return get_user_prompt_template().render({
+        "answers": answers,
+        "context": context,
+        "answer_key": answer_key,
+        "student_profile": student_profile,
+        "constraints": constraints,
+    })
+
+
+def estimate_user_prompt_tokens(
+    values: dict,
+    options: Optional[TokenEstimationOptions] = None,
+) -> int:
+    """Estimate tokens of the rendered user prompt without rendering it.
+    The static template part is measured once and cached.
+    """
+    return get_user_prompt_template().estimate_tokens(values, options)
@@ -0,0 +1,266 @@
+"""
+Per-provider rate limiting and retry backoff.
+
+TokenBucket refills continuously at `rate` units per second up to `capacity`.
+acquire() waits (FIFO) until enough units are available instead of rejecting,
+so bursts are smoothed out to the provider's sustained rate.
+
+ProviderLimiter pairs a requests bucket (GEMINI_RPM / OLLAMA_RPM) with an
+optional tokens bucket (GEMINI_TPM / OLLAMA_TPM). A call waits for one
+request and its estimated prompt tokens; once the response reports actual
+usage, the difference is charged afterwards, so the tokens bucket tracks real
+consumption. Rates adapt AIMD-style: a 429 halves them (at most once per
+second, never below LIMITER_MIN_FACTOR of the configured ceiling) and pauses
+every caller until Retry-After; healthy responses climb back towards the
+ceiling at LIMITER_RECOVERY of it per minute. Every provider gets a limiter,
+so a Retry-After pause applies even when no rate is configured.
+
+With a shared state (see shared_state.py) the limits hold for all worker
+processes together: admission is counted in fixed windows in the shared
+store (INCR per window key, the usual Redis pattern; requests in windows of
+at least a second, tokens per minute), and a 429's Retry-After pause is
+published so every worker waits it out. The AIMD factor stays per worker.
+
+retry_delay() gives full-jitter exponential backoff that honours Retry-After.
+"""
+from __future__ import annotations
+
+import asyncio
+from email.utils import parsedate_to_datetime
+import random
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from .prompts import config
+from .shared_state import NAMESPACE
+
+# Statuses worth retrying: throttled or temporarily unavailable
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        # As configured; set_rate scales capacity from these, so clamping doesn't compound
+        self._base_rate = self.rate
+        self._base_capacity = self.capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` units, sleeping until they are available.
+
+        An amount larger than the capacity waits for a full bucket and leaves
+        it in debt. Returns the time spent waiting in seconds.
+        """
+        need = min(float(amount), self.capacity)
+        waited = 0.0
+        # Holding the lock while sleeping keeps waiters in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < need:
+                delay = (need - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= float(amount)
+        return waited
+
+    def charge(self, amount: float) -> None:
+        """Take (or with a negative amount, return) units without waiting."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - float(amount))
+
+    def set_rate(self, rate: float) -> None:
+        """Change the refill rate, scaling the configured capacity with it."""
+        self._refill()
+        self.rate = float(rate)
+        self.capacity = max(1.0, self._base_capacity * self.rate / self._base_rate)
+        self._tokens = min(self._tokens, self.capacity)
+
+
+class ProviderLimiter:
+    def __init__(
+        self,
+        rpm: float = 0.0,
+        tpm: float = 0.0,
+        min_factor: float = 0.1,
+        recovery_per_min: float = 0.25,
+        clock=time.monotonic,
+        shared: Optional[Any] = None,
+        name: str = "",
+    ):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0)) if rpm > 0 else None
+        # One second of tokens as burst, but at least room for a sizeable prompt
+        self.tokens = TokenBucket(tpm / 60.0, max(tpm / 60.0, min(tpm, 4096.0))) if tpm > 0 else None
+        self.min_factor = min_factor
+        self.recovery_per_min = recovery_per_min
+        self.factor = 1.0  # current fraction of the configured rates
+        self._clock = clock
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._last_adjust = clock()
+        self.throttled = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.shared = shared
+        self._prefix = f"{NAMESPACE}limiter:{name}:"
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait for one request and `tokens` estimated tokens; returns seconds waited."""
+        waited = 0.0
+        pause = self._paused_until - self._clock()
+        if pause > 0:
+            await asyncio.sleep(pause)
+            waited += pause
+        if self.shared is not None:
+            # Shared windows replace the local buckets, which only see this worker
+            while True:
+                delay = await asyncio.to_thread(self._admit_shared, tokens)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+                waited += delay
+        else:
+            if self.requests is not None:
+                waited += await self.requests.acquire(1)
+            if self.tokens is not None and tokens > 0:
+                waited += await self.tokens.acquire(tokens)
+        self.waited += waited
+        return waited
+
+    def _admit_shared(self, tokens: int) -> float:
+        """Count one request (and its tokens) in the current shared windows.
+
+        Returns 0 when admitted, else the seconds until the blocking window
+        ends (the attempt is uncounted again). Blocking; run in a thread.
+        """
+        now = time.time()
+        paused = self.shared.get(self._prefix + "paused")
+        if paused is not None and float(paused) > now:
+            return float(paused) - now
+        admitted = []
+        checks = []
+        if self.requests is not None:
+            rate = self.requests.rate  # per second, already scaled by the factor
+            window = max(1.0, 1.0 / rate)
+            checks.append(("requests", window, rate * window, 1))
+        if self.tokens is not None and tokens > 0:
+            checks.append(("tokens", 60.0, self.tokens.rate * 60.0, int(tokens)))
+        for kind, window, allowance, amount in checks:
+            slot = int(now // window)
+            key = f"{self._prefix}{kind}:{window:g}:{slot}"
+            total = self.shared.incrby(key, amount)
+            if total == amount:
+                self.shared.expire(key, int(window) + 1)
+            # Like the local buckets, an empty window admits one oversized amount
+            if total > max(allowance, amount):
+                self.shared.incrby(key, -amount)
+                for undo_key, undo_amount in admitted:
+                    self.shared.incrby(undo_key, -undo_amount)
+                return (slot + 1) * window - now
+            admitted.append((key, amount))
+        return 0.0
+
+    def charge(self, tokens: int) -> None:
+        """Correct the token bucket by actual minus estimated usage."""
+        if self.tokens is not None and tokens:
+            self.tokens.charge(tokens)
+            if self.shared is not None:
+                key = f"{self._prefix}tokens:60:{int(time.time() // 60)}"
+                self._publish(self.shared.incrby, key, int(tokens))
+
+    def _publish(self, fn: Any, *args: Any, **kwargs: Any) -> None:
+        """Fire-and-forget a shared state write from sync code on the event loop."""
+        asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    def on_success(self) -> None:
+        now = self._clock()
+        if self.factor < 1.0:
+            self._set_factor(self.factor + self.recovery_per_min * (now - self._last_adjust) / 60.0)
+        self._last_adjust = now
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        now = self._clock()
+        self.throttled += 1
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+            if self.shared is not None:
+                self._publish(self.shared.set, self._prefix + "paused", time.time() + retry_after, px=int(retry_after * 1000) + 1)
+        # One burst of 429s is one signal, not many
+        if now - self._last_decrease >= 1.0:
+            self._last_decrease = now
+            self._set_factor(self.factor / 2.0)
+        self._last_adjust = now
+
+    def _set_factor(self, factor: float) -> None:
+        self.factor = min(1.0, max(self.min_factor, factor))
+        if self.requests is not None:
+            self.requests.set_rate(self.rpm / 60.0 * self.factor)
+        if self.tokens is not None:
+            self.tokens.set_rate(self.tpm / 60.0 * self.factor)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "factor": round(self.factor, 3),
+            "effective_rpm": round(self.rpm * self.factor, 2),
+            "effective_tpm": round(self.tpm * self.factor, 2),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "waited_s": round(self.waited, 3),
+            "paused_s": round(max(0.0, self._paused_until - self._clock()), 3),
+            "shared": self.shared is not None,
+        }
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for attempt 0, 1, ...; never sooner than Retry-After."""
+    delay = random.uniform(0.0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0.0, base))
+    return delay
+
+
+def limiters_from_config(shared: Optional[Any] = None) -> Dict[str, ProviderLimiter]:
+    """One limiter per provider; rates of 0 leave that dimension unlimited.
+
+    With `shared` (a shared_state client) the rates apply to all workers together.
+    """
+    return {
+        provider: ProviderLimiter(
+            rpm, tpm, min_factor=config.limiter_min_factor, recovery_per_min=config.limiter_recovery,
+            shared=shared, name=provider,
+        )
+        for provider, rpm, tpm in (
+            ("gemini", config.gemini_rpm, config.gemini_tpm),
+            ("ollama", config.ollama_rpm, config.ollama_tpm),
+        )
+    }
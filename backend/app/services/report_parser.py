@@ -0,0 +1,229 @@
+"""
+Extraction of the JSON report block from model output.
+
+The system prompt asks the model for a helpful explanation followed by a JSON
+block. JSONBlockScanner consumes the output incrementally (e.g. as streamed
+chunks arrive), tracking brace depth and string/escape state so that by the
+time the stream ends the candidate objects are already delimited and only
+need a json.loads.
+
+parse_report() turns that block into a typed GapReport. Validation is
+lenient by design (missing fields default, "70%" or 70 confidences become
+0.7 while other out-of-range ones are clamped to [0, 1], a string where a
+list is expected becomes a one-item list) and a block that fails json.loads
+gets one cheap repair attempt (trailing commas). With
+JSON_MODE the provider is asked for JSON output directly, in which case the
+whole output is parsed in one json.loads and no scanning or repair is needed.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+# Characters that can change scanner state; everything else is skipped in bulk
+_SPECIAL_RE = re.compile(r'[{}"\\]')
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+REPORT_KEYS = frozenset({"summary", "weaknesses", "resources", "next_questions", "missing"})
+
+
+# -----------------------------
+# Report models
+# -----------------------------
+def _as_list(value: Any) -> List[Any]:
+    if value is None or value == "":
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class Weakness(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    concept: str = ""
+    evidence: str = ""
+    confidence: float = 0.0
+
+    @field_validator("concept", "evidence", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        return "" if value is None else value if isinstance(value, str) else json.dumps(value)
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _confidence(cls, value: Any) -> float:
+        percent = isinstance(value, str) and value.strip().endswith("%")
+        try:
+            number = float(value.strip().rstrip("%")) if isinstance(value, str) else float(value)
+        except (TypeError, ValueError):
+            return 0.0
+        # "70%" always; a bare number only when it is a whole one up to 100 ("confidence": 85),
+        # 1.5 being an out-of-range score rather than 1.5%
+        if percent or (1 < number <= 100 and number.is_integer()):
+            number /= 100.0
+        return min(1.0, max(0.0, number))
+
+
+class Resource(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    title: str = ""
+    type: str = ""
+    url: str = ""
+    why: str = ""
+
+    @field_validator("title", "type", "url", "why", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        return "" if value is None else value if isinstance(value, str) else json.dumps(value)
+
+
+class GapReport(BaseModel):
+    """The report block requested by the system prompt (see strategies.REPORT_SCHEMA)."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    summary: str = ""
+    weaknesses: List[Weakness] = []
+    resources: List[Resource] = []
+    next_questions: List[str] = []
+    missing: List[str] = []
+
+    @field_validator("summary", mode="before")
+    @classmethod
+    def _summary(cls, value: Any) -> str:
+        return "" if value is None else value if isinstance(value, str) else json.dumps(value)
+
+    @field_validator("weaknesses", mode="before")
+    @classmethod
+    def _weaknesses(cls, value: Any) -> List[Any]:
+        return [{"concept": v} if isinstance(v, str) else v for v in _as_list(value)]
+
+    @field_validator("resources", mode="before")
+    @classmethod
+    def _resources(cls, value: Any) -> List[Any]:
+        return [{"title": v} if isinstance(v, str) else v for v in _as_list(value)]
+
+    @field_validator("next_questions", "missing", mode="before")
+    @classmethod
+    def _strings(cls, value: Any) -> List[str]:
+        return [v if isinstance(v, str) else json.dumps(v) for v in _as_list(value) if v is not None]
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    """json.loads a candidate block, retrying once without trailing commas."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        repaired = _TRAILING_COMMA_RE.sub(r"\1", text)
+        if repaired == text:
+            return None
+        try:
+            data = json.loads(repaired)
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _to_report(data: Optional[Dict[str, Any]]) -> Optional[GapReport]:
+    if not data or not REPORT_KEYS.intersection(data):
+        return None
+    try:
+        return GapReport.model_validate(data)
+    except ValidationError:
+        return None
+
+
+class JSONBlockScanner:
+    """Incrementally locate top-level {...} blocks in a text stream."""
+
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._offset = 0  # total chars consumed so far
+        self._depth = 0
+        self._in_string = False
+        self._escaped = -1  # offset of the char following a backslash in a string
+        self._start: Optional[int] = None
+        self.blocks: List[Tuple[int, int]] = []  # [start, end) offsets of balanced objects
+        self._parsed: Dict[Tuple[int, int], Optional[Dict[str, Any]]] = {}
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        base = self._offset
+        for m in _SPECIAL_RE.finditer(chunk):
+            pos = base + m.start()
+            if pos == self._escaped:
+                continue
+            ch = m.group()
+            if self._in_string:
+                if ch == "\\":
+                    self._escaped = pos + 1
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = pos
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    self.blocks.append((self._start, pos + 1))
+                    self._start = None
+        self._parts.append(chunk)
+        self._offset += len(chunk)
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def objects(self) -> Iterator[Dict[str, Any]]:
+        """Parsed JSON objects of the closed blocks, last first (parsed once each)."""
+        text = None
+        for block in reversed(self.blocks):
+            if block not in self._parsed:
+                if text is None:
+                    text = self.text
+                self._parsed[block] = _loads_object(text[block[0]:block[1]])
+            if self._parsed[block] is not None:
+                yield self._parsed[block]
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Return the last block that parses as a JSON object, if any."""
+        return next(self.objects(), None)
+
+    def report(self) -> Optional[GapReport]:
+        """Return the last block that looks like a report, validated."""
+        for data in self.objects():
+            report = _to_report(data)
+            if report is not None:
+                return report
+        return None
+
+
+def extract_json_block(text: str) -> Optional[Dict[str, Any]]:
+    """Parse the last JSON object embedded in text (prose/code fences allowed)."""
+    scanner = JSONBlockScanner()
+    scanner.feed(text)
+    return scanner.result()
+
+
+def parse_report(text: str) -> Optional[GapReport]:
+    """Parse the report block out of model output (prose/code fences allowed)."""
+    stripped = text.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        # JSON mode output: the whole text is the object
+        report = _to_report(_loads_object(stripped))
+        if report is not None:
+            return report
+    scanner = JSONBlockScanner()
+    scanner.feed(text)
+    return scanner.report()
@@ -0,0 +1,606 @@
+"""
+Local retrieval (RAG) over course material.
+
+- chunk_text splits documents into sentence-aligned chunks under a token
+  budget using tokenization.iter_sentence_spans / estimate_llm_tokens.
+- VectorIndex stores L2-normalized float32 embeddings in a flat file that is
+  memory-mapped for search, with a JSON-lines metadata sidecar (plus a byte
+  offset table for random access) and a small index.json header:
+
+      <index dir>/index.json     {"dim", "count", ...}
+      <index dir>/vectors.f32    count x dim float32, row-major
+      <index dir>/meta.jsonl     one JSON object per row
+      <index dir>/meta.offsets   int64 byte offset of each meta line
+      <index dir>/deleted.rows   int64 ids of deleted rows (tombstones)
+      <index dir>/index.lock     flock target shared by every process
+
+  Exact search is one matrix-vector product (cosine similarity) and an
+  argpartition for the top k. For large corpora build_ivf() adds a coarse
+  quantizer (spherical k-means) so a query only scans the `nprobe` closest
+  lists.
+  Rows are deleted by tombstone and skipped by search; compact() rewrites
+  the files without them once enough have accumulated.
+  Searches share a reader-writer lock with add/delete/compact/build_ivf, so
+  ingestion can update the index the live Retriever is searching: a search
+  sees the index before or after a write, never the files of one and the row
+  count or offsets of the other. The same holds across processes (another
+  worker, or the ingestion CLI next to a running server): every operation
+  also takes a flock on index.lock, shared for searches and exclusive for
+  writes, and re-reads index.json first, so a write appends after the rows
+  other processes added and a search sees them. Every header write bumps its
+  "version", which is how a process notices that its cached row count,
+  memmap and offsets are stale.
+- Retriever embeds the query, searches (in a worker thread, the search being
+  blocking numpy and file I/O), and packs the best chunks into a token
+  budget for the prompt's context/retrieval slot.
+
+Requires numpy (pip install ".[rag]").
+"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: no cross-process locking
+    fcntl = None  # type: ignore[assignment]
+
+from .embeddings import normalize_rows
+from .tokenization import (
+    TokenEstimationOptions,
+    estimate_llm_tokens,
+    iter_sentence_spans,
+    split_text_to_fit_tokens,
+)
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.jsonl"
+OFFSETS_FILE = "meta.offsets"
+DELETED_FILE = "deleted.rows"
+HEADER_FILE = "index.json"
+LOCK_FILE = "index.lock"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ORDER_FILE = "ivf_order.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+
+
+# -----------------------------
+# Chunking
+# -----------------------------
+@dataclass
+class Chunk:
+    text: str
+    start: int  # char offsets into the source document
+    end: int
+    tokens: int
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = 200,
+    overlap_sentences: int = 1,
+    options: Optional[TokenEstimationOptions] = None,
+) -> List[Chunk]:
+    """Group consecutive sentences into chunks of at most max_tokens.
+
+    The last `overlap_sentences` sentences of a chunk are repeated at the start
+    of the next one so facts spanning a boundary stay retrievable. A sentence
+    longer than max_tokens becomes its own (hard-cut) chunk.
+    """
+    chunks: List[Chunk] = []
+    window: List[Tuple[int, int, int]] = []  # (start, end, tokens) of sentences in the current chunk
+    total = 0
+
+    def flush() -> None:
+        if window:
+            start, end = window[0][0], window[-1][1]
+            chunks.append(Chunk(text[start:end], start, end, total))
+
+    for start, end in iter_sentence_spans(text):
+        tokens = estimate_llm_tokens(text[start:end], options)
+        if tokens > max_tokens:
+            flush()
+            piece = split_text_to_fit_tokens(text[start:end], max_tokens, options)
+            chunks.append(Chunk(piece, start, start + len(piece), estimate_llm_tokens(piece, options)))
+            window, total = [], 0
+            continue
+        if window and total + tokens > max_tokens:
+            flush()
+            window = window[-overlap_sentences:] if overlap_sentences > 0 else []
+            total = sum(t for _, _, t in window)
+            # Drop overlap that would not leave room for the new sentence
+            while window and total + tokens > max_tokens:
+                total -= window.pop(0)[2]
+        window.append((start, end, tokens))
+        total += tokens
+    flush()
+    return chunks
+
+
+# -----------------------------
+# Embedding
+# -----------------------------
+class Embedder(Protocol):
+    """Anything with a dim and an async embed(); see embeddings.EmbeddingService."""
+
+    dim: int
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray: ...
+
+
+# -----------------------------
+# Vector index
+# -----------------------------
+@dataclass
+class SearchHit:
+    row: int
+    score: float
+    meta: Dict[str, Any]
+
+
+class _ReadWriteLock:
+    """Many readers or one writer; waiting writers block new readers so ingestion isn't starved."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+@contextmanager
+def file_lock(path: Path, exclusive: bool) -> Iterator[None]:
+    """flock `path` (created if missing) for as long as the block runs; a no-op without fcntl."""
+    if fcntl is None:
+        yield
+        return
+    # One open file per holder: flocks on the same open file would not exclude each other
+    with open(path, "a+b") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class VectorIndex:
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._header: Dict[str, Any] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._ivf: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._deleted: Optional[np.ndarray] = None
+        self._lock = _ReadWriteLock()
+        self._refresh_lock = threading.Lock()
+        # Kept open for hit lookups; searches share it, so seek + read happen under _meta_lock
+        self._meta_file: Optional[Any] = None
+        self._meta_lock = threading.Lock()
+        with file_lock(self.path / LOCK_FILE, exclusive=False):
+            self._refresh()
+        self.dim: int = int(self._header["dim"])
+
+    @classmethod
+    def create(cls, path: str, dim: int) -> "VectorIndex":
+        root = Path(path)
+        root.mkdir(parents=True, exist_ok=True)
+        for name in (VECTORS_FILE, META_FILE, OFFSETS_FILE, DELETED_FILE):
+            (root / name).write_bytes(b"")
+        _write_header(root, {"dim": dim, "count": 0})
+        return cls(path)
+
+    @classmethod
+    def open_or_create(cls, path: str, dim: int) -> "VectorIndex":
+        if (Path(path) / HEADER_FILE).exists():
+            index = cls(path)
+            if index.dim != dim:
+                raise ValueError(f"Index at {path} has dim {index.dim}, expected {dim}")
+            return index
+        return cls.create(path, dim)
+
+    # -- cross-process consistency --
+    def _refresh(self) -> None:
+        """Adopt index.json as other processes left it, dropping caches of an older version."""
+        header = json.loads((self.path / HEADER_FILE).read_text(encoding="utf-8"))
+        if header == self._header:
+            return
+        self._header = header
+        self.count: int = int(header["count"])
+        self._ivf_count = int(header.get("ivf_count", 0))
+        self._vectors = None
+        self._offsets = None
+        self._deleted = None
+        self._ivf = None
+        self._close_meta()  # compaction replaces the meta file
+
+    @contextmanager
+    def _reading(self) -> Iterator[None]:
+        with self._lock.read(), file_lock(self.path / LOCK_FILE, exclusive=False):
+            # No other process can write while the shared flock is held, so the
+            # first reader to get here refreshes for all concurrent ones
+            with self._refresh_lock:
+                self._refresh()
+            yield
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._lock.write(), file_lock(self.path / LOCK_FILE, exclusive=True):
+            self._refresh()
+            yield
+
+    # -- storage --
+    @property
+    def vectors(self) -> np.ndarray:
+        """count x dim memory-mapped matrix (pages are read on demand)."""
+        if self._vectors is None:
+            if self.count == 0:
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                self._vectors = np.memmap(self.path / VECTORS_FILE, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self._vectors
+
+    def _meta_offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            self._offsets = np.fromfile(self.path / OFFSETS_FILE, dtype=np.int64)
+        return self._offsets
+
+    def add(self, vectors: np.ndarray, metas: Sequence[Dict[str, Any]]) -> List[int]:
+        """Append rows; returns their row ids."""
+        vectors = normalize_rows(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dim vectors, got {vectors.shape[1]}")
+        if len(metas) != len(vectors):
+            raise ValueError("vectors and metas must have the same length")
+        with self._writing():
+            return self._add(vectors, metas)
+
+    def _add(self, vectors: np.ndarray, metas: Sequence[Dict[str, Any]]) -> List[int]:
+        meta_path = self.path / META_FILE
+        offset = meta_path.stat().st_size
+        offsets = np.empty(len(metas), dtype=np.int64)
+        with open(meta_path, "ab") as fh:
+            for i, meta in enumerate(metas):
+                line = (json.dumps(meta, ensure_ascii=False) + "\n").encode("utf-8")
+                offsets[i] = offset
+                fh.write(line)
+                offset += len(line)
+        with open(self.path / OFFSETS_FILE, "ab") as fh:
+            fh.write(offsets.tobytes())
+        with open(self.path / VECTORS_FILE, "ab") as fh:
+            fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        first = self.count
+        self.count += len(vectors)
+        self._vectors = None
+        self._offsets = None
+        self._save_header()
+        return list(range(first, self.count))
+
+    def meta(self, row: int) -> Dict[str, Any]:
+        with self._reading():
+            return self._meta(row)
+
+    def _meta(self, row: int) -> Dict[str, Any]:
+        offsets = self._meta_offsets()
+        with self._meta_lock:
+            if self._meta_file is None:
+                self._meta_file = open(self.path / META_FILE, "rb")
+            self._meta_file.seek(int(offsets[row]))
+            return json.loads(self._meta_file.readline())
+
+    def _close_meta(self) -> None:
+        with self._meta_lock:
+            if self._meta_file is not None:
+                self._meta_file.close()
+                self._meta_file = None
+
+    def close(self) -> None:
+        """Release the open meta file (the memmap goes with the object)."""
+        with self._lock.write():
+            self._close_meta()
+            self._vectors = None
+
+    # -- deletion --
+    def deleted_mask(self) -> np.ndarray:
+        """Boolean mask over rows, True where the row has been deleted."""
+        if self._deleted is None or len(self._deleted) != self.count:
+            mask = np.zeros(self.count, dtype=bool)
+            path = self.path / DELETED_FILE
+            if path.exists():
+                mask[np.fromfile(path, dtype=np.int64)] = True
+            self._deleted = mask
+        return self._deleted
+
+    @property
+    def deleted_count(self) -> int:
+        with self._reading():
+            return int(self.deleted_mask().sum())
+
+    @property
+    def live_count(self) -> int:
+        with self._reading():
+            return self.count - int(self.deleted_mask().sum())
+
+    def delete(self, rows: Iterable[int]) -> int:
+        """Tombstone rows; returns how many were newly deleted."""
+        with self._writing():
+            return self._delete(rows)
+
+    def _delete(self, rows: Iterable[int]) -> int:
+        mask = self.deleted_mask()
+        ids = np.unique(np.fromiter(rows, dtype=np.int64))
+        if len(ids) and (ids[0] < 0 or ids[-1] >= self.count):
+            raise IndexError("row id out of range")
+        ids = ids[~mask[ids]]
+        if len(ids):
+            with open(self.path / DELETED_FILE, "ab") as fh:
+                fh.write(ids.tobytes())
+            mask[ids] = True
+            self._save_header()  # new version, so other processes reload the tombstones
+        return len(ids)
+
+    def compact(self, block: int = 65_536) -> np.ndarray:
+        """Rewrite the index without deleted rows.
+
+        Returns an old-row -> new-row array (-1 for deleted rows). An IVF that
+        was built before is rebuilt with the same number of lists. Searches
+        wait for the rewrite to finish.
+        """
+        with self._writing():
+            return self._compact(block)
+
+    def _compact(self, block: int) -> np.ndarray:
+        mask = self.deleted_mask()
+        mapping = np.full(self.count, -1, dtype=np.int64)
+        keep = np.flatnonzero(~mask)
+        mapping[keep] = np.arange(len(keep), dtype=np.int64)
+        if not mask.any():
+            return mapping
+        ivf = self._load_ivf()
+        n_lists = len(ivf[0]) if ivf is not None else 0
+
+        offsets = self._meta_offsets()
+        new_offsets = np.empty(len(keep), dtype=np.int64)
+        tmp = {name: self.path / (name + ".tmp") for name in (VECTORS_FILE, META_FILE, OFFSETS_FILE)}
+        with open(tmp[VECTORS_FILE], "wb") as vec_out, open(tmp[META_FILE], "wb") as meta_out, \
+                open(self.path / META_FILE, "rb") as meta_in:
+            position = 0
+            for start in range(0, len(keep), block):
+                rows = keep[start:start + block]
+                vec_out.write(np.ascontiguousarray(self.vectors[rows], dtype=np.float32).tobytes())
+                for i, row in enumerate(rows, start):
+                    meta_in.seek(int(offsets[row]))
+                    line = meta_in.readline()
+                    new_offsets[i] = position
+                    meta_out.write(line)
+                    position += len(line)
+        new_offsets.tofile(tmp[OFFSETS_FILE])
+
+        self._vectors = None  # release the memmap and meta handle before replacing their files
+        self._close_meta()
+        for name, path in tmp.items():
+            os.replace(path, self.path / name)
+        (self.path / DELETED_FILE).write_bytes(b"")
+        for name in (IVF_CENTROIDS_FILE, IVF_ORDER_FILE, IVF_OFFSETS_FILE):
+            (self.path / name).unlink(missing_ok=True)
+        self.count = len(keep)
+        self._offsets = None
+        self._deleted = None
+        self._ivf = None
+        self._ivf_count = 0
+        self._save_header()
+        if n_lists:
+            self._build_ivf(n_lists)
+        return mapping
+
+    def _save_header(self) -> None:
+        header = {"dim": self.dim, "count": self.count, "version": int(self._header.get("version", 0)) + 1}
+        if self._ivf_count:
+            header["ivf_count"] = self._ivf_count
+        _write_header(self.path, header)
+        self._header = header
+
+    # -- search --
+    def search(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None) -> List[SearchHit]:
+        """Top-k rows by cosine similarity. With an IVF built, only the
+        nprobe closest lists (plus rows added after the build) are scanned."""
+        if k <= 0:
+            return []
+        q = normalize_rows(query)[0]
+        with self._reading():
+            return self._search(q, k, nprobe)
+
+    def _search(self, q: np.ndarray, k: int, nprobe: Optional[int]) -> List[SearchHit]:
+        if self.count == 0:
+            return []
+        ivf = self._load_ivf()
+        if ivf is not None and nprobe is not None:
+            rows = self._ivf_candidates(q, ivf, nprobe)
+            scores = self.vectors[rows] @ q
+        else:
+            rows = None
+            scores = self.vectors @ q
+        deleted = self.deleted_mask()
+        if deleted.any():
+            scores = np.where(deleted[rows] if rows is not None else deleted, -np.inf, scores)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for i in top:
+            if scores[i] == -np.inf:
+                break
+            row = int(rows[i]) if rows is not None else int(i)
+            hits.append(SearchHit(row, float(scores[i]), self._meta(row)))
+        return hits
+
+    def build_ivf(self, n_lists: int, iterations: int = 10, sample: int = 50_000, seed: int = 0) -> None:
+        """Train a coarse quantizer (spherical k-means) and bucket all rows by list."""
+        with self._writing():
+            self._build_ivf(n_lists, iterations, sample, seed)
+
+    def _build_ivf(self, n_lists: int, iterations: int = 10, sample: int = 50_000, seed: int = 0) -> None:
+        if self.count == 0:
+            return
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists, self.count))
+        data = self.vectors
+        train = data[rng.choice(self.count, size=min(sample, self.count), replace=False)]
+        centroids = np.array(train[rng.choice(len(train), size=n_lists, replace=False)])
+        for _ in range(iterations):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = train[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+        # Assign every row in blocks so the memmap is streamed, not loaded whole
+        assign = np.empty(self.count, dtype=np.int32)
+        block = 65_536
+        for start in range(0, self.count, block):
+            assign[start:start + block] = np.argmax(data[start:start + block] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+        np.save(self.path / IVF_CENTROIDS_FILE, centroids.astype(np.float32))
+        np.save(self.path / IVF_ORDER_FILE, order)
+        np.save(self.path / IVF_OFFSETS_FILE, offsets)
+        self._ivf = (centroids.astype(np.float32), order, offsets)
+        self._ivf_count = self.count
+        self._save_header()
+
+    def _load_ivf(self) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        if self._ivf is None and self._ivf_count and (self.path / IVF_CENTROIDS_FILE).exists():
+            self._ivf = (
+                np.load(self.path / IVF_CENTROIDS_FILE),
+                np.load(self.path / IVF_ORDER_FILE, mmap_mode="r"),
+                np.load(self.path / IVF_OFFSETS_FILE),
+            )
+        return self._ivf
+
+    def _ivf_candidates(self, q: np.ndarray, ivf: Tuple[np.ndarray, np.ndarray, np.ndarray], nprobe: int) -> np.ndarray:
+        centroids, order, offsets = ivf
+        nprobe = max(1, min(nprobe, len(centroids)))
+        lists = np.argpartition(-(centroids @ q), nprobe - 1)[:nprobe]
+        parts = [np.asarray(order[offsets[c]:offsets[c + 1]]) for c in lists]
+        # Rows appended since the IVF was built are always scanned
+        if self.count > self._ivf_count:
+            parts.append(np.arange(self._ivf_count, self.count, dtype=np.int64))
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return np.sort(rows)
+
+
+def _write_header(root: Path, header: Dict[str, Any]) -> None:
+    tmp = root / (HEADER_FILE + ".tmp")
+    tmp.write_text(json.dumps(header), encoding="utf-8")
+    os.replace(tmp, root / HEADER_FILE)
+
+
+async def index_documents(
+    index: VectorIndex,
+    documents: Iterable[Tuple[str, str]],
+    embedder: Embedder,
+    max_tokens: int = 200,
+    options: Optional[TokenEstimationOptions] = None,
+) -> int:
+    """Chunk and embed (source, text) documents into the index; returns rows added."""
+    added = 0
+    for source, text in documents:
+        chunks = chunk_text(text, max_tokens=max_tokens, options=options)
+        if not chunks:
+            continue
+        vectors = await embedder.embed([c.text for c in chunks])
+        metas = [{"source": source, "start": c.start, "end": c.end, "tokens": c.tokens, "text": c.text} for c in chunks]
+        added += len(index.add(vectors, metas))
+    return added
+
+
+# -----------------------------
+# Retrieval for prompts
+# -----------------------------
+@dataclass
+class RetrievalResult:
+    text: str
+    hits: List[SearchHit]
+    tokens: int
+
+
+class Retriever:
+    def __init__(
+        self,
+        index: VectorIndex,
+        embedder: Embedder,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        min_score: float = 0.0,
+    ):
+        self.index = index
+        self.embedder = embedder
+        self.top_k = top_k
+        self.nprobe = nprobe
+        self.min_score = min_score  # hits at or below this similarity are ignored
+
+    async def retrieve(
+        self,
+        query: str,
+        max_tokens: int,
+        k: Optional[int] = None,
+        options: Optional[TokenEstimationOptions] = None,
+    ) -> RetrievalResult:
+        """Top-k chunks for query, best first, kept while they fit max_tokens."""
+        if not query.strip() or max_tokens <= 0:
+            return RetrievalResult("", [], 0)
+        vector = await self.embedder.embed([query])
+        hits = await asyncio.to_thread(self.index.search, vector[0], k or self.top_k, nprobe=self.nprobe)
+        kept: List[SearchHit] = []
+        blocks: List[str] = []
+        used = 0
+        for hit in hits:
+            if hit.score <= self.min_score:
+                continue
+            block = f"[{hit.meta.get('source', '')}] {hit.meta.get('text', '')}"
+            tokens = estimate_llm_tokens(block, options)
+            if used + tokens > max_tokens:
+                continue
+            kept.append(hit)
+            blocks.append(block)
+            used += tokens
+        return RetrievalResult("\n\n".join(blocks), kept, used)
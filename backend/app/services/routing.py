@@ -0,0 +1,290 @@
+"""
+Routing generations across several provider/model backends.
+
+ProviderRouter holds the backends from PROVIDER_ROUTES (e.g.
+"ollama:llama3,gemini:gemini-1.5-flash") and for each call:
+- ranks backends by EWMA latency, skipping those whose circuit breaker is
+  open (unsampled backends are assumed to take HEDGE_DELAY);
+- starts the best one and, if it hasn't answered after its own p95 latency
+  (HEDGE_DELAY until HEDGE_MIN_SAMPLES are seen), sends a hedged duplicate
+  to the next backend; the first success wins and the loser is cancelled;
+- fails over to the next backend at once when a call errors.
+
+Hedges are capped at HEDGE_MAX_RATIO of requests so a slow period cannot
+double upstream load. A breaker opens after BREAKER_FAILURES consecutive
+failures, rejects traffic for BREAKER_COOLDOWN seconds, then lets a single
+probe through (half-open) to decide whether to close again.
+
+The router only needs an async `call(backend) -> result dict` (results with
+an "error" key count as failures), so it can be exercised with fake
+providers.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import asdict, dataclass
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence
+
+from .prompts import config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BackendCall = Callable[["Backend"], Awaitable[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Backend:
+    provider: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_routes(spec: str) -> List[Backend]:
+    """Parse "provider[:model],..." using the configured model when none is given."""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        provider = provider.strip().lower()
+        if provider not in ("gemini", "ollama"):
+            raise ValueError(f"Unsupported provider in PROVIDER_ROUTES: {provider}")
+        default = config.gemini_model if provider == "gemini" else config.ollama_model
+        backends.append(Backend(provider, model.strip() or default))
+    return backends
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, cooldown: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self._clock = clock
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if self._clock() - self._opened_at >= self.cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    def available(self) -> bool:
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._probing)
+
+    def on_start(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probing = True
+
+    def on_cancel(self) -> None:
+        self._probing = False
+
+    def on_success(self) -> None:
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+
+    def on_failure(self) -> None:
+        self._consecutive += 1
+        if self._probing or self._consecutive >= self.failures:
+            self._opened_at = self._clock()
+        self._probing = False
+
+
+class LatencyTracker:
+    """EWMA plus a window of recent samples for percentiles (seconds)."""
+
+    def __init__(self, alpha: float = 0.2, window: int = 256):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+@dataclass
+class BackendStats:
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    cancelled: int = 0
+    hedges: int = 0  # hedged duplicates sent to this backend
+    hedge_wins: int = 0
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        backends: Sequence[Backend],
+        hedge: bool = True,
+        hedge_delay: float = 2.0,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        hedge_max_ratio: float = 0.2,
+        breaker_failures: int = 5,
+        breaker_cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not backends:
+            raise ValueError("ProviderRouter needs at least one backend")
+        self.backends = list(backends)
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self._clock = clock
+        self.breakers = {b: CircuitBreaker(breaker_failures, breaker_cooldown, clock) for b in self.backends}
+        self.latency = {b: LatencyTracker() for b in self.backends}
+        self._stats = {b: BackendStats() for b in self.backends}
+        self._calls = 0
+        self._hedges = 0
+
+    @classmethod
+    def from_config(cls) -> "ProviderRouter":
+        return cls(
+            parse_routes(config.provider_routes),
+            hedge=config.hedge_enabled,
+            hedge_delay=config.hedge_delay,
+            hedge_percentile=config.hedge_percentile,
+            hedge_min_samples=config.hedge_min_samples,
+            hedge_max_ratio=config.hedge_max_ratio,
+            breaker_failures=config.breaker_failures,
+            breaker_cooldown=config.breaker_cooldown,
+        )
+
+    @property
+    def key(self) -> str:
+        """Stable identity of the route set (used in cache keys)."""
+        return ",".join(b.name for b in self.backends)
+
+    def ranked(self) -> List[Backend]:
+        """Backends to try, best first; all of them when every breaker is open."""
+        def expected(b: Backend) -> float:
+            ewma = self.latency[b].ewma
+            return self.hedge_delay if ewma is None else ewma
+
+        available = [b for b in self.backends if self.breakers[b].available()]
+        # sorted() is stable, so ties keep the PROVIDER_ROUTES order
+        return sorted(available or self.backends, key=expected)
+
+    def hedge_after(self, backend: Backend) -> float:
+        tracker = self.latency[backend]
+        if len(tracker.samples) < self.hedge_min_samples:
+            return self.hedge_delay
+        return tracker.percentile(self.hedge_percentile) or self.hedge_delay
+
+    def _may_hedge(self) -> bool:
+        return self.hedge and self._hedges < self.hedge_max_ratio * self._calls
+
+    async def call(self, fn: BackendCall) -> Dict[str, Any]:
+        """Run fn on the best backend with hedging and failover.
+
+        Returns the winning result with "backend" (and "hedged" when a duplicate
+        was sent); if every backend fails, the last error result.
+        """
+        self._calls += 1
+        order = self.ranked()
+        running: Dict["asyncio.Future[Dict[str, Any]]", Backend] = {}
+        started: Dict[Backend, float] = {}
+        hedged = False
+        last_error: Dict[str, Any] = {"error": "No provider backend available"}
+
+        def launch(backend: Backend) -> None:
+            self.breakers[backend].on_start()
+            self._stats[backend].requests += 1
+            started[backend] = self._clock()
+            running[asyncio.ensure_future(fn(backend))] = backend
+
+        primary = order[0]
+        launch(primary)
+        next_index = 1
+        try:
+            while running:
+                timeout = None
+                if not hedged and next_index < len(order) and self._may_hedge():
+                    timeout = max(0.0, started[primary] + self.hedge_after(primary) - self._clock())
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slower than its p95: send a duplicate to the next backend
+                    hedged = True
+                    self._hedges += 1
+                    self._stats[order[next_index]].hedges += 1
+                    launch(order[next_index])
+                    next_index += 1
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as exc:  # a raising backend is just a failed one
+                        result = {"error": f"{type(exc).__name__}: {exc}"}
+                    if "error" in result:
+                        self.breakers[backend].on_failure()
+                        self._stats[backend].failures += 1
+                        last_error = {**result, "backend": backend.name}
+                        continue
+                    self.breakers[backend].on_success()
+                    self.latency[backend].observe(self._clock() - started[backend])
+                    self._stats[backend].successes += 1
+                    if hedged and backend != primary:
+                        self._stats[backend].hedge_wins += 1
+                    return {**result, "backend": backend.name, **({"hedged": True} if hedged else {})}
+                if not running and next_index < len(order):
+                    # Fail over right away; the hedge timer restarts for the new backend
+                    primary = order[next_index]
+                    launch(primary)
+                    next_index += 1
+            return last_error
+        finally:
+            for task, backend in running.items():
+                task.cancel()
+                self.breakers[backend].on_cancel()
+                self._stats[backend].cancelled += 1
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def record(self, backend: Backend, ok: bool, seconds: Optional[float] = None) -> None:
+        """Feed the outcome of a call made outside call() (e.g. a stream)."""
+        self._stats[backend].requests += 1
+        if ok:
+            self.breakers[backend].on_success()
+            self._stats[backend].successes += 1
+            if seconds is not None:
+                self.latency[backend].observe(seconds)
+        else:
+            self.breakers[backend].on_failure()
+            self._stats[backend].failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        backends = {}
+        for b in self.backends:
+            tracker = self.latency[b]
+            p95 = tracker.percentile(95)
+            backends[b.name] = {
+                "state": self.breakers[b].state,
+                "ewma_ms": round(tracker.ewma * 1000, 1) if tracker.ewma is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedge_after_ms": round(self.hedge_after(b) * 1000, 1),
+                **asdict(self._stats[b]),
+            }
+        return {"calls": self._calls, "hedges": self._hedges, "backends": backends}
@@ -0,0 +1,407 @@
+"""
+Semantic cache: reuse a prior analysis for near-duplicate answers.
+
+Submissions for the same quiz often differ only in case, whitespace,
+punctuation or a little phrasing, which the exact prompt hash in cache.py
+misses. This cache compares the answers themselves:
+
+- answers are lowercased and split with tokenize_words, then cut into
+  overlapping shingles of SEMANTIC_CACHE_SHINGLE words;
+- every shingle is hashed once; the sorted hashes (the smallest 256 for long
+  answers) are kept as a sketch, and a 72-slot one-permutation MinHash
+  (slot = hash mod 72, keep the minimum; empty slots borrow from the next
+  filled one) is cut into 12 LSH bands of 6 strided rows;
+- entries sharing a band with the query are candidates, verified by the
+  Jaccard similarity of the sketches (exact for answers under 256 shingles).
+  Lookups touch a handful of postings however many entries are cached.
+
+Entries are partitioned by scope, a hash of everything else that shapes the
+output (quiz id, answer key, context, strategy, system prompt, provider,
+model, temperature...), so only answers to the same quiz under the same
+prompt are compared. A hit needs the similarity to reach the quiz's threshold
+(SEMANTIC_CACHE_THRESHOLDS, else SEMANTIC_CACHE_THRESHOLD) and, when an
+embedder is given and SEMANTIC_CACHE_MIN_COSINE > 0, the cosine of the
+answers' embeddings to reach that too.
+
+A fraction SEMANTIC_CACHE_AUDIT_RATE of hits is audited: the analysis is
+regenerated in the background and the weak concepts of both reports are
+compared. Disagreements are counted as false reuse and the latest ones are
+kept as samples in stats() for tuning thresholds.
+"""
+from __future__ import annotations
+
+import asyncio
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+import hashlib
+import random
+import time
+from typing import Any, Awaitable, Deque, Dict, List, Optional, Set, Tuple
+
+from .prompts import config
+from .report_parser import parse_report
+from .tokenization import tokenize_words
+
+SKETCH = 256  # shingle hashes kept per entry (bottom-k); shorter answers keep all of them
+BANDS = 12
+ROWS = 6
+SLOTS = BANDS * ROWS  # MinHash slots used for LSH
+_MASK = (1 << 64) - 1
+# Offsets XORed into borrowed slots so they differ from the slot they copy
+_OFFSETS = [(d * 0x9E3779B97F4A7C15) & _MASK for d in range(SLOTS)]
+_WORD_HASHES: Dict[str, int] = {}
+
+
+def normalize_answers(text: str) -> List[str]:
+    return tokenize_words(text.lower())
+
+
+def _word_hash(word: str) -> int:
+    h = _WORD_HASHES.get(word)
+    if h is None:
+        if len(_WORD_HASHES) >= 200_000:
+            _WORD_HASHES.clear()
+        h = _WORD_HASHES[word] = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return h
+
+
+def _mix(x: int) -> int:
+    # splitmix64 finalizer
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+@dataclass
+class Fingerprint:
+    sketch: array  # sorted unique shingle hashes, at most SKETCH of the smallest
+    minhash: Tuple[int, ...]  # SLOTS one-permutation MinHash values
+
+    def bands(self) -> List[Tuple[int, ...]]:
+        # Strided rows: densification copies one value into runs of adjacent slots,
+        # so contiguous rows would often hinge on a single shingle
+        return [self.minhash[b::BANDS] for b in range(BANDS)]
+
+
+def fingerprint(words: List[str], shingle: int = 2) -> Optional[Fingerprint]:
+    """Shingle sketch and MinHash signature of normalized words, or None for no words."""
+    if not words:
+        return None
+    n = min(shingle, len(words))
+    hashes = [_word_hash(w) for w in words]
+    # Tuples of ints hash the same in every process (only str hashing is salted)
+    shingles = sorted({_mix(hash(t) & _MASK) for t in zip(*(hashes[k:len(hashes) - n + 1 + k] for k in range(n)))})
+    slots: List[Optional[int]] = [None] * SLOTS
+    for h in shingles:
+        slot, value = h % SLOTS, h // SLOTS
+        current = slots[slot]
+        if current is None or value < current:
+            slots[slot] = value
+    # Densify: an empty slot takes the next filled slot's value (circularly), mixed with the distance
+    filled = [i for i, v in enumerate(slots) if v is not None]
+    previous = filled[-1] - SLOTS
+    for index in filled:
+        value = slots[index]
+        for slot in range(previous + 1, index):
+            slots[slot % SLOTS] = value ^ _OFFSETS[index - slot]
+        previous = index
+    return Fingerprint(array("Q", shingles[:SKETCH]), tuple(slots))
+
+
+def similarity(a: array, b: array) -> float:
+    """Jaccard similarity of two shingle sets from their sketches: exact when
+    both fit, otherwise the bottom-k estimate."""
+    return _similarity(set(a), b)
+
+
+def _similarity(query: Set[int], sketch: array) -> float:
+    if len(query) < SKETCH and len(sketch) < SKETCH:
+        shared = len(query.intersection(sketch))
+        return shared / (len(query) + len(sketch) - shared)
+    other = set(sketch)
+    union = sorted(query | other)[:SKETCH]
+    return sum(1 for h in union if h in query and h in other) / len(union)
+
+
+def parse_thresholds(spec: str) -> Dict[str, float]:
+    """Parse "quiz_id=0.95,other=0.85" into per-quiz thresholds."""
+    out: Dict[str, float] = {}
+    for item in spec.split(","):
+        quiz, sep, value = item.strip().rpartition("=")
+        if sep and quiz.strip():
+            out[quiz.strip()] = float(value)
+    return out
+
+
+@dataclass
+class SemanticKey:
+    """What the caller knows about a request: the answers, the quiz and a hash
+    of the other request fields that shape the analysis."""
+
+    answers: str
+    scope: str
+    quiz: str = ""
+    _fingerprint: Optional[Fingerprint] = field(default=None, init=False, repr=False, compare=False)
+    _computed: bool = field(default=False, init=False, repr=False, compare=False)
+
+    def fingerprint(self, shingle: int) -> Optional[Fingerprint]:
+        """Computed once and shared by the lookup and the store that follows a miss."""
+        if not self._computed:
+            self._fingerprint = fingerprint(normalize_answers(self.answers), shingle)
+            self._computed = True
+        return self._fingerprint
+
+
+class _Entry:
+    __slots__ = ("scope", "quiz", "answers", "sketch", "bands", "value", "vector", "expires")
+
+    def __init__(
+        self,
+        scope: str,
+        quiz: str,
+        answers: str,
+        sketch: array,
+        bands: Tuple[int, ...],
+        value: Dict[str, Any],
+        vector: Any,
+        expires: float,
+    ):
+        self.scope = scope
+        self.quiz = quiz
+        self.answers = answers
+        self.sketch = sketch
+        self.bands = bands
+        self.value = value
+        self.vector = vector
+        self.expires = expires
+
+
+@dataclass
+class SemanticHit:
+    value: Dict[str, Any]
+    similarity: float
+    answers: str  # the cached entry's answers, for audits
+
+
+@dataclass
+class SemanticCacheStats:
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    candidates: int = 0  # entries verified across all lookups
+    rejected_by_embedding: int = 0
+    audits: int = 0
+    false_reuse: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["hit_rate"] = (self.hits / self.lookups) if self.lookups else 0.0
+        data["false_reuse_rate"] = (self.false_reuse / self.audits) if self.audits else 0.0
+        return data
+
+
+def _pct(values: Deque[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def _concepts(text: str) -> Optional[Set[str]]:
+    report = parse_report(text)
+    if report is None:
+        return None
+    return {w.concept.strip().lower() for w in report.weaknesses if w.concept.strip()}
+
+
+def agreement(reused: str, fresh: str) -> float:
+    """Overlap of the weak concepts of two outputs (word overlap without reports)."""
+    a, b = _concepts(reused), _concepts(fresh)
+    if a is None or b is None:
+        a, b = set(normalize_answers(reused)), set(normalize_answers(fresh))
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        thresholds: Optional[Dict[str, float]] = None,
+        max_entries: int = 200_000,
+        ttl: float = 86400.0,
+        shingle: int = 2,
+        embedder: Any = None,
+        min_cosine: float = 0.0,
+        audit_rate: float = 0.01,
+        audit_min_agreement: float = 0.5,
+    ):
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.shingle = max(1, shingle)
+        # Anything with `async embed(texts) -> matrix of unit rows` (embeddings.EmbeddingService)
+        self.embedder = embedder if min_cosine > 0 else None
+        self.min_cosine = min_cosine
+        self.audit_rate = audit_rate
+        self.audit_min_agreement = audit_min_agreement
+        self.stats_data = SemanticCacheStats()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._postings: Dict[int, List[int]] = {}
+        self._next_id = 0
+        self._latencies: Deque[float] = deque(maxlen=2000)  # seconds per lookup, recent
+        self.false_reuse_samples: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    @classmethod
+    def from_config(cls, embedder: Any = None) -> "SemanticCache":
+        return cls(
+            threshold=config.semantic_cache_threshold,
+            thresholds=parse_thresholds(config.semantic_cache_thresholds),
+            max_entries=config.semantic_cache_max_entries,
+            ttl=config.semantic_cache_ttl,
+            shingle=config.semantic_cache_shingle,
+            embedder=embedder,
+            min_cosine=config.semantic_cache_min_cosine,
+            audit_rate=config.semantic_cache_audit_rate,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def threshold_for(self, quiz: str) -> float:
+        return self.thresholds.get(quiz, self.threshold)
+
+    @staticmethod
+    def _band_keys(scope: str, fp: Fingerprint) -> Tuple[int, ...]:
+        return tuple(hash((scope, b, band)) for b, band in enumerate(fp.bands()))
+
+    def _candidates(self, scope: str, sketch: array, bands: Tuple[int, ...], now: float) -> List[Tuple[float, _Entry]]:
+        query = set(sketch)
+        seen: Set[int] = set()
+        found: List[Tuple[float, _Entry]] = []
+        for band in bands:
+            for entry_id in self._postings.get(band, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry = self._entries.get(entry_id)
+                if entry is None or entry.scope != scope:
+                    continue
+                if entry.expires <= now:
+                    continue  # dropped by _evict once it reaches the front
+                found.append((_similarity(query, entry.sketch), entry))
+        self.stats_data.candidates += len(seen)
+        found.sort(key=lambda item: -item[0])
+        return found
+
+    async def get(self, key: SemanticKey) -> Optional[SemanticHit]:
+        started = time.perf_counter()
+        self.stats_data.lookups += 1
+        fp = key.fingerprint(self.shingle)
+        hit: Optional[SemanticHit] = None
+        if fp is not None:
+            threshold = self.threshold_for(key.quiz)
+            candidates = self._candidates(key.scope, fp.sketch, self._band_keys(key.scope, fp), time.time())
+            matches = [m for m in candidates if m[0] >= threshold]
+            if matches and self.embedder is not None:
+                matches = await self._check_embeddings(key, matches)
+            if matches:
+                score, entry = matches[0]
+                hit = SemanticHit(entry.value, score, entry.answers)
+        self._latencies.append(time.perf_counter() - started)
+        if hit is None:
+            self.stats_data.misses += 1
+        else:
+            self.stats_data.hits += 1
+        return hit
+
+    async def _check_embeddings(self, key: SemanticKey, matches: List[Tuple[float, _Entry]]) -> List[Tuple[float, _Entry]]:
+        query = (await self.embedder.embed([key.answers]))[0]
+        kept = [(s, e) for s, e in matches if e.vector is None or float(query @ e.vector) >= self.min_cosine]
+        self.stats_data.rejected_by_embedding += len(matches) - len(kept)
+        return kept
+
+    async def set(self, key: SemanticKey, value: Dict[str, Any]) -> None:
+        fp = key.fingerprint(self.shingle)
+        if fp is None:
+            return
+        vector = None
+        if self.embedder is not None:
+            vector = (await self.embedder.embed([key.answers]))[0]
+        bands = self._band_keys(key.scope, fp)
+        entry_id = self._next_id
+        self._next_id += 1
+        # Raw provider payloads are not needed to answer a hit
+        stored = {k: v for k, v in value.items() if k not in ("raw", "cache_meta", "cached", "coalesced")}
+        self._entries[entry_id] = _Entry(
+            key.scope, key.quiz, key.answers[:500], fp.sketch, bands, stored, vector, time.time() + self.ttl
+        )
+        for band in bands:
+            self._postings.setdefault(band, []).append(entry_id)
+        self.stats_data.stores += 1
+        self._evict()
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for band in entry.bands:
+            ids = self._postings.get(band)
+            if ids is not None:
+                ids.remove(entry_id)
+                if not ids:
+                    del self._postings[band]
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.expires <= now:
+                self.stats_data.expirations += 1
+            elif len(self._entries) > self.max_entries:
+                self.stats_data.evictions += 1
+            else:
+                break
+            self._remove(entry_id)
+
+    # -- audits --
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def spawn(self, coro: Awaitable[Any]) -> None:
+        """Run an audit in the background, keeping a reference until it ends."""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def record_audit(self, key: SemanticKey, hit: SemanticHit, fresh: Dict[str, Any]) -> None:
+        score = agreement(str(hit.value.get("text", "")), str(fresh.get("text", "")))
+        self.stats_data.audits += 1
+        if score < self.audit_min_agreement:
+            self.stats_data.false_reuse += 1
+            self.false_reuse_samples.append({
+                "quiz": key.quiz,
+                "similarity": round(hit.similarity, 3),
+                "agreement": round(score, 3),
+                "answers": key.answers[:200],
+                "reused_answers": hit.answers[:200],
+                "at": time.time(),
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        data = self.stats_data.as_dict()
+        data["entries"] = len(self._entries)
+        data["lookup_p50_us"] = round(_pct(self._latencies, 50) * 1e6, 1)
+        data["lookup_p95_us"] = round(_pct(self._latencies, 95) * 1e6, 1)
+        data["false_reuse_samples"] = list(self.false_reuse_samples)
+        return data
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
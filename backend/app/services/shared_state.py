@@ -0,0 +1,272 @@
+"""
+Cross-process shared state for multi-worker deployments.
+
+Under several uvicorn workers every process has its own response cache,
+single-flight table and rate limiters. With SHARED_STATE set, those also go
+through a key-value store all workers see:
+- sqlite: a local SQLite file (SHARED_STATE_URL, default DEFAULT_SQLITE_PATH
+  on /dev/shm, i.e. shared memory where available); no external service
+- redis: a Redis server (SHARED_STATE_URL, needs the `redis` package)
+- memory: in-process only, for tests and single-worker runs
+
+Both local backends implement the subset of redis-py's client API the app
+uses (get, set with ex/px/nx, delete, incr/incrby, expire, ping, close), with
+the same argument names and bytes return values, so a redis.Redis client and
+the local stand-ins are interchangeable. Calls are blocking; async callers run
+them in a worker thread (asyncio.to_thread), as with the cache's SQLite tier.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .prompts import config
+
+# Prefix of every key, so a Redis database can be shared with other apps
+NAMESPACE = "cognify:"
+
+# RAM-backed on Linux, so the "file" lives in shared memory
+DEFAULT_SQLITE_PATH = str(
+    Path("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()) / "cognify-shared-state.db"
+)
+
+Value = Union[bytes, str, int, float]
+
+# expire() takes a `time` argument, as in redis-py
+_now = time.time
+
+
+def _encode(value: Value) -> bytes:
+    """Encode like redis-py: bytes as is, str as UTF-8, numbers by their repr."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value).encode("ascii")
+    raise TypeError(f"Invalid value type {type(value).__name__}; use bytes, str, int or float")
+
+
+def _expiry(now: float, ex: Optional[float], px: Optional[float]) -> Optional[float]:
+    if ex is not None:
+        return now + float(ex)
+    if px is not None:
+        return now + float(px) / 1000.0
+    return None
+
+
+class MemoryState:
+    """Dict-backed state for one process, with the same interface as SQLiteState."""
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, name: str, now: float) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self._data.get(name)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._data[name]
+            return None
+        return item
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._live(name, _now())
+        return None if item is None else item[0]
+
+    def set(
+        self, name: str, value: Value, ex: Optional[float] = None, px: Optional[float] = None, nx: bool = False
+    ) -> Optional[bool]:
+        encoded = _encode(value)
+        with self._lock:
+            now = _now()
+            if nx and self._live(name, now) is not None:
+                return None
+            self._data[name] = (encoded, _expiry(now, ex, px))
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def incrby(self, name: str, amount: int = 1) -> int:
+        with self._lock:
+            item = self._live(name, _now())
+            value = (int(item[0]) if item else 0) + int(amount)
+            self._data[name] = (str(value).encode("ascii"), item[1] if item else None)
+        return value
+
+    incr = incrby
+
+    def expire(self, name: str, time: float) -> bool:
+        with self._lock:
+            now = _now()
+            item = self._live(name, now)
+            if item is None:
+                return False
+            self._data[name] = (item[0], now + float(time))
+        return True
+
+    def ping(self) -> bool:
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self._data)}
+
+    def close(self) -> None:
+        self._data.clear()
+
+
+class SQLiteState:
+    """State in a SQLite file that any number of processes can open at once.
+
+    WAL mode lets readers run alongside the single writer. Read-modify-write
+    operations are single statements (set nx, expire) or BEGIN IMMEDIATE
+    transactions (incrby), so they are atomic across processes. Expired keys are invisible at once and
+    deleted by a sweep every 256 writes, which also trims the soonest-expiring
+    keys beyond max_keys.
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_keys: int = 100_000, busy_timeout: float = 5.0):
+        self.path = path
+        self.max_keys = max(1, int(max_keys))
+        self._lock = threading.Lock()
+        # Autocommit; transactions are opened explicitly where atomicity matters
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv(expires)")
+        self._writes = 0
+
+    def _row(self, name: str, now: float) -> Optional[Tuple[bytes, Optional[float]]]:
+        row = self._conn.execute("SELECT value, expires FROM kv WHERE key = ?", (name,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return bytes(row[0]), row[1]
+
+    def _written(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+            if count > self.max_keys:
+                # Like Redis' volatile-ttl policy: keys closest to expiry go first
+                self._conn.execute(
+                    "DELETE FROM kv WHERE key IN (SELECT key FROM kv ORDER BY expires IS NULL, expires LIMIT ?)",
+                    (count - self.max_keys,),
+                )
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._row(name, _now())
+        return None if row is None else row[0]
+
+    def set(
+        self, name: str, value: Value, ex: Optional[float] = None, px: Optional[float] = None, nx: bool = False
+    ) -> Optional[bool]:
+        encoded = _encode(value)
+        with self._lock:
+            now = _now()
+            expires = _expiry(now, ex, px)
+            if nx:
+                # Insert, or take over a key that has expired but not been swept yet
+                cur = self._conn.execute(
+                    "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires"
+                    " WHERE kv.expires IS NOT NULL AND kv.expires <= ?",
+                    (name, encoded, expires, now),
+                )
+                if cur.rowcount == 0:
+                    return None
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (name, encoded, expires)
+                )
+            self._written(now)
+        return True
+
+    def delete(self, *names: str) -> int:
+        if not names:
+            return 0
+        with self._lock:
+            now = _now()
+            live = self._conn.execute(
+                f"DELETE FROM kv WHERE key IN ({','.join('?' * len(names))})"
+                " AND (expires IS NULL OR expires > ?)",
+                (*names, now),
+            ).rowcount
+            self._conn.execute(f"DELETE FROM kv WHERE key IN ({','.join('?' * len(names))})", names)
+        return live
+
+    def incrby(self, name: str, amount: int = 1) -> int:
+        with self._lock:
+            now = _now()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._row(name, now)
+                value = (int(row[0]) if row else 0) + int(amount)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                    (name, str(value).encode("ascii"), row[1] if row else None),
+                )
+                self._written(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    incr = incrby
+
+    def expire(self, name: str, time: float) -> bool:
+        with self._lock:
+            now = _now()
+            cur = self._conn.execute(
+                "UPDATE kv SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (now + float(time), name, now),
+            )
+        return cur.rowcount > 0
+
+    def ping(self) -> bool:
+        with self._lock:
+            self._conn.execute("SELECT 1").fetchone()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM kv WHERE expires IS NULL OR expires > ?", (_now(),)).fetchone()
+        return {"backend": "sqlite", "path": self.path, "keys": count}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_shared_state(backend: str, url: str = "", max_keys: int = 100_000) -> Any:
+    """A client for `backend` (memory, sqlite or redis); raises ValueError for anything else."""
+    if backend == "memory":
+        return MemoryState()
+    if backend == "sqlite":
+        return SQLiteState(url or DEFAULT_SQLITE_PATH, max_keys=max_keys)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SHARED_STATE=redis needs the redis package: pip install '.[redis]'") from None
+        return redis.Redis.from_url(url or "redis://127.0.0.1:6379/0")
+    raise ValueError(f"Unknown SHARED_STATE {backend!r}; expected memory, sqlite or redis")
+
+
+def shared_state_from_config() -> Optional[Any]:
+    """The configured shared state, or None when SHARED_STATE is empty or "none" (per-process state only)."""
+    if config.shared_state in ("", "none"):
+        return None
+    return open_shared_state(config.shared_state, config.shared_state_url, config.shared_state_max_keys)
@@ -0,0 +1,116 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call: the
+first caller (the leader) starts it, later callers wait on the same task and
+receive its result or its exception. The call runs as its own task, so a
+cancelled waiter never cancels the upstream request for the others.
+
+With a shared state (see shared_state.py) the same holds across worker
+processes: a leader first takes a lease on the key (SET NX with an expiry of
+`lease` seconds). If another process holds it, the leader polls for that
+process's result, published under the key for a few seconds, instead of
+calling upstream itself; if the other process fails or dies, the lease is
+released or expires and the next poller takes over. Results must be
+JSON-serialisable to be shared this way.
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import asdict, dataclass
+import json
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .shared_state import NAMESPACE
+
+T = TypeVar("T")
+
+# How long a finished call's result stays readable by other processes' waiters
+RESULT_TTL_MS = 10_000
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    leaders: int = 0
+    collapsed: int = 0  # calls served by another caller's in-flight request
+    remote: int = 0  # leaders served by another process's in-flight request
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["collapse_rate"] = (self.collapsed / self.calls) if self.calls else 0.0
+        return data
+
+
+class SingleFlight:
+    def __init__(self, shared: Optional[Any] = None, lease: float = 180.0, poll: float = 0.05) -> None:
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.stats_data = SingleFlightStats()
+        self.shared = shared
+        self.lease = lease
+        self.poll = poll
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Run fn once per key among concurrent callers.
+
+        Returns (result, shared) where shared is True for callers that joined
+        an existing in-flight call, in this process or another one.
+        """
+        self.stats_data.calls += 1
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(self._lead(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.stats_data.leaders += 1
+        else:
+            self.stats_data.collapsed += 1
+        result, remote = await asyncio.shield(task)
+        return result, shared or remote
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Run fn, or with a shared state wait for the process already running it."""
+        if self.shared is None:
+            return await fn(), False
+        lease_key, result_key = f"{NAMESPACE}flight:{key}", f"{NAMESPACE}flight-result:{key}"
+        waited = False
+        while True:
+            if await asyncio.to_thread(self.shared.set, lease_key, self.owner, px=int(self.lease * 1000), nx=True):
+                try:
+                    result = await fn()
+                    try:
+                        payload = json.dumps(result, ensure_ascii=False)
+                    except (TypeError, ValueError):
+                        payload = None  # waiters elsewhere take over the lease and call fn themselves
+                    if payload is not None:
+                        await asyncio.to_thread(self.shared.set, result_key, payload, px=RESULT_TTL_MS)
+                    return result, False
+                finally:
+                    await asyncio.to_thread(self.shared.delete, lease_key)
+            if not waited:
+                waited = True
+                self.stats_data.remote += 1
+            # Result first: it is published before the lease is released
+            while True:
+                await asyncio.sleep(self.poll)
+                raw = await asyncio.to_thread(self.shared.get, result_key)
+                if raw is not None:
+                    return json.loads(raw), True
+                if await asyncio.to_thread(self.shared.get, lease_key) is None:
+                    break
+
+    def _done(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        data = self.stats_data.as_dict()
+        data["inflight"] = len(self._inflight)
+        return data
@@ -0,0 +1,315 @@
+"""
+Prompt strategy registry.
+
+Exposes the prompt modules at the backend root as selectable strategies:
+- default:    "System and User Prompt.py" (the configured system/user prompts)
+- zero_shot:  "Zero-Shot Prompt.py"
+- one_shot:   "One-Shot Prompt.py"
+- multi_shot: "Multi-Shot Prompt.py"
+- dynamic:    "Dynamic Prompt.py"
+
+Each file is read once (via prompt_files, without executing it) and its user
+template compiled once, and again when prompts.reload_prompts sees a prompt
+file change. A request selects a strategy by name, or "auto" to
+take the richest strategy from STRATEGY_PREFERENCE whose estimated prompt
+fits the token budget, e.g. falling back from multi-shot to one-shot when the
+examples would not fit the context window.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .prompt_files import PROMPT_DIR, read_prompt_constants
+from .prompts import config, get_user_prompt_template, on_reload
+from .templates import CompiledTemplate, compile_template
+from .tokenization import TokenEstimationOptions, estimate_llm_tokens
+
+AUTO = "auto"
+
+# Shared slot values for the generic (non-Cognify-specific) templates
+COGNIFY_TASK = (
+    "Analyze the student's quiz responses to detect concept-level knowledge gaps.\n"
+    "1) Identify weak or shaky concepts and why they appear weak (cite the specific answer fragments).\n"
+    "2) Summarize overall mastery in 1–2 sentences.\n"
+    "3) Recommend 3–5 targeted resources.\n"
+    "4) Propose 3–5 short follow-up practice questions.\n"
+    "5) If key information is missing, list it under \"missing\"."
+)
+REPORT_SCHEMA = (
+    "{\n"
+    "  \"summary\": \"string\",\n"
+    "  \"weaknesses\": [{\"concept\": \"string\", \"evidence\": \"string\", \"confidence\": 0.0}],\n"
+    "  \"resources\": [{\"title\": \"string\", \"type\": \"article|video|doc\", \"url\": \"\", \"why\": \"string\"}],\n"
+    "  \"next_questions\": [\"string\"],\n"
+    "  \"missing\": [\"string\"]\n"
+    "}"
+)
+REPORT_STYLE = "Clear, concise guidance suitable for students and teachers. Do not fabricate URLs."
+
+
+@dataclass
+class PromptExample:
+    input: str
+    output: str
+    explanation: str = ""
+
+
+# Used by one/multi-shot strategies when a request brings no examples of its own
+DEFAULT_EXAMPLES: Tuple[PromptExample, ...] = (
+    PromptExample(
+        input="Q1: 3/4 + 1/4 = ? Student: 4/8. Key: 1.",
+        output=(
+            "{\"summary\": \"Adds fractions by adding numerators and denominators.\", "
+            "\"weaknesses\": [{\"concept\": \"adding fractions with common denominators\", "
+            "\"evidence\": \"3/4 + 1/4 = 4/8\", \"confidence\": 0.85}], "
+            "\"resources\": [{\"title\": \"Adding fractions with like denominators\", \"type\": \"video\", \"url\": \"\", "
+            "\"why\": \"Shows why the denominator stays the same\"}], "
+            "\"next_questions\": [\"2/5 + 1/5 = ?\"], \"missing\": []}"
+        ),
+        explanation="One clear misconception, high confidence; no URL invented.",
+    ),
+    PromptExample(
+        input="Q2: Solve 2x + 3 = 11. Student: x = 7. Key: x = 4.",
+        output=(
+            "{\"summary\": \"Applies inverse operations in the wrong order.\", "
+            "\"weaknesses\": [{\"concept\": \"solving two-step linear equations\", "
+            "\"evidence\": \"x = 7 (divided before subtracting)\", \"confidence\": 0.7}], "
+            "\"resources\": [{\"title\": \"Two-step equations\", \"type\": \"article\", \"url\": \"\", "
+            "\"why\": \"Practice undoing operations in reverse order\"}], "
+            "\"next_questions\": [\"Solve 3x - 5 = 10.\"], \"missing\": [\"student's working steps\"]}"
+        ),
+    ),
+)
+
+
+@dataclass
+class StrategyInput:
+    """Request fields a strategy can draw on when filling its template."""
+    answers: str
+    context: str = ""
+    answer_key: str = ""
+    student_profile: str = ""
+    constraints: str = ""
+    # None means "use DEFAULT_EXAMPLES"; an explicit [] means no examples
+    examples: Optional[List[PromptExample]] = None
+    retrieval: str = ""
+
+
+def format_examples(examples: Sequence[PromptExample]) -> str:
+    blocks = []
+    for i, ex in enumerate(examples, 1):
+        block = f"Example {i}:\n- Example Input:\n{ex.input}\n- Example Output:\n{ex.output}\n"
+        if ex.explanation:
+            block += f"- Notes:\n{ex.explanation}\n"
+        blocks.append(block)
+    return "---\n".join(blocks)
+
+
+def _student_input(inputs: StrategyInput, include_profile: bool = True) -> str:
+    text = f"Student responses:\n{inputs.answers}"
+    if inputs.answer_key:
+        text += f"\n\nAnswer key:\n{inputs.answer_key}"
+    if include_profile and inputs.student_profile:
+        text += f"\n\nStudent profile (level, goals):\n{inputs.student_profile}"
+    return text
+
+
+class PromptStrategy:
+    # How many examples the template takes: 0, 1, or None for any number
+    max_examples: Optional[int] = 0
+
+    def __init__(self, name: str, system_prompt: str, template: CompiledTemplate):
+        self.name = name
+        self._system_prompt = system_prompt
+        self._template = template
+        self._system_tokens: Dict[Tuple[str, str, Optional[float], Optional[str]], int] = {}
+
+    @property
+    def system_prompt(self) -> str:
+        return self._system_prompt
+
+    @property
+    def template(self) -> CompiledTemplate:
+        return self._template
+
+    def examples_for(self, inputs: StrategyInput) -> List[PromptExample]:
+        if self.max_examples == 0:
+            return []
+        examples = list(DEFAULT_EXAMPLES if inputs.examples is None else inputs.examples)
+        return examples if self.max_examples is None else examples[: self.max_examples]
+
+    def slot_values(self, inputs: StrategyInput) -> Dict[str, str]:
+        examples = self.examples_for(inputs)
+        first = examples[0] if examples else PromptExample("", "")
+        values = {
+            "task": COGNIFY_TASK,
+            "context": inputs.context,
+            # Templates with a {state} slot get the student profile there instead
+            "input": _student_input(inputs, include_profile="state" not in self.template.fields),
+            "constraints": inputs.constraints,
+            "output_schema": REPORT_SCHEMA,
+            "style": REPORT_STYLE,
+            "examples": format_examples(examples),
+            "example_input": first.input,
+            "example_output": first.output,
+            "example_explanation": first.explanation,
+            "state": inputs.student_profile,
+            "memory": "",
+            "retrieval": inputs.retrieval,
+            "tools": "",
+        }
+        return {name: values[name] for name in self.template.fields}
+
+    def render(self, inputs: StrategyInput) -> Tuple[str, str]:
+        return self.system_prompt, self.template.render(self.slot_values(inputs))
+
+    def estimate_tokens(self, inputs: StrategyInput, options: Optional[TokenEstimationOptions] = None) -> int:
+        """Estimated system + user prompt tokens; static parts are cached."""
+        opts = options or TokenEstimationOptions()
+        key = (opts.provider or "", opts.model or "", opts.chars_per_token, opts.backend)
+        system_tokens = self._system_tokens.get(key)
+        if system_tokens is None:
+            system_tokens = estimate_llm_tokens(self.system_prompt, opts)
+            self._system_tokens[key] = system_tokens
+        return system_tokens + self.template.estimate_tokens(self.slot_values(inputs), opts)
+
+
+class DefaultStrategy(PromptStrategy):
+    """The configured SYSTEM_PROMPT / USER_PROMPT_TEMPLATE pair."""
+
+    def __init__(self) -> None:
+        super().__init__("default", "", get_user_prompt_template())
+
+    @property
+    def system_prompt(self) -> str:
+        return config.system_prompt
+
+    @property
+    def template(self) -> CompiledTemplate:
+        return get_user_prompt_template()
+
+    def slot_values(self, inputs: StrategyInput) -> Dict[str, str]:
+        context = inputs.context
+        if inputs.retrieval:
+            context = f"{context}\n\n{inputs.retrieval}" if context else inputs.retrieval
+        return {
+            "answers": inputs.answers,
+            "context": context,
+            "answer_key": inputs.answer_key,
+            "student_profile": inputs.student_profile,
+            "constraints": inputs.constraints,
+        }
+
+    def estimate_tokens(self, inputs: StrategyInput, options: Optional[TokenEstimationOptions] = None) -> int:
+        # The configured system prompt may be swapped at runtime, so don't cache it
+        return estimate_llm_tokens(self.system_prompt, options) + self.template.estimate_tokens(self.slot_values(inputs), options)
+
+
+class OneShotStrategy(PromptStrategy):
+    max_examples = 1
+
+
+class MultiShotStrategy(PromptStrategy):
+    max_examples = None
+
+
+class DynamicStrategy(PromptStrategy):
+    max_examples = None
+
+
+# name -> (file, system constant, template constant, class)
+STRATEGY_FILES = {
+    "zero_shot": ("Zero-Shot Prompt.py", "ZERO_SHOT_SYSTEM_PROMPT", "ZERO_SHOT_USER_PROMPT_TEMPLATE", PromptStrategy),
+    "one_shot": ("One-Shot Prompt.py", "ONE_SHOT_SYSTEM_PROMPT", "ONE_SHOT_USER_PROMPT_TEMPLATE", OneShotStrategy),
+    "multi_shot": ("Multi-Shot Prompt.py", "MULTI_SHOT_SYSTEM_PROMPT", "MULTI_SHOT_USER_PROMPT_TEMPLATE", MultiShotStrategy),
+    "dynamic": ("Dynamic Prompt.py", "DYNAMIC_SYSTEM_PROMPT", "DYNAMIC_USER_PROMPT_TEMPLATE", DynamicStrategy),
+}
+
+# Placeholders the generic templates may use (all filled by slot_values)
+GENERIC_FIELDS = (
+    "task", "context", "input", "constraints", "output_schema", "style", "examples",
+    "example_input", "example_output", "example_explanation", "state", "memory", "retrieval", "tools",
+)
+
+
+class StrategyRegistry:
+    def __init__(self, strategies: Optional[Dict[str, PromptStrategy]] = None):
+        self.strategies: Dict[str, PromptStrategy] = dict(strategies or {})
+
+    @classmethod
+    def load(cls) -> "StrategyRegistry":
+        """Read and compile every available prompt module once."""
+        strategies: Dict[str, PromptStrategy] = {"default": DefaultStrategy()}
+        for name, (filename, system_name, template_name, strategy_cls) in STRATEGY_FILES.items():
+            path = PROMPT_DIR / filename
+            if not path.exists():
+                continue
+            constants = read_prompt_constants(path)
+            if system_name not in constants or template_name not in constants:
+                continue
+            template = compile_template(constants[template_name], GENERIC_FIELDS, required=("input",))
+            strategies[name] = strategy_cls(name, constants[system_name], template)
+        return cls(strategies)
+
+    def names(self) -> List[str]:
+        return sorted(self.strategies)
+
+    def get(self, name: str) -> PromptStrategy:
+        try:
+            return self.strategies[name]
+        except KeyError:
+            raise ValueError(f"Unknown prompt strategy {name!r}; available: {', '.join(self.names())}, {AUTO}") from None
+
+    def select(
+        self,
+        inputs: StrategyInput,
+        budget: int,
+        preference: Optional[Sequence[str]] = None,
+        options: Optional[TokenEstimationOptions] = None,
+    ) -> PromptStrategy:
+        """Pick the first preferred strategy whose estimated prompt fits `budget`
+        tokens; if none fits, the cheapest of the candidates."""
+        candidates = [self.strategies[n] for n in (preference or config.strategy_preference) if n in self.strategies]
+        if not candidates:
+            return self.get("default")
+        cheapest: Optional[Tuple[int, PromptStrategy]] = None
+        for strategy in candidates:
+            tokens = strategy.estimate_tokens(inputs, options)
+            if tokens <= budget:
+                return strategy
+            if cheapest is None or tokens < cheapest[0]:
+                cheapest = (tokens, strategy)
+        return cheapest[1]
+
+    def resolve(self, name: Optional[str], inputs: StrategyInput, options: Optional[TokenEstimationOptions] = None) -> PromptStrategy:
+        name = (name or config.prompt_strategy).lower()
+        if name == AUTO:
+            return self.select(inputs, prompt_token_budget(), options=options)
+        return self.get(name)
+
+
+def prompt_token_budget() -> int:
+    """Tokens available for system + user prompt: context window minus the output reserve."""
+    return max(0, config.context_window - config.output_token_reserve)
+
+
+_registry: Optional[StrategyRegistry] = None
+
+
+def get_strategy_registry() -> StrategyRegistry:
+    """Return the process-wide registry, loading it on first use (warmed at startup)."""
+    global _registry
+    if _registry is None:
+        _registry = StrategyRegistry.load()
+    return _registry
+
+
+def _reload_registry() -> None:
+    # A prompt file changed: recompile every strategy, keeping the old registry if one fails
+    global _registry
+    if _registry is not None:
+        _registry = StrategyRegistry.load()
+
+
+on_reload(_reload_registry)
@@ -0,0 +1,126 @@
+"""
+Precompiled prompt templates.
+
+compile_template parses a str.format-style template once into literal
+segments and slot references, validating its placeholders against the
+fields the caller can supply. Rendering then only joins segments with slot
+values, and the token estimate of the static (literal) part is cached so
+per-request budgeting only measures the variable slots.
+"""
+from __future__ import annotations
+
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from .tokenization import TokenEstimationOptions, estimate_llm_tokens
+
+_FORMATTER = Formatter()
+
+
+class TemplateError(ValueError):
+    """Template placeholders don't match the fields available to fill them."""
+
+    def __init__(self, message: str, missing: Iterable[str] = (), extra: Iterable[str] = ()):
+        self.missing = sorted(missing)
+        self.extra = sorted(extra)
+        details = []
+        if self.missing:
+            details.append(f"missing: {', '.join(self.missing)}")
+        if self.extra:
+            details.append(f"unknown: {', '.join(self.extra)}")
+        super().__init__(f"{message} ({'; '.join(details)})" if details else message)
+
+
+# (field name, conversion, format spec); conversion/spec are None when absent
+Slot = Tuple[str, Optional[str], Optional[str]]
+
+
+class CompiledTemplate:
+    __slots__ = ("source", "literals", "slots", "fields", "_plain", "_static_tokens")
+
+    def __init__(self, source: str, literals: List[str], slots: List[Slot]):
+        self.source = source
+        # literals[i] precedes slots[i]; the final literal follows the last slot
+        self.literals: Tuple[str, ...] = tuple(literals)
+        self.slots: Tuple[Slot, ...] = tuple(slots)
+        self.fields: FrozenSet[str] = frozenset(name for name, _, _ in slots)
+        self._plain = all(conv is None and not spec for _, conv, spec in slots)
+        self._static_tokens: Dict[Tuple[str, str, Optional[float], Optional[str]], int] = {}
+
+    @property
+    def static_text(self) -> str:
+        return "".join(self.literals)
+
+    def render(self, values: Mapping[str, str]) -> str:
+        missing = self.fields.difference(values)
+        if missing:
+            raise TemplateError("No value for template placeholders", missing=missing)
+        literals = self.literals
+        parts: List[str] = [literals[0]]
+        if self._plain:
+            for i, (name, _, _) in enumerate(self.slots, 1):
+                parts.append(str(values[name]))
+                parts.append(literals[i])
+        else:
+            for i, (name, conv, spec) in enumerate(self.slots, 1):
+                value = values[name]
+                if conv is not None:
+                    value = _FORMATTER.convert_field(value, conv)
+                parts.append(format(value, spec or ""))
+                parts.append(literals[i])
+        return "".join(parts)
+
+    def static_tokens(self, options: Optional[TokenEstimationOptions] = None) -> int:
+        """Token estimate of the literal text, computed once per options."""
+        opts = options or TokenEstimationOptions()
+        key = (opts.provider or "", opts.model or "", opts.chars_per_token, opts.backend)
+        tokens = self._static_tokens.get(key)
+        if tokens is None:
+            tokens = estimate_llm_tokens(self.static_text, opts)
+            self._static_tokens[key] = tokens
+        return tokens
+
+    def estimate_tokens(self, values: Mapping[str, str], options: Optional[TokenEstimationOptions] = None) -> int:
+        """Estimate the rendered prompt's tokens from the cached static part plus each slot."""
+        return self.static_tokens(options) + sum(
+            estimate_llm_tokens(str(values.get(name, "")), options) for name, _, _ in self.slots
+        )
+
+
+def compile_template(
+    template: str,
+    fields: Optional[Iterable[str]] = None,
+    required: Iterable[str] = (),
+) -> CompiledTemplate:
+    """Parse template into segments and validate its placeholders.
+
+    fields: placeholders the caller can supply; any other placeholder is an error.
+    required: placeholders the template must use (e.g. the student answers).
+    Raises TemplateError listing every problem at once.
+    """
+    literals: List[str] = []
+    slots: List[Slot] = []
+    pending = ""
+    try:
+        parsed = list(_FORMATTER.parse(template))
+    except ValueError as exc:
+        raise TemplateError(f"Malformed template: {exc}") from exc
+    for literal, name, spec, conv in parsed:
+        pending += literal
+        if name is None:
+            continue
+        if not name or name.isdigit():
+            raise TemplateError("Positional placeholders are not supported; use named fields")
+        if "." in name or "[" in name:
+            raise TemplateError(f"Attribute/index access is not supported in placeholder {{{name}}}")
+        literals.append(pending)
+        pending = ""
+        slots.append((name, conv, spec or None))
+    literals.append(pending)
+
+    compiled = CompiledTemplate(template, literals, slots)
+    extra = compiled.fields.difference(fields) if fields is not None else set()
+    missing = set(required).difference(compiled.fields)
+    if extra or missing:
+        raise TemplateError("Template placeholders do not match the available fields", missing=missing, extra=extra)
+    return compiled
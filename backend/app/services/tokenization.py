@@ -2,22 +2,30 @@
 Tokenization utilities for Cognify backend.
 
 Features (no extra dependencies):
-- Word and sentence tokenization via regex
+- Word and sentence tokenization via regex, as lists or as lazy (start, end) spans
 - Character/word counts
 - Heuristic LLM token estimation (approximation)
+- Pluggable tokenizer backends (heuristic, local byte-level BPE) with batch counting
 - Helpers to estimate prompt token usage
 
 Notes:
-- Exact tokenization differs by provider/model. This module provides
-  a reasonable approximation and a pluggable interface to add
-  provider-specific implementations later without breaking callers.
+- Exact tokenization differs by provider/model. The heuristic backend is a
+  fast approximation and stays the default; select another backend per call
+  via TokenEstimationOptions.backend or globally via TOKENIZER_BACKEND.
+- The "bpe" backend reads local GPT-2 style files named by TOKENIZER_BPE_MERGES
+  (and optionally TOKENIZER_BPE_VOCAB); if they are missing it falls back to
+  the heuristic.
 """
 from __future__ import annotations
 
 from dataclasses import dataclass
+import logging
 import math
+import os
 import re
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Regex patterns for lightweight tokenization
 WORD_RE = re.compile(r"\b\w+\b", re.UNICODE)
@@ -28,6 +36,15 @@ SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
 # Common guideline: ~4 chars/token for English text, ~1.5 words/token.
 DEFAULT_CHARS_PER_TOKEN = 4.0
 
+HEURISTIC_BACKEND = "heuristic"
+
+
+def _default_backend() -> str:
+    """TOKENIZER_BACKEND, read on use: prompts imports this module before the config (and .env) is loaded."""
+    from .prompts import config
+
+    return config.tokenizer_backend
+
 
 # -----------------------------
 # Basic tokenization primitives
@@ -51,9 +68,43 @@ def tokenize_sentences(text: str) -> List[str]:
     text = text.strip()
     if not text:
         return []
-    parts = SENTENCE_SPLIT_RE.split(text)
-    # Ensure we don't return empty fragments
-    return [p.strip() for p in parts if p.strip()]
+    # Strip each fragment once and drop empty ones
+    return [p for p in map(str.strip, SENTENCE_SPLIT_RE.split(text)) if p]
+
+
+def iter_word_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) offsets of word-like tokens without building a list."""
+    if not text:
+        return
+    for m in WORD_RE.finditer(text):
+        yield m.span()
+
+
+def iter_sentence_spans(text: str, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) offsets of sentences in text, lazily and without copying.
+
+    Same boundaries as tokenize_sentences: surrounding whitespace is excluded
+    from each span and empty fragments are skipped.
+    """
+    if not text:
+        return
+    pos = start
+    for m in SENTENCE_SPLIT_RE.finditer(text, start):
+        span = _strip_span(text, pos, m.start())
+        if span is not None:
+            yield span
+        pos = m.end()
+    span = _strip_span(text, pos, len(text))
+    if span is not None:
+        yield span
+
+
+def _strip_span(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
 
 
 def count_chars(text: str) -> int:
@@ -72,22 +123,10 @@ class TokenEstimationOptions:
     provider: str = "generic"  # e.g., "gemini", "ollama"
     model: Optional[str] = None # e.g., "llama3"
     chars_per_token: Optional[float] = None  # override heuristic if known
+    backend: Optional[str] = None  # tokenizer backend name; None uses TOKENIZER_BACKEND
 
 
-def estimate_llm_tokens(text: str, options: Optional[TokenEstimationOptions] = None) -> int:
-    """Estimate the number of LLM tokens for the given text.
-
-    This uses a simple chars-per-token heuristic. For most English text,
-    tokens ≈ ceil(len(text) / 4). You can override via options.chars_per_token.
-
-    For exact counts, integrate the provider/model tokenizer later.
-    """
-    if not text:
-        return 0
-
-    if options is None:
-        options = TokenEstimationOptions()
-
+def _heuristic_chars_per_token(options: TokenEstimationOptions) -> float:
     # Allow provider/model-specific overrides here if you know exact ratios.
     cpt = options.chars_per_token
 
@@ -103,10 +142,119 @@ def estimate_llm_tokens(text: str, options: Optional[TokenEstimationOptions] = N
             cpt = 3.6
         else:
             cpt = DEFAULT_CHARS_PER_TOKEN
+    return cpt
 
+
+# ---------------------------------
+# Pluggable tokenizer backends
+# ---------------------------------
+class TokenizerBackend(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]: ...
+
+
+class HeuristicTokenizer:
+    name = HEURISTIC_BACKEND
+
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN):
+        self.chars_per_token = max(chars_per_token, 0.1)
+
+    def count(self, text: str) -> int:
+        return int(math.ceil(len(text) / self.chars_per_token)) if text else 0
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        cpt = self.chars_per_token
+        return [int(math.ceil(len(t) / cpt)) if t else 0 for t in texts]
+
+
+TokenizerFactory = Callable[[TokenEstimationOptions], TokenizerBackend]
+
+_TOKENIZER_FACTORIES: Dict[str, TokenizerFactory] = {}
+_TOKENIZER_INSTANCES: Dict[Tuple[str, str, str, Optional[float]], TokenizerBackend] = {}
+
+
+def register_tokenizer(name: str, factory: TokenizerFactory, replace: bool = False) -> None:
+    """Register a backend factory under `name` (e.g. a provider-specific tokenizer).
+
+    The factory receives the TokenEstimationOptions and may raise if its
+    resources are unavailable; callers then fall back to the heuristic.
+    """
+    key = name.lower()
+    if key in _TOKENIZER_FACTORIES and not replace:
+        raise ValueError(f"Tokenizer backend already registered: {name}")
+    _TOKENIZER_FACTORIES[key] = factory
+    # Drop instances built by a previous factory of the same name
+    for cache_key in [k for k in _TOKENIZER_INSTANCES if k[0] == key]:
+        del _TOKENIZER_INSTANCES[cache_key]
+
+
+def available_tokenizers() -> List[str]:
+    return sorted(_TOKENIZER_FACTORIES)
+
+
+def get_tokenizer(options: Optional[TokenEstimationOptions] = None) -> TokenizerBackend:
+    """Return the (cached) backend instance selected by options."""
+    if options is None:
+        options = TokenEstimationOptions()
+    name = (options.backend or _default_backend()).lower()
+    key = (name, (options.provider or "").lower(), (options.model or "").lower(), options.chars_per_token)
+    backend = _TOKENIZER_INSTANCES.get(key)
+    if backend is None:
+        factory = _TOKENIZER_FACTORIES.get(name)
+        try:
+            if factory is None:
+                raise KeyError(f"unknown tokenizer backend {name!r}")
+            backend = factory(options)
+        except Exception as exc:
+            logger.warning("Tokenizer backend %s unavailable (%s); using heuristic", name, exc)
+            backend = HeuristicTokenizer(_heuristic_chars_per_token(options))
+        _TOKENIZER_INSTANCES[key] = backend
+    return backend
+
+
+def _bpe_factory(options: TokenEstimationOptions) -> TokenizerBackend:
+    from .bpe import BPETokenizer
+
+    from .prompts import config
+
+    merges = config.tokenizer_bpe_merges
+    if not merges or not os.path.exists(merges):
+        raise FileNotFoundError("TOKENIZER_BPE_MERGES is not set to an existing merges file")
+    return BPETokenizer.from_files(merges, config.tokenizer_bpe_vocab or None)
+
+
+register_tokenizer(HEURISTIC_BACKEND, lambda o: HeuristicTokenizer(_heuristic_chars_per_token(o)))
+register_tokenizer("bpe", _bpe_factory)
+
+
+def estimate_llm_tokens(text: str, options: Optional[TokenEstimationOptions] = None) -> int:
+    """Estimate the number of LLM tokens for the given text.
+
+    By default this uses a simple chars-per-token heuristic. For most English
+    text, tokens ≈ ceil(len(text) / 4). You can override via
+    options.chars_per_token, or select an exact backend via options.backend.
+    """
+    if not text:
+        return 0
+
+    if options is None:
+        options = TokenEstimationOptions()
+
+    if (options.backend or _default_backend()).lower() != HEURISTIC_BACKEND:
+        return get_tokenizer(options).count(text)
+
+    cpt = _heuristic_chars_per_token(options)
     return int(math.ceil(len(text) / max(cpt, 0.1)))
 
 
+def count_tokens_batch(texts: Sequence[str], options: Optional[TokenEstimationOptions] = None) -> List[int]:
+    """Count tokens for many strings in one call with the selected backend."""
+    return get_tokenizer(options).count_batch(texts)
+
+
 def estimate_prompt_tokens(
     system_prompt: str,
     user_prompt: str,
@@ -129,6 +277,71 @@ def estimate_prompt_tokens(
 # Utilities for fitting within limits
 # ---------------------------------
 
+def fit_prefix(
+    text: str,
+    max_tokens: int,
+    options: Optional[TokenEstimationOptions] = None,
+) -> int:
+    """Return the end offset of the longest sentence-aligned prefix of text
+    that fits within max_tokens, scanning sentences lazily and stopping at the
+    first one that overflows (only the needed prefix of large inputs is read).
+
+    Falls back to a hard cut (trailing whitespace removed) if even the first
+    sentence does not fit, sized with the active backend's own counts. Returns
+    0 for an empty text or budget.
+    """
+    if not text or max_tokens <= 0:
+        return 0
+
+    if options is None:
+        options = TokenEstimationOptions()
+
+    tokenizer: Optional[TokenizerBackend] = None
+    if (options.backend or _default_backend()).lower() == HEURISTIC_BACKEND:
+        # Convert token budget to char budget
+        char_budget = max(1, int(max_tokens * _heuristic_chars_per_token(options)))
+        if len(text) <= char_budget:
+            return len(text)
+        end = 0
+        for _, sentence_end in iter_sentence_spans(text):
+            if sentence_end > char_budget:
+                break
+            end = sentence_end
+    else:
+        tokenizer = get_tokenizer(options)
+        # Counts each sentence (with its leading separator) once as it is reached
+        running = 0
+        end = 0
+        for _, sentence_end in iter_sentence_spans(text):
+            running += tokenizer.count(text[end:sentence_end])
+            if running > max_tokens:
+                break
+            end = sentence_end
+        else:
+            return len(text)
+
+    if end:
+        return end
+
+    # Fallback hard cut
+    if tokenizer is None:
+        cut = min(char_budget, len(text))
+    else:
+        # Binary search for the longest prefix of the first sentence the tokenizer
+        # fits; a cut is only taken once counted, so the result always fits
+        low, high = 0, sentence_end
+        while low < high:
+            mid = (low + high + 1) // 2
+            if tokenizer.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        cut = low
+    while cut > 0 and text[cut - 1].isspace():
+        cut -= 1
+    return cut
+
+
 def split_text_to_fit_tokens(
     text: str,
     max_tokens: int,
@@ -140,39 +353,11 @@ def split_text_to_fit_tokens(
     1) Estimate chars-per-token to compute an approximate char budget.
     2) Try to cut on sentence boundary within that budget.
     3) Fallback to a hard char cut if needed.
-    """
-    if not text or max_tokens <= 0:
-        return ""
 
-    if options is None:
-        options = TokenEstimationOptions()
-
-    # Convert token budget to char budget
-    cpt = options.chars_per_token or (
-        3.6 if ((options.provider or "").lower() == "ollama" and (options.model or "").lower().startswith("llama")) else DEFAULT_CHARS_PER_TOKEN
-    )
-    char_budget = max(1, int(max_tokens * cpt))
-
-    if len(text) <= char_budget:
-        return text
-
-    # Try sentence-aware truncation
-    sentences = tokenize_sentences(text)
-    out: List[str] = []
-    running = 0
-    for s in sentences:
-        # +1 for the space/newline joiner when reconstructed
-        delta = len(s) + (1 if out else 0)
-        if running + delta > char_budget:
-            break
-        out.append(s)
-        running += delta
-
-    if out:
-        return (" ".join(out)).strip()
-
-    # Fallback hard cut
-    return text[:char_budget].rstrip()
+    The prefix is sliced from the original text, so whitespace between the
+    kept sentences is preserved.
+    """
+    return text[:fit_prefix(text, max_tokens, options)] if text else ""
 
 
 # -----------------------------
@@ -193,4 +378,9 @@ def split_text_to_fit_tokens(
 #
 # To specialize for Ollama LLaMA3:
 # opts = TokenEstimationOptions(provider="ollama", model="llama3")
-# tokens_llama = estimate_llm_tokens(text, opts)
\ No newline at end of file
+# tokens_llama = estimate_llm_tokens(text, opts)
+#
+# Exact counts with a local BPE merges file (TOKENIZER_BPE_MERGES=/path/merges.txt):
+# bpe = TokenEstimationOptions(backend="bpe")
+# tokens_exact = estimate_llm_tokens(text, bpe)
+# counts = count_tokens_batch(["first answer", "second answer"], bpe)
\ No newline at end of file
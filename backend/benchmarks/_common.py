@@ -0,0 +1,98 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Run benchmarks from the backend directory, e.g.:
+    python -m benchmarks.bench_tokenizer --json results/tokenizer.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ENGLISH = (
+    "Photosynthesis converts light energy into chemical energy stored in glucose. "
+    "The student confused the light-dependent reactions with the Calvin cycle, "
+    "and stated that oxygen is produced during carbon fixation. "
+    "In Q3 they chose B, although the answer key says D because ATP is consumed, not produced."
+)
+CODE = (
+    "def fib(n: int) -> int:\n"
+    "    if n < 2:\n"
+    "        return n\n"
+    "    return fib(n - 1) + fib(n - 2)\n\n"
+    "for i in range(10):\n"
+    "    print(f\"{i}: {fib(i)}\")  # expected 0 1 1 2 3 5 8 13 21 34\n"
+)
+NON_ENGLISH = (
+    "La fotosíntesis transforma la energía luminosa en energía química. "
+    "Der Schüler verwechselte die Lichtreaktion mit dem Calvin-Zyklus. "
+    "光合作用将光能转化为化学能。学生在第三题选择了B。 "
+    "Учащийся перепутал световую фазу с циклом Кальвина."
+)
+
+SAMPLES: Dict[str, str] = {"english": ENGLISH, "code": CODE, "non_english": NON_ENGLISH}
+
+
+def corpus(repeat: int = 50) -> Dict[str, List[str]]:
+    """Per-category list of varied strings built from the samples."""
+    out: Dict[str, List[str]] = {}
+    for name, text in SAMPLES.items():
+        words = text.split(" ")
+        out[name] = [" ".join(words[i % len(words):] + words[: i % len(words)]) + f" #{i}" for i in range(repeat)]
+    return out
+
+
+def timeit(fn: Callable[[], Any], repeat: int = 5, number: int = 1) -> Dict[str, float]:
+    """Best and mean wall time per call over `repeat` rounds of `number` calls."""
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return {"best_s": min(rounds), "mean_s": sum(rounds) / len(rounds)}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def parser(description: str) -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument("--json", metavar="PATH", help="also write results as JSON to PATH")
+    return p
+
+
+def report(name: str, results: Dict[str, Any], json_path: Optional[str] = None) -> None:
+    """Print results and optionally save them with run metadata for comparison across commits."""
+    payload = {
+        "benchmark": name,
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    print(json.dumps(payload, indent=2, ensure_ascii=False))
+    if json_path:
+        path = Path(json_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
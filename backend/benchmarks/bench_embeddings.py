@@ -0,0 +1,81 @@
+"""
+Throughput and storage cost of the embedding backends.
+
+For each backend, embeds a corpus of chunk-sized texts cold (empty cache)
+and again from the on-disk cache, and reports texts/sec plus bytes per
+vector for float16 and float32 cache storage. The Ollama backend is only
+measured with --ollama (uses OLLAMA_HOST and OLLAMA_EMBED_MODEL).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from app.services.embeddings import EmbeddingCache, EmbeddingService, HashingEmbeddingBackend, OllamaEmbeddingBackend
+from app.services.http_clients import ProviderClients
+from app.services.prompts import config
+
+from ._common import corpus, parser, report
+
+
+async def measure(make_backend, texts: List[str], dtype: str, batch_size: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.sqlite3")
+        cache = EmbeddingCache(path, dtype)
+        service = EmbeddingService(make_backend(), cache, batch_size)
+        start = time.perf_counter()
+        vectors = await service.embed(texts)
+        cold = time.perf_counter() - start
+
+        # Fresh service over the same file so nothing is served from memory
+        warm_service = EmbeddingService(make_backend(), EmbeddingCache(path, dtype), batch_size)
+        start = time.perf_counter()
+        await warm_service.embed(texts)
+        warm = time.perf_counter() - start
+        cache.close()
+        warm_service.close()
+        return {
+            "dim": int(vectors.shape[1]),
+            "cold_texts_per_s": len(texts) / cold,
+            "cached_texts_per_s": len(texts) / warm,
+            "bytes_per_vector": vectors.shape[1] * (2 if dtype == "float16" else 4),
+            "db_bytes_per_vector": os.path.getsize(path) / len(texts),
+            "batches": service.stats()["batches"],
+        }
+
+
+async def run(args) -> Dict[str, Any]:
+    texts = [t for group in corpus(args.repeat).values() for t in group]
+    backends = {"hashing": lambda: HashingEmbeddingBackend(args.dim)}
+    clients = None
+    if args.ollama:
+        clients = ProviderClients()
+        backends["ollama"] = lambda: OllamaEmbeddingBackend(clients, config.ollama_embed_model, args.ollama_dim)
+    results: Dict[str, Any] = {"texts": len(texts), "batch_size": args.batch_size, "backends": {}}
+    try:
+        for name, make_backend in backends.items():
+            results["backends"][name] = {
+                dtype: await measure(make_backend, texts, dtype, args.batch_size) for dtype in ("float16", "float32")
+            }
+    finally:
+        if clients is not None:
+            await clients.aclose()
+    return results
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--repeat", type=int, default=1000, help="texts per sample category")
+    p.add_argument("--dim", type=int, default=256, help="hashing embedder size")
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--ollama", action="store_true", help="also measure the Ollama /api/embed backend")
+    p.add_argument("--ollama-dim", type=int, default=768, help="output size of OLLAMA_EMBED_MODEL")
+    args = p.parse_args()
+    report("embeddings", asyncio.run(run(args)), args.json)
+
+
+if __name__ == "__main__":
+    main()
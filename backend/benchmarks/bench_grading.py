@@ -0,0 +1,118 @@
+"""
+Upstream calls and prompt tokens saved by grading against the answer key.
+
+Builds synthetic submissions (multiple-choice, numeric and free-text
+questions, answered correctly with a given probability, with the usual
+formatting noise) and reports per accuracy level: the share of submissions
+short-circuited without a model call, tokens of the answers + answer key
+fields and of the whole prompt, full vs graded (incorrect items only), for
+the rest, and the time of the grading stage itself.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.routers.prompt import PromptTestRequest, _render_prompts, _token_options, pregrade, short_circuits
+from app.services.prompts import config
+from app.services.tokenization import estimate_llm_tokens
+
+from ._common import parser, percentile, report
+
+FREE_TEXT = [
+    ("photosynthesis", "photo-synthesis"),
+    ("the mitochondria", "mitochondria"),
+    ("carbon dioxide and water", "Carbon dioxide + water"),
+    ("the calvin cycle", "calvin cycle"),
+    ("osmosis", "osmosis."),
+]
+WRONG_TEXT = ["respiration", "the nucleus", "oxygen and glucose", "glycolysis", "diffusion"]
+
+
+def question(rng: random.Random, i: int) -> Tuple[str, str, str]:
+    """(key, correct answer as a student writes it, a wrong answer)."""
+    kind = i % 3
+    if kind == 0:
+        key = rng.choice("ABCD")
+        written = rng.choice([key, key.lower(), f"({key})", f"{key}) because it fits"])
+        return key, written, rng.choice([c for c in "ABCD" if c != key])
+    if kind == 1:
+        n = rng.randint(2, 40)
+        return str(n / 4), rng.choice([str(n / 4), f"{n}/4", f"x = {n / 4}"]), str(n / 4 + 1)
+    key, written = rng.choice(FREE_TEXT)
+    return key, written, rng.choice(WRONG_TEXT)
+
+
+def submission(rng: random.Random, questions: int, accuracy: float) -> PromptTestRequest:
+    key_lines, answer_lines = [], []
+    for i in range(questions):
+        key, right, wrong = question(rng, i)
+        key_lines.append(f"Q{i + 1}: {key}")
+        answer_lines.append(f"Q{i + 1}: {right if rng.random() < accuracy else wrong}")
+    return PromptTestRequest(answers="\n".join(answer_lines), answer_key=", ".join(key_lines), strategy="default")
+
+
+def tokens(body: PromptTestRequest, loop: asyncio.AbstractEventLoop) -> Tuple[int, int]:
+    """(answers + answer_key tokens, whole prompt tokens)."""
+    options = _token_options()
+    prompt = loop.run_until_complete(_render_prompts(body))
+    fields = estimate_llm_tokens(body.answers, options) + estimate_llm_tokens(body.answer_key, options)
+    return fields, estimate_llm_tokens(prompt.system_prompt + prompt.user_prompt, options)
+
+
+def _mean(values: List[int]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def run(accuracy: float, submissions: int, questions: int, seed: int, loop: asyncio.AbstractEventLoop) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    grade_times: List[float] = []
+    full: List[Tuple[int, int]] = []
+    graded: List[Tuple[int, int]] = []
+    short_circuited = 0
+    for _ in range(submissions):
+        body = submission(rng, questions, accuracy)
+        start = time.perf_counter()
+        graded_body, grading = pregrade(body)
+        grade_times.append(time.perf_counter() - start)
+        if short_circuits(grading):
+            short_circuited += 1
+            continue
+        full.append(tokens(body, loop))
+        graded.append(tokens(graded_body, loop))
+    out: Dict[str, Any] = {"short_circuited": short_circuited / submissions, "upstream_calls_saved": short_circuited}
+    for i, name in enumerate(("answer_tokens", "prompt_tokens")):
+        before, after = _mean([t[i] for t in full]), _mean([t[i] for t in graded])
+        out[f"{name}_full"] = before
+        out[f"{name}_graded"] = after
+        out[f"{name}_reduction"] = 1 - after / before if before else 0.0
+    return {
+        **out,
+        "grade_p50_us": percentile(grade_times, 50) * 1e6,
+        "grade_p95_us": percentile(grade_times, 95) * 1e6,
+    }
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--submissions", type=int, default=500, help="submissions per accuracy level")
+    p.add_argument("--questions", type=int, default=20)
+    p.add_argument("--accuracy", type=float, nargs="+", default=[0.7, 0.9, 0.98], help="per-question correct rates")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--short-circuit", action="store_true", help="measure with GRADING_SHORT_CIRCUIT on (off by default)")
+    args = p.parse_args()
+    config.grading_short_circuit = args.short_circuit
+    loop = asyncio.new_event_loop()
+    try:
+        results = {
+            f"accuracy_{a}": run(a, args.submissions, args.questions, args.seed, loop) for a in args.accuracy
+        }
+    finally:
+        loop.close()
+    report("grading", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Write throughput and dashboard query latency of the gap history store.
+
+Bulk-loads --reports synthetic reports (students in classes, 0-5 weaknesses
+each over --concepts concepts, spread over --days days) in batches of
+--batch-size, then reports:
+- insert: bulk rate, DB size, and the latency of writing one report (what an
+  unbatched request would pay) and of a 100-report group-commit flush
+- queries: p50/p99 of the rollup-backed dashboard queries (class and student
+  overview, student trend, latest reports)
+- naive_class_overview: the same class overview aggregated from the raw
+  weaknesses at query time, i.e. what the rollups save
+- rebuild: recomputing all rollups from the raw rows, and whether the
+  incrementally maintained ones matched
+
+    python -m benchmarks.bench_history --reports 1000000 --json results/history.json
+    python -m benchmarks.bench_history --reports 100000 --path /tmp/history.db --keep
+"""
+from __future__ import annotations
+
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from app.services.history import DAY, GapHistoryStore, ReportRecord
+
+from ._common import parser, percentile, report
+
+NAIVE_CLASS_OVERVIEW = (
+    "SELECT c.name, COUNT(*), SUM(w.confidence), MAX(r.created_at) FROM reports r"
+    " JOIN weaknesses w ON w.report_id = r.id JOIN concepts c ON c.id = w.concept_id"
+    " WHERE r.class_id = ? GROUP BY w.concept_id ORDER BY SUM(w.confidence) DESC LIMIT 50"
+)
+
+
+class Synthetic:
+    """Reports from students who each belong to one class and each have a few weak spots."""
+
+    def __init__(self, args: Any):
+        self.rng = random.Random(args.seed)
+        topics = ["algebra", "biology", "loops", "grammar"]
+        self.concepts = [f"Concept {i} ({self.rng.choice(topics)})" for i in range(args.concepts)]
+        self.students = [(f"s{i}", f"c{i % args.classes}") for i in range(args.students)]
+        # Each student struggles mostly with a handful of concepts
+        self.weak = [self.rng.sample(range(args.concepts), 8) for _ in range(args.students)]
+        self.start = time.time() - args.days * DAY
+        self.span = args.days * DAY
+
+    def record(self) -> ReportRecord:
+        rng = self.rng
+        student = rng.randrange(len(self.students))
+        student_id, class_id = self.students[student]
+        weaknesses = [
+            (self.concepts[rng.choice(self.weak[student]) if rng.random() < 0.8 else rng.randrange(len(self.concepts))],
+             round(rng.random(), 2), "Q3: chose B")
+            for _ in range(rng.randint(0, 5))
+        ]
+        created_at = self.start + rng.random() * self.span
+        return ReportRecord(student_id, class_id, f"quiz{rng.randrange(50)}", created_at, "Synthetic report.", weaknesses)
+
+
+def timings(fn: Any, calls: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    for _ in range(calls):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return {"p50_ms": percentile(latencies, 50) * 1e3, "p99_ms": percentile(latencies, 99) * 1e3}
+
+
+def rollups(store: GapHistoryStore) -> Dict[str, List[Any]]:
+    """Every rollup row, floats rounded so summation order doesn't matter."""
+    out = {}
+    for table in ("class_totals", "class_students", "class_concepts", "student_totals", "student_concepts", "student_daily"):
+        rows = store._conn.execute(f"SELECT * FROM {table}").fetchall()
+        out[table] = sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows)
+    return out
+
+
+def run(args: Any, path: str) -> Dict[str, Any]:
+    data = Synthetic(args)
+    store = GapHistoryStore(path)
+    results: Dict[str, Any] = {
+        "reports": args.reports,
+        "students": args.students,
+        "classes": args.classes,
+        "concepts": args.concepts,
+        "batch_size": args.batch_size,
+    }
+
+    generate_s = insert_s = 0.0
+    done = 0
+    while done < args.reports:
+        t = time.perf_counter()
+        batch = [data.record() for _ in range(min(args.batch_size, args.reports - done))]
+        generate_s += time.perf_counter() - t
+        t = time.perf_counter()
+        store.insert_many(batch)
+        insert_s += time.perf_counter() - t
+        done += len(batch)
+    size = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+    results["insert"] = {
+        "bulk_reports_per_s": args.reports / insert_s,
+        "bulk_s": insert_s,
+        "db_mb": size / 1e6,
+        "single": timings(lambda: store.insert_many([data.record()]), args.queries),
+        "flush_100": timings(lambda: store.insert_many([data.record() for _ in range(100)]), max(1, args.queries // 10)),
+    }
+
+    rng = random.Random(args.seed + 1)
+
+    def student() -> str:
+        return data.students[rng.randrange(len(data.students))][0]
+
+    def klass() -> str:
+        return f"c{rng.randrange(args.classes)}"
+
+    results["queries"] = {
+        "class_overview": timings(lambda: store.class_overview(klass()), args.queries),
+        "student_overview": timings(lambda: store.student_overview(student()), args.queries),
+        "student_trend": timings(lambda: store.student_trend(student(), 30), args.queries),
+        "student_reports": timings(lambda: store.student_reports(student(), 20), args.queries),
+    }
+    results["naive_class_overview"] = timings(
+        lambda: store._conn.execute(NAIVE_CLASS_OVERVIEW, (klass(),)).fetchall(), max(1, args.queries // 10)
+    )
+    results["naive_class_overview"]["slowdown"] = (
+        results["naive_class_overview"]["p50_ms"] / results["queries"]["class_overview"]["p50_ms"]
+    )
+
+    if not args.skip_rebuild:
+        incremental = rollups(store)
+        t = time.perf_counter()
+        store.rebuild_rollups()
+        results["rebuild"] = {"rebuild_s": time.perf_counter() - t, "consistent": rollups(store) == incremental}
+    store.close()
+    results["generate_s"] = generate_s
+    return results
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--reports", type=int, default=1_000_000)
+    p.add_argument("--students", type=int, default=30_000)
+    p.add_argument("--classes", type=int, default=1000)
+    p.add_argument("--concepts", type=int, default=200)
+    p.add_argument("--days", type=int, default=365, help="time span of the reports")
+    p.add_argument("--batch-size", type=int, default=10000, help="reports per insert_many")
+    p.add_argument("--queries", type=int, default=1000, help="calls per query latency")
+    p.add_argument("--path", help="SQLite file (default: a temporary file, deleted afterwards)")
+    p.add_argument("--keep", action="store_true", help="keep --path afterwards")
+    p.add_argument("--skip-rebuild", action="store_true", help="skip the rebuild and consistency check")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or os.path.join(tmp, "history.db")
+        try:
+            results = run(args, path)
+        finally:
+            if not args.keep:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+    report("history", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold-start cost of the app: importing app.main and loading the config.
+
+Every run is a fresh interpreter (so nothing is cached in sys.modules; the
+OS page cache and __pycache__ stay warm). Reported per step, p50 and best
+over --runs:
+- process_ms: interpreter start to exit, for `python -c "import app.main"`
+- import_ms: `import app.main` alone (config and prompts are not read yet)
+- config_ms: first config access (.env, environment, "System and User Prompt.py")
+- strategies_ms: reading and compiling every prompt strategy (done at startup)
+- reload_ms: a forced reload_prompts (what a prompt edit or SIGHUP costs)
+plus the slowest modules by cumulative import time from `-X importtime`,
+and how much of the import is this app's own modules.
+
+    python -m benchmarks.bench_import --runs 20 --json results/import.json
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from ._common import parser, percentile, report
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from app.services.prompts import get_config, reload_prompts
+get_config()
+configured = time.perf_counter()
+from app.services.strategies import get_strategy_registry
+get_strategy_registry()
+compiled = time.perf_counter()
+reload_prompts(force=True)
+reloaded = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1e3,
+    "config_ms": (configured - imported) * 1e3,
+    "strategies_ms": (compiled - configured) * 1e3,
+    "reload_ms": (reloaded - compiled) * 1e3,
+}}))
+"""
+
+
+def run_child(module: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module)], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - start) * 1e3
+    return timings
+
+
+def import_profile(module: str, top: int) -> Dict[str, Any]:
+    """Slowest modules by cumulative import time, and the app's own self time."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    slowest = sorted(rows, key=lambda r: r[2], reverse=True)[:top]
+    return {
+        "modules": len(rows),
+        "app_self_ms": sum(r[1] for r in rows if r[0] == "app" or r[0].startswith("app.")) / 1e3,
+        "slowest": {name: {"cumulative_ms": cumulative / 1e3, "self_ms": own / 1e3} for name, own, cumulative in slowest},
+    }
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--module", default="app.main", help="module to import")
+    p.add_argument("--runs", type=int, default=10, help="fresh interpreters per measurement")
+    p.add_argument("--top", type=int, default=15, help="slowest modules listed")
+    args = p.parse_args()
+
+    run_child(args.module)  # compile __pycache__ so runs measure imports, not bytecode compilation
+    runs: List[Dict[str, float]] = [run_child(args.module) for _ in range(args.runs)]
+    results: Dict[str, Any] = {"module": args.module, "runs": args.runs}
+    for step in ("process", "import", "config", "strategies", "reload"):
+        values = [r[f"{step}_ms"] for r in runs]
+        results[step] = {"p50_ms": percentile(values, 50), "best_ms": min(values)}
+    results["importtime"] = import_profile(args.module, args.top)
+    report("import", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
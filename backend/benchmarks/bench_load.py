@@ -0,0 +1,262 @@
+"""
+Load test of the HTTP API against the local mock provider.
+
+Starts benchmarks/mock_provider.py and the app (uvicorn, --workers
+processes) as subprocesses wired to each other, or drives an already running
+app given with --url. For every scenario (prompt = /api/prompt-test,
+stream = /api/prompt-test/stream, batch = /api/prompt-test/batch) and every
+--concurrency level, closed-loop clients send --requests requests and the
+report has requests/sec, p50/p95/p99 latency (plus time to first line for
+stream), error counts and the app's peak RSS (summed over its processes,
+Linux only). Request bodies are unique unless --distinct N cycles N of them,
+so the response cache and single-flight only help when asked to.
+
+    python -m benchmarks.bench_load --concurrency 1 16 64 --latency-ms 500 --tokens-per-sec 80
+    python -m benchmarks.bench_load --scenarios stream --provider gemini --json results/load.json
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from . import mock_provider
+from ._common import ENGLISH, parser, percentile, report
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+SCENARIOS = ("prompt", "stream", "batch")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its children (e.g. uvicorn workers), from /proc."""
+    parents: Dict[int, int] = {}
+    rss: Dict[int, int] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            status = (entry / "status").read_text()
+        except OSError:
+            continue
+        parents[int(entry.name)] = int(stat.rsplit(")", 1)[1].split()[1])
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                rss[int(entry.name)] = int(line.split()[1])
+    if pid not in rss:
+        return None
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [p for p, pp in parents.items() if pp == parent and p not in tree]
+        tree.update(children)
+        frontier.extend(children)
+    return sum(rss.get(p, 0) for p in tree) / 1024
+
+
+def body(i: int) -> Dict[str, Any]:
+    return {"answers": f"{ENGLISH} (submission {i})", "context": "Photosynthesis unit, lesson 3"}
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.1)
+
+
+async def one_request(client: httpx.AsyncClient, scenario: str, i: int, batch_size: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    first: Optional[float] = None
+    error = False
+    if scenario == "prompt":
+        resp = await client.post("/api/prompt-test", json=body(i))
+        error = resp.status_code != 200 or resp.json().get("output", "").startswith("ERROR:")
+    elif scenario == "stream":
+        async with client.stream("POST", "/api/prompt-test/stream", json=body(i)) as resp:
+            last = ""
+            async for line in resp.aiter_lines():
+                if line and first is None:
+                    first = time.perf_counter() - start
+                last = line or last
+        error = resp.status_code != 200 or '"type": "error"' in last
+    else:
+        items = [body(i * batch_size + k) for k in range(batch_size)]
+        resp = await client.post("/api/prompt-test/batch", json={"items": items})
+        error = resp.status_code != 200 or any(r.get("error") for r in resp.json()["results"])
+    return {"latency": time.perf_counter() - start, "first": first, "error": error}
+
+
+async def run_level(
+    url: str, scenario: str, concurrency: int, requests: int, batch_size: int, distinct: int, pid: Optional[int], offset: int
+) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    pending = iter(range(requests))
+    peak_rss = rss_mb(pid) if pid else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for n in pending:
+            i = offset + (n % distinct if distinct else n)
+            try:
+                results.append(await one_request(client, scenario, i, batch_size))
+            except httpx.HTTPError:
+                results.append({"latency": 0.0, "first": None, "error": True})
+
+    async def sample_memory() -> None:
+        nonlocal peak_rss
+        while True:
+            await asyncio.sleep(0.25)
+            current = await asyncio.to_thread(rss_mb, pid)
+            if current is not None:
+                peak_rss = max(peak_rss or 0.0, current)
+
+    sampler = asyncio.ensure_future(sample_memory()) if pid else None
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    finally:
+        wall = time.perf_counter() - start
+        if sampler is not None:
+            sampler.cancel()
+    latencies = [r["latency"] for r in results if not r["error"]]
+    firsts = [r["first"] for r in results if r["first"] is not None]
+    out: Dict[str, Any] = {
+        "requests": len(results),
+        "errors": sum(r["error"] for r in results),
+        "rps": len(results) / wall,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "max_ms": max(latencies, default=0.0) * 1e3,
+    }
+    if scenario == "batch":
+        out["items_per_sec"] = out["rps"] * batch_size
+    if firsts:
+        out["first_line_p50_ms"] = percentile(firsts, 50) * 1e3
+        out["first_line_p95_ms"] = percentile(firsts, 95) * 1e3
+    out["peak_rss_mb"] = peak_rss
+    return out
+
+
+def start_servers(args: Any, launcher: bool = False, extra_env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Mock provider and app subprocesses; returns their handles and the app URL.
+
+    With `launcher` the app is started through app.serve (which also sets up
+    shared state for several workers) instead of plain uvicorn.
+    """
+    mock_port, app_port = free_port(), free_port()
+    mock_cmd = [
+        sys.executable, "-m", "benchmarks.mock_provider", "--port", str(mock_port),
+        "--latency", args.latency, "--latency-ms", str(args.latency_ms), "--sigma", str(args.sigma),
+        "--tokens-per-sec", str(args.tokens_per_sec), "--output-tokens", str(args.output_tokens),
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        "--retry-after", str(args.retry_after), "--seed", str(args.seed),
+    ]
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    env = {
+        **os.environ,
+        "PROVIDER": args.provider,
+        "OLLAMA_HOST": mock_url,
+        "GEMINI_BASE_URL": mock_url,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY") or "mock",
+        "PROVIDER_ROUTES": "",
+        "METRICS_ENABLED": os.environ.get("METRICS_ENABLED", "true"),
+        **(extra_env or {}),
+    }
+    if launcher:
+        app_cmd = [sys.executable, "-m", "app.serve"]
+    else:
+        app_cmd = [sys.executable, "-m", "uvicorn", "app.main:app"]
+    app_cmd += ["--host", "127.0.0.1", "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"]
+    mock = subprocess.Popen(mock_cmd, cwd=BACKEND_DIR)
+    app = subprocess.Popen(app_cmd, cwd=BACKEND_DIR, env=env)
+    return {"mock": mock, "app": app, "mock_url": mock_url, "url": f"http://127.0.0.1:{app_port}"}
+
+
+def stop_servers(servers: Dict[str, Any]) -> None:
+    for proc in (servers["app"], servers["mock"]):
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def run(args: Any) -> Dict[str, Any]:
+    servers = None if args.url else start_servers(args)
+    url = args.url or servers["url"]
+    pid = args.pid or (servers["app"].pid if servers else None)
+    try:
+        await wait_ready(url + "/")
+        if servers:
+            await wait_ready(servers["mock_url"] + "/mock/stats")
+        results: Dict[str, Any] = {
+            "url": url,
+            "provider": args.provider if servers else None,
+            "workers": args.workers if servers else None,
+            "mock": vars(mock_provider.settings_from_args(args)) if servers else None,
+            "idle_rss_mb": rss_mb(pid) if pid else None,
+            "scenarios": {},
+        }
+        offset = 0
+        for scenario in args.scenarios:
+            levels: Dict[str, Any] = {}
+            for concurrency in args.concurrency:
+                if args.warmup:
+                    await run_level(url, scenario, concurrency, args.warmup, args.batch_size, 0, None, offset)
+                    offset += args.warmup * args.batch_size
+                levels[f"c{concurrency}"] = await run_level(
+                    url, scenario, concurrency, args.requests, args.batch_size, args.distinct, pid, offset
+                )
+                offset += args.requests * args.batch_size
+            results["scenarios"][scenario] = levels
+        if servers:
+            async with httpx.AsyncClient() as client:
+                results["mock_stats"] = (await client.get(servers["mock_url"] + "/mock/stats")).json()
+        return results
+    finally:
+        if servers:
+            stop_servers(servers)
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--url", help="drive a running app instead of starting one (its provider is up to you)")
+    p.add_argument("--pid", type=int, help="with --url, the app's pid for memory sampling")
+    p.add_argument("--provider", choices=("ollama", "gemini"), default="ollama", help="wire format the app speaks to the mock")
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes of the started app")
+    p.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    p.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    p.add_argument("--warmup", type=int, default=10)
+    p.add_argument("--batch-size", type=int, default=10, help="items per batch request")
+    p.add_argument("--distinct", type=int, default=0, help="cycle this many request bodies (0 = all unique)")
+    mock_provider.add_arguments(p)
+    args = p.parse_args()
+    report("load", asyncio.run(run(args)), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Hot-path cost of the metrics subsystem.
+
+Times the primitives (counter increment, histogram observation, stage timer,
+disabled observation), the local part of a /prompt-test request (render,
+parse and the per-call token bookkeeping) with metrics enabled vs disabled,
+and rendering /metrics with many series. The upstream call is left out, so
+the reported overhead is relative to the cheapest possible request.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict
+
+from app.routers.prompt import PromptTestRequest, _render_prompts
+from app.services.llm_service import LLMService
+from app.services.metrics import REGISTRY, MetricsRegistry
+from app.services.report_parser import parse_report
+
+from ._common import ENGLISH, parser, report, timeit
+
+OUTPUT = "Here is the analysis.\n```json\n" + json.dumps({
+    "summary": ENGLISH[:120],
+    "weaknesses": [{"concept": "Calvin cycle", "evidence": "Q3", "confidence": 0.8}],
+    "resources": [],
+    "next_questions": ["Where is ATP consumed?"],
+    "missing": [],
+}) + "\n```"
+USAGE = {"prompt_tokens": 412, "output_tokens": 96, "total_tokens": 508, "eval_seconds": 1.2, "total_seconds": 1.9}
+
+
+def primitives(number: int) -> Dict[str, float]:
+    registry = MetricsRegistry()
+    counter = registry.counter("c_total", "c", ("provider", "kind"))
+    hist = registry.histogram("h_seconds", "h", ("stage",))
+    off = MetricsRegistry(enabled=False).histogram("off_seconds", "off", ("stage",))
+
+    def timed() -> None:
+        with hist.time("render"):
+            pass
+
+    cases = {
+        "counter_inc": lambda: counter.inc("ollama", "prompt", amount=3),
+        "histogram_observe": lambda: hist.observe(0.0123, "render"),
+        "stage_timer": timed,
+        "observe_disabled": lambda: off.observe(0.0123, "render"),
+    }
+    return {name: timeit(fn, repeat=5, number=number)["best_s"] * 1e9 for name, fn in cases.items()}
+
+
+def request_path(number: int) -> Dict[str, Any]:
+    body = PromptTestRequest(answers=ENGLISH * 3, context=ENGLISH, answer_key="Q1: B, Q2: C, Q3: D")
+    svc = LLMService()
+    loop = asyncio.new_event_loop()
+
+    def one() -> None:
+        prompt = loop.run_until_complete(_render_prompts(body))
+        estimate = svc._estimate_tokens("ollama", None, prompt.system_prompt, prompt.user_prompt)
+        svc._record_usage("ollama", None, estimate, OUTPUT, USAGE)
+        parse_report(OUTPUT)
+
+    out: Dict[str, Any] = {}
+    try:
+        for enabled in (False, True):
+            REGISTRY.enabled = enabled
+            REGISTRY.reset()
+            out["enabled" if enabled else "disabled"] = timeit(one, repeat=5, number=number)["best_s"] * 1e6
+    finally:
+        REGISTRY.enabled = True
+        loop.close()
+    out["overhead_us"] = out["enabled"] - out["disabled"]
+    out["overhead_pct"] = 100.0 * out["overhead_us"] / out["disabled"]
+    return out
+
+
+def scrape(series: int) -> Dict[str, Any]:
+    registry = MetricsRegistry()
+    hist = registry.histogram("h_seconds", "h", ("stage", "provider"))
+    for i in range(series):
+        hist.observe(0.01 * (i % 50), f"stage{i % 10}", f"p{i // 10}")
+    text = registry.render()
+    return {"series": series, "lines": text.count("\n"), "bytes": len(text), "render_ms": timeit(registry.render, repeat=5)["best_s"] * 1e3}
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("-n", type=int, default=20000, help="calls per primitive timing round")
+    p.add_argument("--requests", type=int, default=300, help="simulated requests per timing round")
+    args = p.parse_args()
+
+    results = {
+        "primitives_ns": primitives(args.n),
+        "request_us": request_path(args.requests),
+        "scrape": scrape(200),
+    }
+    report("metrics", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
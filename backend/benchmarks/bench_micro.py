@@ -0,0 +1,87 @@
+"""
+Micro-benchmarks of prompt rendering and every tokenization.py function.
+
+Times render_user_prompt / estimate_user_prompt_tokens and each public
+function of tokenization.py on small (one submission), medium (a long
+transcript) and large (lecture notes) inputs, with the heuristic backend.
+Calls are repeated until a round takes --min-round seconds; the best of
+--repeat rounds is reported in microseconds per call, plus MB/s for the
+functions that scan their input. Save with --json and compare runs with
+benchmarks/compare.py.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict
+
+from app.services import tokenization as tk
+from app.services.prompts import estimate_user_prompt_tokens, render_user_prompt
+
+from ._common import ENGLISH, parser, report, timeit
+
+SIZES = {"small": 1, "medium": 30, "large": 3000}
+HEURISTIC = tk.TokenEstimationOptions(provider="ollama", model="llama3", backend=tk.HEURISTIC_BACKEND)
+
+
+def autorange(fn: Callable[[], Any], repeat: int, min_round: float) -> float:
+    """Best seconds per call, with enough calls per round to be measurable."""
+    number = 1
+    while True:
+        elapsed = timeit(fn, repeat=1, number=number)["best_s"] * number
+        if elapsed >= min_round or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_round / 10 else 2
+    return timeit(fn, repeat=repeat, number=number)["best_s"]
+
+
+def cases(text: str) -> Dict[str, Callable[[], Any]]:
+    texts = [text[i:] + text[:i] for i in range(0, len(text), max(1, len(text) // 16))][:16]
+    budget = max(1, len(text) // 8)  # tokens, about half the text
+    values = {"answers": text, "context": ENGLISH, "answer_key": "Q1: B, Q2: C, Q3: D"}
+    return {
+        "render_user_prompt": lambda: render_user_prompt(text, ENGLISH, "Q1: B, Q2: C, Q3: D"),
+        "estimate_user_prompt_tokens": lambda: estimate_user_prompt_tokens(values, HEURISTIC),
+        "tokenize_words": lambda: tk.tokenize_words(text),
+        "tokenize_sentences": lambda: tk.tokenize_sentences(text),
+        "iter_word_spans": lambda: sum(1 for _ in tk.iter_word_spans(text)),
+        "iter_sentence_spans": lambda: sum(1 for _ in tk.iter_sentence_spans(text)),
+        "count_chars": lambda: tk.count_chars(text),
+        "count_words": lambda: tk.count_words(text),
+        "estimate_llm_tokens": lambda: tk.estimate_llm_tokens(text, HEURISTIC),
+        "count_tokens_batch": lambda: tk.count_tokens_batch(texts, HEURISTIC),
+        "estimate_prompt_tokens": lambda: tk.estimate_prompt_tokens(ENGLISH, text, HEURISTIC),
+        "fit_prefix": lambda: tk.fit_prefix(text, budget, HEURISTIC),
+        "split_text_to_fit_tokens": lambda: tk.split_text_to_fit_tokens(text, budget, HEURISTIC),
+        "get_tokenizer": lambda: tk.get_tokenizer(HEURISTIC),
+        "available_tokenizers": tk.available_tokenizers,
+        "HeuristicTokenizer.count": lambda: tk.HeuristicTokenizer().count(text),
+    }
+
+
+# Functions whose cost grows with the input; reported with throughput
+SCANNING = {
+    "tokenize_words", "tokenize_sentences", "iter_word_spans", "iter_sentence_spans",
+    "count_words", "fit_prefix", "split_text_to_fit_tokens",
+}
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--min-round", type=float, default=0.05, help="seconds per timing round")
+    args = p.parse_args()
+
+    results: Dict[str, Any] = {}
+    for size, copies in SIZES.items():
+        text = " ".join([ENGLISH] * copies)
+        timings: Dict[str, Any] = {"chars": len(text)}
+        for name, fn in cases(text).items():
+            seconds = autorange(fn, args.repeat, args.min_round)
+            timings[name] = {"us": seconds * 1e6}
+            if name in SCANNING:
+                timings[name]["mb_per_s"] = len(text) / seconds / 1e6
+        results[size] = timings
+    report("micro", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
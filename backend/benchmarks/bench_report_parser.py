@@ -0,0 +1,139 @@
+"""
+Parse success rate and time of report extraction over a corpus of model outputs.
+
+Compares the fenced-block regex consumers used before, the raw JSON block
+scanner, parse_report (validated GapReport) and parse_report fed in streamed
+chunks. Pass --corpus with a JSONL file of saved outputs ({"output": ...} per
+line, e.g. exported /prompt-test responses); otherwise a synthetic corpus
+covering the usual shapes (code fences, bare JSON from JSON mode, prose with
+stray braces, trailing commas, echoed examples, truncated output) is used.
+"""
+from __future__ import annotations
+
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.report_parser import JSONBlockScanner, extract_json_block, parse_report
+
+from ._common import ENGLISH, parser, percentile, report
+
+FENCE_RE = re.compile(r"```json\s*(.*?)```", re.S)
+
+
+def regex_fence(text: str) -> Optional[Dict[str, Any]]:
+    m = FENCE_RE.search(text)
+    if not m:
+        return None
+    try:
+        return json.loads(m.group(1))
+    except ValueError:
+        return None
+
+
+def streamed(text: str, chunk: int = 16) -> Any:
+    scanner = JSONBlockScanner()
+    for i in range(0, len(text), chunk):
+        scanner.feed(text[i:i + chunk])
+    return scanner.report()
+
+
+def _report(rng: random.Random) -> Dict[str, Any]:
+    concepts = ["fractions", "photosynthesis", "recursion", "Calvin cycle", "ratios", "loops"]
+    return {
+        "summary": rng.choice(ENGLISH.split(". ")),
+        "weaknesses": [
+            {"concept": rng.choice(concepts), "evidence": f"Q{rng.randint(1, 9)}", "confidence": round(rng.random(), 2)}
+            for _ in range(rng.randint(1, 4))
+        ],
+        "resources": [{"title": "Khan Academy", "type": "video", "url": "", "why": "practice"}],
+        "next_questions": [f"Explain step {i}" for i in range(rng.randint(1, 3))],
+        "missing": [],
+    }
+
+
+def synthetic_corpus(n: int, seed: int = 0) -> List[Tuple[str, str, bool]]:
+    """(shape, output, parseable) triples."""
+    rng = random.Random(seed)
+    prose = ENGLISH
+    out: List[Tuple[str, str, bool]] = []
+    for i in range(n):
+        data = _report(rng)
+        body = json.dumps(data, indent=rng.choice([None, 2]))
+        shape = ("fenced", "bare", "prose", "braces_in_prose", "trailing_comma", "percent", "echoed_example", "truncated")[i % 8]
+        if shape == "fenced":
+            text = f"{prose}\n\n```json\n{body}\n```\nGood luck!"
+        elif shape == "bare":
+            text = body
+        elif shape == "prose":
+            text = f"{prose} Here is the report: {body} Let me know if you need more."
+        elif shape == "braces_in_prose":
+            text = f"Use set notation like {{1, 2}} and f(x) = {{x | x > 0}}.\n```json\n{body}\n```"
+        elif shape == "trailing_comma":
+            text = f"{prose}\n```json\n{body[:-1].rstrip()},\n}}\n```"
+        elif shape == "percent":
+            data["weaknesses"][0]["confidence"] = f"{rng.randint(10, 95)}%"
+            data["next_questions"] = "What is a common denominator?"
+            text = f"{prose}\n```json\n{json.dumps(data)}\n```"
+        elif shape == "echoed_example":
+            text = f'Example: {{"summary": "example", "weaknesses": []}}\nNow yours:\n```json\n{body}\n```'
+        else:
+            text = f"{prose}\n```json\n{body[: len(body) // 2]}"
+        out.append((shape, text, shape != "truncated"))
+    return out
+
+
+def load_corpus(path: str) -> List[Tuple[str, str, bool]]:
+    rows = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                item = json.loads(line)
+                rows.append(("saved", item["output"], bool(item.get("parseable", True))))
+    return rows
+
+
+def measure(fn: Callable[[str], Any], corpus: List[Tuple[str, str, bool]]) -> Dict[str, Any]:
+    times: List[float] = []
+    ok = 0
+    by_shape: Dict[str, List[int]] = {}
+    for shape, text, parseable in corpus:
+        start = time.perf_counter()
+        result = fn(text)
+        times.append(time.perf_counter() - start)
+        good = (result is not None) == parseable
+        ok += good
+        counts = by_shape.setdefault(shape, [0, 0])
+        counts[0] += good
+        counts[1] += 1
+    return {
+        "success_rate": ok / len(corpus),
+        "mean_us": sum(times) / len(times) * 1e6,
+        "p95_us": percentile(times, 95) * 1e6,
+        "by_shape": {shape: round(good / total, 3) for shape, (good, total) in by_shape.items()},
+    }
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--corpus", help="JSONL of saved outputs ({\"output\": ..., \"parseable\": true})")
+    p.add_argument("-n", type=int, default=4000, help="synthetic corpus size")
+    args = p.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.n)
+    cases: Dict[str, Callable[[str], Any]] = {
+        "regex_fence": regex_fence,
+        "scanner_raw": extract_json_block,
+        "parse_report": parse_report,
+        "parse_report_streamed": streamed,
+    }
+    results: Dict[str, Any] = {"outputs": len(corpus), "cases": {}}
+    for name, fn in cases.items():
+        results["cases"][name] = measure(fn, corpus)
+    report("report_parser", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Tail latency and success rate of provider routing against fake backends.
+
+Each fake backend has a lognormal latency with a slow tail and an error
+rate. Scenarios compare a single backend, the router with failover only and
+the router with hedging, for a healthy pair and for a degraded primary
+(the breaker should steer traffic away). Latencies are in simulated
+milliseconds, scaled down by --scale to keep runs short.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List
+
+from app.services.routing import Backend, ProviderRouter
+
+from ._common import parser, percentile, report
+
+
+class FakeBackend:
+    def __init__(self, median_ms: float, tail_ratio: float, tail_factor: float, error_rate: float, seed: int):
+        self.median_ms = median_ms
+        self.tail_ratio = tail_ratio
+        self.tail_factor = tail_factor
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def __call__(self, scale: float) -> Dict[str, Any]:
+        self.calls += 1
+        ms = self.median_ms * self.rng.lognormvariate(0, 0.25)
+        if self.rng.random() < self.tail_ratio:
+            ms *= self.tail_factor
+        await asyncio.sleep(ms / 1000 * scale)
+        if self.rng.random() < self.error_rate:
+            return {"error": "fake upstream error"}
+        return {"text": "ok"}
+
+
+async def run_scenario(fakes: Dict[Backend, FakeBackend], requests: int, concurrency: int, scale: float, **router_kwargs) -> Dict[str, Any]:
+    router = ProviderRouter(list(fakes), **router_kwargs)
+    latencies: List[float] = []
+    ok = 0
+    pending = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal ok
+        for _ in pending:
+            start = time.perf_counter()
+            result = await router.call(lambda b: fakes[b](scale))
+            latencies.append((time.perf_counter() - start) / scale * 1000)
+            ok += "error" not in result
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats = router.stats()
+    return {
+        "success_rate": ok / requests,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "hedge_ratio": stats["hedges"] / requests,
+        "upstream_calls": sum(f.calls for f in fakes.values()),
+        "backends": {name: {k: b[k] for k in ("state", "successes", "failures", "hedge_wins")} for name, b in stats["backends"].items()},
+    }
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--scale", type=float, default=0.01, help="real seconds per simulated second")
+    args = p.parse_args()
+
+    a, b = Backend("ollama", "fake-a"), Backend("gemini", "fake-b")
+
+    def pair(primary_error: float = 0.0) -> Dict[Backend, FakeBackend]:
+        return {a: FakeBackend(800, 0.08, 6.0, primary_error, 1), b: FakeBackend(1000, 0.08, 6.0, 0.0, 2)}
+
+    common = dict(hedge_delay=1.5, hedge_min_samples=20, breaker_failures=5, breaker_cooldown=5 * args.scale)
+    scenarios = {
+        "single": lambda: run_scenario({a: pair()[a]}, args.requests, args.concurrency, args.scale, hedge=False),
+        "failover_only": lambda: run_scenario(pair(), args.requests, args.concurrency, args.scale, hedge=False, **common),
+        "hedged": lambda: run_scenario(pair(), args.requests, args.concurrency, args.scale, **common),
+        "degraded_single": lambda: run_scenario({a: pair(0.5)[a]}, args.requests, args.concurrency, args.scale, hedge=False),
+        "degraded_hedged": lambda: run_scenario(pair(0.5), args.requests, args.concurrency, args.scale, **common),
+    }
+    results: Dict[str, Any] = {"requests": args.requests, "concurrency": args.concurrency, "scenarios": {}}
+    for name, make in scenarios.items():
+        results["scenarios"][name] = asyncio.run(make())
+    report("routing", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
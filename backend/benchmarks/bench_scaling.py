@@ -0,0 +1,114 @@
+"""
+Throughput scaling of the app from 1 to N worker processes.
+
+For every --workers count, starts the mock provider and the app through the
+app.serve launcher (so several workers share cache, single-flight and rate
+limit state, unless --no-shared-state), drives one scenario at a fixed
+--concurrency and reports requests/sec, latency percentiles, peak RSS, the
+upstream calls the mock received, and speedup / efficiency against the first
+worker count. The mock provider is a single process; keep its --latency-ms
+low and check mock_max_in_flight if the numbers flatten out.
+
+With --distinct N only N request bodies are cycled, so the share of them that
+reaches the provider shows how well workers reuse each other's work (with
+shared state each body should be generated about once, without it about once
+per worker).
+
+    python -m benchmarks.bench_scaling --workers 1 2 4 8 --concurrency 64 --latency-ms 50
+    python -m benchmarks.bench_scaling --distinct 50 --no-shared-state --json results/scaling-local.json
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from typing import Any, Dict, List
+
+import httpx
+
+from app.serve import usable_cores
+
+from . import mock_provider
+from ._common import parser, report
+from .bench_load import SCENARIOS, rss_mb, run_level, start_servers, stop_servers, wait_ready
+
+
+def default_workers() -> List[int]:
+    counts, n = [], 1
+    while n < usable_cores():
+        counts.append(n)
+        n *= 2
+    return counts + [usable_cores()]
+
+
+async def run_workers(args: Any, workers: int, state_dir: str) -> Dict[str, Any]:
+    args.workers = workers
+    env = {
+        # A fresh store per run, so nothing is served from an earlier run's cache
+        "SHARED_STATE_URL": os.path.join(state_dir, f"shared-{workers}.db"),
+        # Deterministic calls go through the cache and single-flight (and so the shared state)
+        "TEMPERATURE": "0",
+    }
+    if args.no_shared_state:
+        env["SHARED_STATE"] = "none"
+    servers = start_servers(args, launcher=True, extra_env=env)
+    pid = servers["app"].pid
+    try:
+        await wait_ready(servers["url"] + "/")
+        await wait_ready(servers["mock_url"] + "/mock/stats")
+        if args.warmup:
+            await run_level(servers["url"], args.scenario, args.concurrency, args.warmup, args.batch_size, 0, None, 1_000_000)
+        async with httpx.AsyncClient() as client:
+            before = (await client.get(servers["mock_url"] + "/mock/stats")).json()
+        out = await run_level(
+            servers["url"], args.scenario, args.concurrency, args.requests, args.batch_size, args.distinct, pid, 0
+        )
+        async with httpx.AsyncClient() as client:
+            after = (await client.get(servers["mock_url"] + "/mock/stats")).json()
+        out["idle_rss_mb"] = rss_mb(pid)
+        out["upstream_calls"] = after["calls"] - before["calls"]
+        out["mock_max_in_flight"] = after["max_in_flight"]
+        return out
+    finally:
+        stop_servers(servers)
+
+
+async def run(args: Any) -> Dict[str, Any]:
+    results: Dict[str, Any] = {
+        "usable_cores": usable_cores(),
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "shared_state": not args.no_shared_state,
+        "mock": vars(mock_provider.settings_from_args(args)),
+        "workers": {},
+    }
+    first = None
+    with tempfile.TemporaryDirectory() as state_dir:
+        for workers in args.workers:
+            level = await run_workers(args, workers, state_dir)
+            first = first or (workers, level["rps"])
+            level["speedup"] = level["rps"] / first[1] if first[1] else 0.0
+            level["efficiency"] = level["speedup"] * first[0] / workers
+            results["workers"][f"w{workers}"] = level
+    return results
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--workers", type=int, nargs="+", default=default_workers(), help="worker counts (default 1, 2, 4 ... cores)")
+    p.add_argument("--scenario", choices=SCENARIOS, default="prompt")
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--warmup", type=int, default=50)
+    p.add_argument("--batch-size", type=int, default=10, help="items per batch request")
+    p.add_argument("--distinct", type=int, default=0, help="cycle this many request bodies (0 = all unique)")
+    p.add_argument("--no-shared-state", action="store_true", help="run the workers without shared state")
+    p.add_argument("--provider", choices=("ollama", "gemini"), default="ollama")
+    mock_provider.add_arguments(p)
+    p.set_defaults(latency_ms=20.0, latency="fixed")
+    args = p.parse_args()
+    report("scaling", asyncio.run(run(args)), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Hit rate, false reuse and lookup latency of the semantic cache.
+
+Fills the cache with synthetic submissions (multiple-choice answers plus a
+short free-text answer) spread over several quizzes, then looks up:
+- reformatted: the same answers with different case, spacing and punctuation
+  (should hit; an exact prompt hash misses all of these);
+- rephrased: the free-text answer reworded slightly (hits depend on threshold);
+- one_changed: one multiple-choice answer differs (a hit is false reuse);
+- novel: unrelated answers (should miss).
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+from app.services.semantic_cache import SemanticCache, SemanticKey
+
+from ._common import parser, percentile, report
+
+FREE_TEXT = [
+    "the mitochondria releases energy from glucose during respiration",
+    "plants absorb light in the chloroplast to make sugar",
+    "a fraction is equivalent when numerator and denominator are scaled",
+    "recursion needs a base case so the function stops",
+    "velocity is displacement divided by elapsed time",
+]
+SYNONYMS = {"releases": "produces", "absorb": "capture", "scaled": "multiplied", "stops": "ends", "elapsed": "total"}
+
+
+def submission(rng: random.Random, questions: int) -> Tuple[List[str], str]:
+    return [rng.choice("ABCD") for _ in range(questions)], rng.choice(FREE_TEXT)
+
+
+def render(choices: List[str], free: str, rng: random.Random, reformat: bool = False) -> str:
+    if not reformat:
+        return " ".join(f"Q{i + 1}: {c}." for i, c in enumerate(choices)) + f" Explain: {free}"
+    sep = rng.choice([" ", "  ", "\n", ", "])
+    body = sep.join(f"q{i + 1} {c.lower()}" for i, c in enumerate(choices))
+    return f"{body};  EXPLAIN -- {free.capitalize()}!"
+
+
+def variant(kind: str, choices: List[str], free: str, rng: random.Random, questions: int) -> str:
+    if kind == "reformatted":
+        return render(choices, free, rng, reformat=True)
+    if kind == "rephrased":
+        return render(choices, " ".join(SYNONYMS.get(w, w) for w in free.split()), rng)
+    if kind == "one_changed":
+        changed = list(choices)
+        i = rng.randrange(questions)
+        changed[i] = rng.choice([c for c in "ABCD" if c != changed[i]])
+        return render(changed, free, rng)
+    return render(*submission(rng, questions), rng)
+
+
+async def run(entries: int, queries: int, quizzes: int, questions: int, threshold: float, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    cache = SemanticCache(threshold=threshold, max_entries=entries, audit_rate=0.0)
+    stored: List[Tuple[str, List[str], str]] = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(entries):
+        quiz = f"quiz{i % quizzes}"
+        choices, free = submission(rng, questions)
+        await cache.set(SemanticKey(render(choices, free, rng), quiz, quiz), {"provider": "fake", "text": f"analysis {i}"})
+        stored.append((quiz, choices, free))
+    fill_s = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results: Dict[str, Any] = {
+        "entries": len(cache),
+        "fill_per_entry_us": fill_s / entries * 1e6,
+        "peak_mb": peak / 1e6,
+        "variants": {},
+    }
+    for kind in ("reformatted", "rephrased", "one_changed", "novel"):
+        latencies: List[float] = []
+        hits = 0
+        for _ in range(queries):
+            quiz, choices, free = rng.choice(stored)
+            key = SemanticKey(variant(kind, choices, free, rng, questions), quiz, quiz)
+            t = time.perf_counter()
+            hit = await cache.get(key)
+            latencies.append(time.perf_counter() - t)
+            hits += hit is not None
+        results["variants"][kind] = {
+            "hit_rate": hits / queries,
+            "p50_us": percentile(latencies, 50) * 1e6,
+            "p95_us": percentile(latencies, 95) * 1e6,
+            "p99_us": percentile(latencies, 99) * 1e6,
+        }
+    results["false_reuse_rate"] = results["variants"]["one_changed"]["hit_rate"]
+    return results
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--entries", type=int, default=100_000)
+    p.add_argument("--queries", type=int, default=2000, help="lookups per variant")
+    p.add_argument("--quizzes", type=int, default=20)
+    p.add_argument("--questions", type=int, default=10, help="multiple-choice answers per submission")
+    p.add_argument("--threshold", type=float, default=0.9)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    results = asyncio.run(run(args.entries, args.queries, args.quizzes, args.questions, args.threshold, args.seed))
+    report("semantic_cache", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
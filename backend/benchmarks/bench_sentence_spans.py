@@ -0,0 +1,92 @@
+"""
+Time and peak memory of list-based vs span-based sentence/word tokenization.
+
+Uses a multi-MB synthetic "lecture notes" text. The list-based baselines are
+the previous implementations of tokenize_sentences and
+split_text_to_fit_tokens, kept here for comparison.
+"""
+from __future__ import annotations
+
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from app.services.tokenization import (
+    DEFAULT_CHARS_PER_TOKEN,
+    SENTENCE_SPLIT_RE,
+    fit_prefix,
+    iter_sentence_spans,
+    iter_word_spans,
+    tokenize_sentences,
+    tokenize_words,
+)
+
+from ._common import ENGLISH, parser, report, timeit
+
+
+def legacy_tokenize_sentences(text: str) -> List[str]:
+    if not text:
+        return []
+    text = text.strip()
+    if not text:
+        return []
+    parts = SENTENCE_SPLIT_RE.split(text)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def legacy_split_text_to_fit_tokens(text: str, max_tokens: int) -> str:
+    char_budget = max(1, int(max_tokens * DEFAULT_CHARS_PER_TOKEN))
+    if len(text) <= char_budget:
+        return text
+    out: List[str] = []
+    running = 0
+    for s in legacy_tokenize_sentences(text):
+        delta = len(s) + (1 if out else 0)
+        if running + delta > char_budget:
+            break
+        out.append(s)
+        running += delta
+    if out:
+        return (" ".join(out)).strip()
+    return text[:char_budget].rstrip()
+
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def consume(iterator) -> int:
+    n = 0
+    for _ in iterator:
+        n += 1
+    return n
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--mb", type=float, default=4.0, help="size of the synthetic text in MB")
+    p.add_argument("--max-tokens", type=int, default=2000, help="budget for the prefix fitters")
+    args = p.parse_args()
+
+    text = ((ENGLISH + "\n\n") * (int(args.mb * 1_000_000) // (len(ENGLISH) + 2) + 1))[: int(args.mb * 1_000_000)]
+    cases: Dict[str, Callable[[], Any]] = {
+        "sentences_list_legacy": lambda: legacy_tokenize_sentences(text),
+        "sentences_list": lambda: tokenize_sentences(text),
+        "sentences_spans": lambda: consume(iter_sentence_spans(text)),
+        "words_list": lambda: tokenize_words(text),
+        "words_spans": lambda: consume(iter_word_spans(text)),
+        "fit_prefix_legacy": lambda: legacy_split_text_to_fit_tokens(text, args.max_tokens),
+        "fit_prefix_spans": lambda: text[: fit_prefix(text, args.max_tokens)],
+    }
+    results: Dict[str, Any] = {"text_chars": len(text), "max_tokens": args.max_tokens, "cases": {}}
+    for name, fn in cases.items():
+        results["cases"][name] = {**timeit(fn, repeat=3), "peak_bytes": peak_memory(fn)}
+    report("sentence_spans", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the heuristic and BPE tokenizer backends on speed and accuracy.
+
+Accuracy is reported as the heuristic's error relative to BPE counts, per
+corpus category (English prose, code, non-English). Pass --merges/--vocab to
+use a real model's files; without them a merges table is learned from the
+benchmark corpus so the script runs offline.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from app.services.bpe import BPETokenizer, learn_merges
+from app.services.tokenization import HeuristicTokenizer
+
+from ._common import corpus, parser, report, timeit
+
+
+def main() -> None:
+    p = parser(__doc__.strip().splitlines()[0])
+    p.add_argument("--merges", help="GPT-2 style merges.txt")
+    p.add_argument("--vocab", help="optional vocab.json")
+    p.add_argument("--learn-merges", type=int, default=2000, help="merges to learn when --merges is not given")
+    p.add_argument("--repeat", type=int, default=200, help="strings per category")
+    args = p.parse_args()
+
+    texts = corpus(args.repeat)
+    if args.merges:
+        bpe = BPETokenizer.from_files(args.merges, args.vocab)
+        source = args.merges
+    else:
+        bpe = BPETokenizer(learn_merges((t for group in texts.values() for t in group), args.learn_merges))
+        source = f"learned ({args.learn_merges} merges)"
+    heuristic = HeuristicTokenizer()
+
+    results: Dict[str, Any] = {"merges": source, "categories": {}}
+    for name, group in texts.items():
+        chars = sum(len(t) for t in group)
+        exact = bpe.count_batch(group)
+        approx = heuristic.count_batch(group)
+        errors = [abs(a - e) / e for a, e in zip(approx, exact) if e]
+
+        def cold_single() -> None:
+            bpe._cache.clear()
+            for t in group:
+                bpe.count(t)
+
+        def cold_batch() -> None:
+            bpe._cache.clear()
+            bpe.count_batch(group)
+
+        timings = {
+            "heuristic_batch": timeit(lambda: heuristic.count_batch(group)),
+            "bpe_single_cold": timeit(cold_single),
+            "bpe_batch_cold": timeit(cold_batch),
+            "bpe_batch_warm": timeit(lambda: bpe.count_batch(group)),
+        }
+        results["categories"][name] = {
+            "strings": len(group),
+            "chars": chars,
+            "bpe_tokens": sum(exact),
+            "heuristic_tokens": sum(approx),
+            "heuristic_mean_abs_error_pct": round(100 * sum(errors) / max(1, len(errors)), 2),
+            "timings": {
+                k: {**v, "chars_per_s": round(chars / v["best_s"]) if v["best_s"] else None}
+                for k, v in timings.items()
+            },
+        }
+    report("tokenizer", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare two saved benchmark results (--json output) and flag regressions.
+
+Walks both result trees and compares every numeric leaf present in both.
+Direction is inferred from the name: times and latencies (*_ms, *_us, *_ns,
+*_s, "us", p50/p95/p99...) and memory (*_mb, bytes) are better lower;
+rates (rps, *_per_s, *_per_sec, hit_rate, success_rate, speedup...) are
+better higher; other leaves are shown but never flagged. Exits with status 1
+when a change is worse than --threshold, so it can gate CI.
+
+    python -m benchmarks.compare results/micro-main.json results/micro-branch.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+LOWER_SUFFIXES = ("_ms", "_us", "_ns", "_s", "_mb", "bytes", "_seconds")
+LOWER_NAMES = {"us", "ms", "ns", "p50", "p95", "p99", "errors", "false_reuse_rate"}
+HIGHER_MARKERS = ("rps", "per_s", "per_sec", "hit_rate", "success_rate", "speedup", "reduction", "throughput")
+
+
+def leaves(data: Any, path: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from leaves(value, f"{path}.{key}" if path else str(key))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield path, float(data)
+
+
+def direction(path: str) -> Optional[int]:
+    """-1 when lower is better, 1 when higher is better, None when unknown."""
+    name = path.rsplit(".", 1)[-1].lower()
+    if any(marker in name for marker in HIGHER_MARKERS):
+        return 1
+    if name in LOWER_NAMES or name.endswith(LOWER_SUFFIXES) or name.startswith(("p50", "p95", "p99")):
+        return -1
+    return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> Tuple[list, int]:
+    before = dict(leaves(old.get("results", old)))
+    rows, regressions = [], 0
+    for path, value in leaves(new.get("results", new)):
+        if path not in before:
+            continue
+        base = before[path]
+        change = (value - base) / abs(base) if base else (0.0 if value == base else float("inf"))
+        sense = direction(path)
+        verdict = ""
+        if sense is not None and abs(change) >= threshold:
+            worse = change * sense < 0
+            verdict = "REGRESSION" if worse else "improved"
+            regressions += worse
+        rows.append((path, base, value, change, verdict))
+    return rows, regressions
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.20, help="relative change that counts (default 20%%)")
+    p.add_argument("--all", action="store_true", help="also list changes below the threshold")
+    args = p.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if old.get("benchmark") != new.get("benchmark"):
+        print(f"warning: comparing {old.get('benchmark')} with {new.get('benchmark')}", file=sys.stderr)
+    print(f"{old.get('benchmark')}: {old.get('commit')} -> {new.get('commit')}")
+    rows, regressions = compare(old, new, args.threshold)
+    for path, base, value, change, verdict in rows:
+        if verdict or args.all:
+            print(f"{path:60s} {base:14.4g} -> {value:<14.4g} {change:+8.1%}  {verdict}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
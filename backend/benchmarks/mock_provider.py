@@ -0,0 +1,215 @@
+"""
+Local fake Ollama and Gemini HTTP server for load tests.
+
+Serves the endpoints llm_service calls, in both providers' wire formats:
+- POST /api/generate (Ollama; NDJSON when "stream": true) and /api/embed
+- POST /v1beta/models/{model}:generateContent and :streamGenerateContent?alt=sse (Gemini)
+- GET /mock/stats: calls, injected errors and tokens served
+
+Each call waits a time-to-first-token drawn from the latency distribution
+(fixed, uniform or lognormal around --latency-ms), then produces
+--output-tokens tokens at --tokens-per-sec (streamed as they are "generated",
+or all at once for non-streaming calls). --error-rate injects --error-status
+responses (429s carry Retry-After: --retry-after).
+
+Run it standalone and point the app at it:
+    python -m benchmarks.mock_provider --port 11500 --latency-ms 800 --tokens-per-sec 60
+    PROVIDER=ollama OLLAMA_HOST=http://127.0.0.1:11500 uvicorn app.main:app
+bench_load starts it by itself.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+import json
+import random
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+REPORT = {
+    "summary": "Confuses where ATP is produced and consumed in photosynthesis.",
+    "weaknesses": [{"concept": "Calvin cycle", "evidence": "Q3: chose B", "confidence": 0.8}],
+    "resources": [{"title": "Light vs dark reactions", "type": "video", "url": "", "why": "Separates the two stages"}],
+    "next_questions": ["Where is ATP consumed?"],
+    "missing": [],
+}
+
+
+@dataclass
+class MockSettings:
+    latency: str = "lognormal"  # fixed | uniform | lognormal
+    latency_ms: float = 200.0  # time to first token (median for lognormal)
+    sigma: float = 0.5  # lognormal spread; uniform draws from [0, 2 * latency_ms]
+    tokens_per_sec: float = 0.0  # 0 = output is produced instantly
+    output_tokens: int = 120
+    error_rate: float = 0.0
+    error_status: int = 500
+    retry_after: float = 1.0
+    seed: int = 0
+
+
+def _output(tokens: int) -> List[str]:
+    """Model output split into roughly `tokens` pieces of about 4 chars."""
+    text = "Here is the analysis of the answers.\n```json\n" + json.dumps(REPORT) + "\n```"
+    filler = " The student should revisit the light-dependent reactions."
+    while len(text) < tokens * 4:
+        text = filler + text
+    size = max(1, len(text) // max(1, tokens))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="mock provider")
+    rng = random.Random(settings.seed)
+    pieces = _output(settings.output_tokens)
+    stats = {"calls": 0, "streams": 0, "errors": 0, "tokens": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def first_token_delay() -> float:
+        ms = settings.latency_ms
+        if settings.latency == "uniform":
+            ms = rng.uniform(0, 2 * ms)
+        elif settings.latency == "lognormal":
+            ms *= rng.lognormvariate(0, settings.sigma)
+        return ms / 1000
+
+    def token_delay() -> float:
+        return 1 / settings.tokens_per_sec if settings.tokens_per_sec > 0 else 0.0
+
+    def injected_error() -> Response | None:
+        if settings.error_rate <= 0 or rng.random() >= settings.error_rate:
+            return None
+        stats["errors"] += 1
+        headers = {"Retry-After": f"{settings.retry_after:g}"} if settings.error_status == 429 else None
+        return JSONResponse({"error": "injected by mock provider"}, status_code=settings.error_status, headers=headers)
+
+    async def generate(stream: bool) -> AsyncIterator[str]:
+        stats["calls"] += 1
+        stats["streams"] += stream
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(first_token_delay())
+            delay = token_delay()
+            if not stream and delay:
+                await asyncio.sleep(delay * len(pieces))
+            for i, piece in enumerate(pieces):
+                if stream and delay and i:
+                    await asyncio.sleep(delay)
+                stats["tokens"] += 1
+                yield piece
+        finally:
+            stats["in_flight"] -= 1
+
+    def ollama_done(prompt: str) -> Dict[str, Any]:
+        eval_s = len(pieces) * token_delay()
+        return {
+            "done": True,
+            "prompt_eval_count": len(prompt) // 4,
+            "eval_count": len(pieces),
+            "eval_duration": int(eval_s * 1e9),
+            "total_duration": int((eval_s + settings.latency_ms / 1000) * 1e9),
+        }
+
+    def gemini_usage(prompt: str) -> Dict[str, Any]:
+        return {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(pieces),
+                "totalTokenCount": len(prompt) // 4 + len(pieces)}
+
+    @app.post("/api/generate")
+    async def ollama_generate(request: Request) -> Response:
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            return error
+        prompt = body.get("system", "") + body.get("prompt", "")
+        if not body.get("stream"):
+            text = "".join([piece async for piece in generate(False)])
+            return JSONResponse({"model": body.get("model"), "response": text, **ollama_done(prompt)})
+
+        async def lines() -> AsyncIterator[str]:
+            async for piece in generate(True):
+                yield json.dumps({"response": piece, "done": False}) + "\n"
+            yield json.dumps({"response": "", **ollama_done(prompt)}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.post("/api/embed")
+    async def ollama_embed(request: Request) -> Dict[str, Any]:
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {"embeddings": [[float(len(t) % 7), 1.0, float(sum(map(ord, t)) % 13)] for t in texts]}
+
+    @app.post("/v1beta/models/{target}")
+    async def gemini(target: str, request: Request) -> Response:
+        model, _, method = target.partition(":")
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            return error
+        prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        if method == "generateContent":
+            text = "".join([piece async for piece in generate(False)])
+            return JSONResponse({
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": gemini_usage(prompt),
+                "modelVersion": model,
+            })
+        if method != "streamGenerateContent":
+            return JSONResponse({"error": f"unknown method {method}"}, status_code=404)
+
+        async def events() -> AsyncIterator[str]:
+            async for piece in generate(True):
+                yield "data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": piece}]}}]}) + "\r\n\r\n"
+            yield "data: " + json.dumps({"candidates": [], "usageMetadata": gemini_usage(prompt)}) + "\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/mock/stats")
+    async def mock_stats() -> Dict[str, int]:
+        return stats
+
+    return app
+
+
+def add_arguments(p: argparse.ArgumentParser) -> None:
+    defaults = MockSettings()
+    p.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), default=defaults.latency)
+    p.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="time to first token")
+    p.add_argument("--sigma", type=float, default=defaults.sigma, help="lognormal spread")
+    p.add_argument("--tokens-per-sec", type=float, default=defaults.tokens_per_sec, help="0 = instant output")
+    p.add_argument("--output-tokens", type=int, default=defaults.output_tokens)
+    p.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    p.add_argument("--error-status", type=int, default=defaults.error_status)
+    p.add_argument("--retry-after", type=float, default=defaults.retry_after, help="seconds, sent with 429s")
+    p.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        sigma=args.sigma,
+        tokens_per_sec=args.tokens_per_sec,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=11500)
+    add_arguments(p)
+    args = p.parse_args()
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
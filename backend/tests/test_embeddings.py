@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from app.services.embeddings import IDF_FILE, EmbeddingCache, EmbeddingService, HashingEmbeddingBackend
+from app.services.ingestion import MANIFEST_FILE, IngestManifest, Ingestor
+from app.services.retrieval import VectorIndex
+
+DIM = 64
+TEXTS = {
+    "cells.md": "The mitochondria is the powerhouse of the cell.\n\nThe cell wall protects plant cells.",
+    "plants.md": "Photosynthesis turns light into sugar.\n\nThe cell membrane controls what enters the cell.",
+}
+
+
+@pytest.fixture
+def content(tmp_path):
+    root = tmp_path / "content"
+    root.mkdir()
+    for name, text in TEXTS.items():
+        (root / name).write_text(text, encoding="utf-8")
+    return str(root)
+
+
+def _ingest(index_dir: str, content: str, service: EmbeddingService) -> VectorIndex:
+    index = VectorIndex.open_or_create(index_dir, DIM)
+    ingestor = Ingestor(index, service, IngestManifest(os.path.join(index_dir, MANIFEST_FILE)), max_tokens=20)
+    try:
+        asyncio.run(ingestor.run(content))
+    finally:
+        ingestor.close()
+    return index
+
+
+def test_cache_key_changes_once_idf_is_fitted():
+    service = EmbeddingService(HashingEmbeddingBackend(DIM))
+    before = service.key("cell wall")
+    service.backend.fit_idf(TEXTS.values())
+    assert service.key("cell wall") != before
+
+
+def test_first_ingestion_fits_and_saves_idf(tmp_path, content):
+    index_dir = str(tmp_path / "index")
+    service = EmbeddingService(HashingEmbeddingBackend(DIM))
+    index = _ingest(index_dir, content, service)
+    assert service.backend.idf is not None
+    assert os.path.exists(os.path.join(index_dir, IDF_FILE))
+
+    # A server process picks up the same weights, so its queries match the stored rows
+    server = EmbeddingService(HashingEmbeddingBackend(DIM))
+    server.use_idf_file(index_dir)
+    np.testing.assert_array_equal(server.backend.idf, service.backend.idf)
+    query = asyncio.run(server.embed(["The cell wall protects plant cells."]))[0]
+    assert index.search(query, k=1)[0].score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_weights_are_loaded_when_another_process_saves_them(tmp_path, content):
+    index_dir = str(tmp_path / "index")
+    server = EmbeddingService(HashingEmbeddingBackend(DIM))
+    VectorIndex.create(index_dir, DIM)
+    server.use_idf_file(index_dir)  # started before the first ingestion
+    assert server.backend.idf is None
+    _ingest(index_dir, content, EmbeddingService(HashingEmbeddingBackend(DIM)))
+    asyncio.run(server.embed(["photosynthesis"]))
+    assert server.backend.idf is not None
+
+
+def test_index_built_without_idf_stays_unweighted(tmp_path, content):
+    index_dir = str(tmp_path / "index")
+    index = VectorIndex.create(index_dir, DIM)
+    index.add(np.ones((1, DIM), dtype=np.float32), [{"text": "older row"}])
+    service = EmbeddingService(HashingEmbeddingBackend(DIM))
+    _ingest(index_dir, content, service)
+    assert service.backend.idf is None
+    assert not os.path.exists(os.path.join(index_dir, IDF_FILE))
+
+
+def test_cached_vectors_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embed.db"), dtype="float16")
+    service = EmbeddingService(HashingEmbeddingBackend(DIM), cache)
+    first = asyncio.run(service.embed(["a b c", "a b c", "d e"]))
+    again = asyncio.run(service.embed(["a b c"]))
+    assert service.stats()["embedded"] == 2 and service.stats()["cache_hits"] == 1
+    np.testing.assert_allclose(again[0], first[0], atol=1e-3)
+    cache.close()
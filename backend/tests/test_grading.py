@@ -0,0 +1,113 @@
+import pytest
+
+from app.routers.prompt import short_circuits
+from app.services.grading import grade, match_answer, parse_pairs
+from app.services.prompts import config
+
+THRESHOLD = 0.8
+
+
+@pytest.mark.parametrize(
+    "answer, expected, match",
+    [
+        ("b", "B", "exact"),
+        ("  Photosynthesis. ", "photosynthesis", "exact"),
+        ("(c)", "C", "exact"),
+        ("option c", "C", "exact"),
+        ("(a) cell wall", "A", "choice"),
+        ("A) because it fits", "A", "choice"),
+        ("0.5", "1/2", "numeric"),
+        ("x = .5", "0.5", "numeric"),
+        ("mitochondria", "mitochondrion|mitochondria", "exact"),
+        ("photo-synthesis", "photosynthesis", "exact"),
+        ("the calvin cycle", "calvin cycle", "fuzzy"),
+        ("1,000", "1000", "numeric"),
+        ("12,345.5", "12345.5", "numeric"),
+        ("3, 4", "3 4", "exact"),
+        ("D", "A", "wrong"),
+        ("0.75", "1/2", "wrong"),
+        ("-5", "5", "wrong"),
+        ("", "A", "missing"),
+    ],
+)
+def test_match_answer(answer, expected, match):
+    assert match_answer(answer, expected, THRESHOLD)[0] == match
+
+
+def test_a_word_starting_with_a_letter_is_not_a_choice():
+    # "A cell wall" is an answer that starts with an article, not option A
+    assert match_answer("A cell wall", "A", THRESHOLD)[0] == "wrong"
+    assert match_answer("B. cell wall", "B", THRESHOLD)[0] == "choice"
+
+
+@pytest.mark.parametrize("answer", ["3,4", "3 4", "3, 4"])
+def test_several_numbers_are_not_one(answer):
+    # Only thousands separators are dropped; spaces between digits stay
+    assert match_answer(answer, "34", THRESHOLD)[0] == "wrong"
+    assert match_answer("34", answer, THRESHOLD)[0] == "wrong"
+
+
+@pytest.mark.parametrize(
+    "answer, expected, match",
+    [
+        ("B", "B) Mitochondria", "choice"),
+        ("(b)", "B. Mitochondria", "choice"),
+        ("B) mitochondrion", "B) Mitochondria", "choice"),
+        ("C", "B) Mitochondria", "wrong"),
+        ("C) Mitochondria", "B) Mitochondria", "wrong"),
+    ],
+)
+def test_letter_against_a_lettered_key(answer, expected, match):
+    assert match_answer(answer, expected, THRESHOLD)[0] == match
+
+
+def test_parse_pairs_formats():
+    assert parse_pairs("Q1: B\nQuestion 2) 4/8\n3. x = 4") == {"1": "B", "2": "4/8", "3": "x = 4"}
+    assert parse_pairs("B for Q1, C for Q2") == {"1": "B", "2": "C"}
+
+
+def test_negated_answer_is_only_a_fuzzy_match():
+    grading = grade(
+        "Q1: B\nQ2: 0.5\nQ3: Plants do not absorb oxygen",
+        "Q1: B, Q2: 1/2, Q3: Plants absorb oxygen",
+        THRESHOLD,
+    )
+    assert [item.match for item in grading.items] == ["exact", "numeric", "fuzzy"]
+    assert grading.all_correct and not grading.all_conclusive
+    assert [item.question for item in grading.uncertain] == ["3"]
+    answers, key = grading.focus()
+    assert "2 of 3 correct (Q1, Q2)" in answers
+    assert "Q3: Plants do not absorb oxygen" in answers
+    assert key == "Q3: Plants absorb oxygen"
+
+
+def test_focus_keeps_only_items_the_model_needs():
+    grading = grade("Q1: B\nQ2: D\nQ4: extra", "Q1: B, Q2: C, Q3: A", THRESHOLD)
+    assert [item.match for item in grading.items] == ["exact", "wrong", "missing"]
+    answers, key = grading.focus()
+    assert "1 of 3 correct (Q1)" in answers
+    assert "Q2: D" in answers and "Q3: (no answer)" in answers and "Q4: extra" in answers
+    assert key == "Q2: C\nQ3: A"
+    assert grading.summary()["incorrect"] == ["Q2", "Q3"]
+
+
+def test_prose_answers_are_not_graded():
+    assert grade("I think the answer is photosynthesis", "Q1: B, Q2: C", THRESHOLD) is None
+    assert grade("Q1: B", "no pairs in this key", THRESHOLD) is None
+
+
+def test_short_circuit_needs_conclusive_matches_and_the_setting(monkeypatch):
+    exact = grade("Q1: b\nQ2: 2/4", "Q1: B, Q2: 0.5", THRESHOLD)
+    negated = grade("Q1: B\nQ2: Plants do not absorb oxygen", "Q1: B, Q2: Plants absorb oxygen", THRESHOLD)
+    unkeyed = grade("Q1: B\nQ2: C", "Q1: B", THRESHOLD)
+
+    monkeypatch.setattr(config, "grading_short_circuit", False)
+    assert not short_circuits(exact)
+
+    monkeypatch.setattr(config, "grading_short_circuit", True)
+    assert short_circuits(exact)
+    assert not short_circuits(negated)
+    assert not short_circuits(unkeyed)
+    assert not short_circuits(None)
+    output, report = exact.report()
+    assert report.weaknesses == [] and "(2/2)" in report.summary
@@ -0,0 +1,134 @@
+import asyncio
+from typing import Any, Dict, List
+
+from app.services.jobs import CANCELLED, DONE, JobQueue, MemoryJobStore, SQLiteJobStore
+
+
+class FakeHandler:
+    """Job handler that records the payloads it ran and finishes after `delay`."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.ran: List[Dict[str, Any]] = []
+
+    async def __call__(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.ran.append(payload)
+        await asyncio.sleep(self.delay)
+        return {"echo": payload["n"]}
+
+
+def _worker(path: str, name: str, handler: FakeHandler, lease: float = 60.0) -> JobQueue:
+    return JobQueue(handler, workers=2, store=SQLiteJobStore(path, lease=lease, owner=name))
+
+
+def test_memory_queue_runs_and_long_polls():
+    handler = FakeHandler(delay=0.01)
+    queue = JobQueue(handler, workers=1, store=MemoryJobStore())
+
+    async def main() -> Any:
+        await queue.start()
+        try:
+            job = await queue.submit({"n": 1})
+            return await queue.wait(job.id, 5)
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(main())
+    assert job.status == DONE and job.result == {"echo": 1}
+
+
+def test_job_status_is_visible_on_every_worker(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    handler_a, handler_b = FakeHandler(delay=0.05), FakeHandler()
+    a, b = _worker(path, "a", handler_a), _worker(path, "b", handler_b)
+
+    async def main() -> Any:
+        await a.start()
+        await b.start()
+        try:
+            job = await a.submit({"n": 7})
+            assert b.get(job.id) is not None
+            return await b.wait(job.id, 5)  # long-poll on the worker that doesn't run it
+        finally:
+            await a.stop()
+            await b.stop()
+
+    job = asyncio.run(main())
+    assert job.status == DONE and job.result == {"echo": 7}
+    assert len(handler_a.ran) == 1 and handler_b.ran == []
+
+
+def test_starting_worker_leaves_live_workers_jobs_alone(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    handler_a, handler_b = FakeHandler(delay=0.1), FakeHandler()
+    a, b = _worker(path, "a", handler_a), _worker(path, "b", handler_b)
+
+    async def main() -> Any:
+        await a.start()
+        try:
+            running = await a.submit({"n": 1})
+            await asyncio.sleep(0.02)
+            await b.start()  # used to re-queue every unfinished row
+            try:
+                return await b.wait(running.id, 5)
+            finally:
+                await b.stop()
+        finally:
+            await a.stop()
+
+    job = asyncio.run(main())
+    assert job.status == DONE
+    assert len(handler_a.ran) == 1 and handler_b.ran == []
+
+
+def test_jobs_of_a_dead_worker_are_adopted(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    handler_b = FakeHandler()
+    dead = SQLiteJobStore(path, lease=0.05, owner="dead")
+    orphan = JobQueue(FakeHandler(), store=dead)
+    b = _worker(path, "b", handler_b, lease=0.05)
+
+    async def main() -> Any:
+        job = await orphan.submit({"n": 3})  # queued, but its worker never runs it
+        dead.close()
+        await asyncio.sleep(0.1)  # the lease runs out
+        await b.start()
+        try:
+            return await b.wait(job.id, 5)
+        finally:
+            await b.stop()
+
+    job = asyncio.run(main())
+    assert job.status == DONE and handler_b.ran == [{"n": 3}]
+
+
+def test_cancel_on_another_worker_stops_the_job(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    handler_a = FakeHandler()
+    a, b = _worker(path, "a", handler_a), _worker(path, "b", FakeHandler())
+
+    async def main() -> Any:
+        job = await a.submit({"n": 1})  # a's workers aren't started yet
+        cancelled = await b.cancel(job.id)
+        assert cancelled.status == CANCELLED
+        await a.start()
+        try:
+            await asyncio.sleep(0.05)
+            return a.get(job.id)
+        finally:
+            await a.stop()
+            await b.stop()
+
+    job = asyncio.run(main())
+    assert job.status == CANCELLED and handler_a.ran == []
+
+
+def test_sqlite_claim_is_exclusive(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    a, b = SQLiteJobStore(path, owner="a"), SQLiteJobStore(path, owner="b")
+    queue = JobQueue(FakeHandler(), store=a)
+    job = asyncio.run(queue.submit({"n": 1}))
+    assert a.claim(job.id)
+    assert not b.claim(job.id)
+    assert not b.cancel_queued(job.id)
+    assert b.adopt() == []  # a's lease is still live
@@ -0,0 +1,103 @@
+import asyncio
+from email.utils import formatdate
+import time
+
+import pytest
+
+from app.services.ratelimit import ProviderLimiter, TokenBucket, retry_after_seconds, retry_delay
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=50.0, capacity=2.0)
+
+    async def main() -> list:
+        return [await bucket.acquire() for _ in range(3)]
+
+    waits = asyncio.run(main())
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.02, abs=0.01)
+
+
+def test_bucket_charge_returns_at_most_capacity():
+    bucket = TokenBucket(rate=1.0, capacity=10.0)
+    bucket.charge(4)
+    assert bucket._tokens == pytest.approx(6.0, abs=0.01)
+    bucket.charge(-100)
+    assert bucket._tokens == 10.0
+
+
+def test_set_rate_scales_capacity_from_the_configured_base():
+    bucket = TokenBucket(rate=0.5, capacity=1.0)
+    for _ in range(5):  # repeated throttle / recover cycles must not ratchet the burst
+        bucket.set_rate(0.05)
+        assert bucket.capacity == 1.0
+        bucket.set_rate(0.5)
+        assert bucket.capacity == 1.0
+    bucket = TokenBucket(rate=100.0, capacity=4096.0)
+    bucket.set_rate(50.0)
+    assert bucket.capacity == 2048.0
+    bucket.set_rate(100.0)
+    assert bucket.capacity == 4096.0
+
+
+def test_throttle_halves_rates_once_per_second_down_to_the_floor():
+    clock = FakeClock()
+    limiter = ProviderLimiter(rpm=600, tpm=60_000, min_factor=0.1, clock=clock)
+    limiter.on_throttle()
+    limiter.on_throttle()  # same burst of 429s
+    assert limiter.factor == 0.5
+    assert limiter.requests.rate == pytest.approx(5.0)
+    assert limiter.tokens.rate == pytest.approx(500.0)
+    for _ in range(10):
+        clock.now += 1.0
+        limiter.on_throttle()
+    assert limiter.factor == 0.1
+    assert limiter.throttled == 12
+
+
+def test_success_recovers_additively_towards_the_ceiling():
+    clock = FakeClock()
+    limiter = ProviderLimiter(rpm=600, min_factor=0.1, recovery_per_min=0.25, clock=clock)
+    limiter.on_throttle()
+    clock.now += 60.0
+    limiter.on_success()
+    assert limiter.factor == pytest.approx(0.75)
+    clock.now += 600.0
+    limiter.on_success()
+    assert limiter.factor == 1.0
+    assert limiter.requests.rate == pytest.approx(10.0)
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = ProviderLimiter()  # no rates configured, the pause still applies
+    limiter.on_throttle(retry_after=0.05)
+
+    async def main() -> list:
+        return await asyncio.gather(limiter.acquire(), limiter.acquire())
+
+    waits = asyncio.run(main())
+    assert all(w == pytest.approx(0.05, abs=0.02) for w in waits)
+    assert asyncio.run(limiter.acquire()) == 0.0
+
+
+def test_retry_after_header_in_seconds_or_http_date():
+    assert retry_after_seconds({"retry-after": "7"}) == 7.0
+    assert retry_after_seconds({"retry-after": "-3"}) == 0.0
+    assert retry_after_seconds({"retry-after": formatdate(time.time() + 30, usegmt=True)}) == pytest.approx(30, abs=2)
+    assert retry_after_seconds({"retry-after": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+
+def test_retry_delay_is_capped_but_never_before_retry_after():
+    for attempt in range(10):
+        assert 0.0 <= retry_delay(attempt, base=0.5, cap=4.0) <= 4.0
+        delay = retry_delay(attempt, base=0.5, cap=4.0, retry_after=10.0)
+        assert 10.0 <= delay <= 10.5
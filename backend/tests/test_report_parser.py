@@ -0,0 +1,42 @@
+import pytest
+
+from app.services.report_parser import JSONBlockScanner, Weakness, parse_report
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (0.7, 0.7),
+        ("70%", 0.7),
+        (" 85 % ", 0.85),
+        ("1%", 0.01),
+        ("0.5%", 0.005),
+        ("100%", 1.0),
+        (85, 0.85),
+        ("85", 0.85),
+        (1, 1.0),
+        (1.5, 1.0),
+        (150, 1.0),
+        ("250%", 1.0),
+        (-0.2, 0.0),
+        ("high", 0.0),
+        (None, 0.0),
+    ],
+)
+def test_confidence_normalisation(value, expected):
+    assert Weakness(confidence=value).confidence == pytest.approx(expected)
+
+
+def test_report_block_after_prose():
+    text = 'Some advice {not json}.\n```json\n{"summary": "ok", "weaknesses": ["fractions"], "resources": [],}\n```'
+    report = parse_report(text)
+    assert report.summary == "ok"
+    assert [w.concept for w in report.weaknesses] == ["fractions"]
+
+
+def test_scanner_across_chunks():
+    scanner = JSONBlockScanner()
+    for chunk in ['Intro {"summ', 'ary": "a \\"}\\" b", ', '"missing": "Q3"}', " trailing"]:
+        scanner.feed(chunk)
+    report = scanner.report()
+    assert report.summary == 'a "}" b' and report.missing == ["Q3"]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.services.retrieval import VectorIndex
+
+DIM = 8
+
+
+def _vectors(*rows: int) -> np.ndarray:
+    return np.eye(DIM, dtype=np.float32)[list(rows)]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "index")
+
+
+def test_add_search_and_delete(path):
+    index = VectorIndex.create(path, DIM)
+    assert index.add(_vectors(0, 1, 2), [{"text": "a"}, {"text": "b"}, {"text": "c"}]) == [0, 1, 2]
+    assert [hit.meta["text"] for hit in index.search(_vectors(1)[0], k=1)] == ["b"]
+    assert index.delete([1]) == 1
+    assert index.live_count == 2
+    assert all(hit.meta["text"] != "b" for hit in index.search(_vectors(1)[0], k=3))
+    mapping = index.compact()
+    assert mapping.tolist() == [0, -1, 1]
+    assert VectorIndex(path).count == 2
+
+
+def test_second_instance_appends_after_rows_it_has_not_seen(path):
+    # e.g. the ingestion CLI writing while the server holds the index open
+    first = VectorIndex.create(path, DIM)
+    second = VectorIndex(path)
+    first.add(_vectors(0, 1), [{"text": "a"}, {"text": "b"}])
+    assert second.add(_vectors(2), [{"text": "c"}]) == [2]
+
+    reopened = VectorIndex(path)
+    assert reopened.count == 3
+    assert reopened.search(_vectors(2)[0], k=1)[0].meta["text"] == "c"
+    # The first instance sees the other's row without reopening
+    assert first.search(_vectors(2)[0], k=1)[0].meta["text"] == "c"
+
+
+def test_other_instance_deletes_and_compaction_are_picked_up(path):
+    server = VectorIndex.create(path, DIM)
+    server.add(_vectors(0, 1, 2, 3), [{"text": t} for t in "abcd"])
+    assert server.search(_vectors(3)[0], k=1)[0].meta["text"] == "d"
+
+    cli = VectorIndex(path)
+    cli.delete([0, 1])
+    assert server.deleted_count == 2
+    cli.compact()
+    cli.add(_vectors(4), [{"text": "e"}])
+
+    assert [server.search(_vectors(i)[0], k=1)[0].meta["text"] for i in (2, 3, 4)] == ["c", "d", "e"]
+    assert server.count == 3
+    assert server.meta(0)["text"] == "c"
@@ -0,0 +1,157 @@
+import asyncio
+from typing import Any, Dict, List
+
+from app.services.routing import CLOSED, HALF_OPEN, OPEN, Backend, CircuitBreaker, ProviderRouter
+
+PRIMARY = Backend("ollama", "fast")
+SECONDARY = Backend("gemini", "flash")
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeProviders:
+    """Backend call whose delay and outcome are set per backend; records every call."""
+
+    def __init__(self, **behaviour: Any) -> None:
+        self.behaviour: Dict[str, Any] = behaviour  # model -> (delay, result dict or exception)
+        self.calls: List[str] = []
+        self.cancelled: List[str] = []
+
+    async def __call__(self, backend: Backend) -> Dict[str, Any]:
+        self.calls.append(backend.model)
+        delay, outcome = self.behaviour[backend.model]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(backend.model)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return dict(outcome)
+
+
+def _router(**kwargs: Any) -> ProviderRouter:
+    kwargs.setdefault("hedge_delay", 0.05)
+    kwargs.setdefault("hedge_max_ratio", 1.0)
+    return ProviderRouter([PRIMARY, SECONDARY], **kwargs)
+
+
+def test_fast_primary_is_not_hedged():
+    router = _router()
+    providers = FakeProviders(fast=(0, {"output": "a"}), flash=(0, {"output": "b"}))
+    result = asyncio.run(router.call(providers))
+    assert result == {"output": "a", "backend": "ollama:fast"}
+    assert providers.calls == ["fast"]
+    assert router.stats()["hedges"] == 0
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    router = _router()
+    providers = FakeProviders(fast=(5, {"output": "a"}), flash=(0, {"output": "b"}))
+    result = asyncio.run(router.call(providers))
+    assert result == {"output": "b", "backend": "gemini:flash", "hedged": True}
+    assert providers.calls == ["fast", "flash"]
+    assert providers.cancelled == ["fast"]
+    stats = router.stats()["backends"]
+    assert stats["gemini:flash"]["hedges"] == 1 and stats["gemini:flash"]["hedge_wins"] == 1
+    assert stats["ollama:fast"]["cancelled"] == 1
+    # A cancelled call is neither a success nor a failure of the primary
+    assert stats["ollama:fast"]["failures"] == 0 and router.breakers[PRIMARY].state == CLOSED
+
+
+def test_hedges_are_capped_by_ratio():
+    router = _router(hedge_max_ratio=0.0)
+    providers = FakeProviders(fast=(0.1, {"output": "a"}), flash=(0, {"output": "b"}))
+    result = asyncio.run(router.call(providers))
+    assert result["backend"] == "ollama:fast" and "hedged" not in result
+    assert providers.calls == ["fast"]
+
+
+def test_hedge_waits_for_primary_p95_once_sampled():
+    router = _router(hedge_min_samples=3)
+    for _ in range(3):
+        router.latency[PRIMARY].observe(10.0)
+    assert router.hedge_after(PRIMARY) == 10.0
+    assert router.hedge_after(SECONDARY) == 0.05
+
+
+def test_error_fails_over_to_next_backend():
+    router = _router(hedge=False)
+    providers = FakeProviders(fast=(0, {"error": "boom"}), flash=(0, {"output": "b"}))
+    result = asyncio.run(router.call(providers))
+    assert result == {"output": "b", "backend": "gemini:flash"}
+    assert providers.calls == ["fast", "flash"]
+    assert router.stats()["backends"]["ollama:fast"]["failures"] == 1
+
+
+def test_raising_backend_counts_as_failure():
+    router = _router(hedge=False)
+    providers = FakeProviders(fast=(0, ConnectionError("refused")), flash=(0, {"output": "b"}))
+    result = asyncio.run(router.call(providers))
+    assert result["backend"] == "gemini:flash"
+    assert router.stats()["backends"]["ollama:fast"]["failures"] == 1
+
+
+def test_all_backends_failing_returns_last_error():
+    router = _router(hedge=False)
+    providers = FakeProviders(fast=(0, {"error": "first"}), flash=(0, {"error": "second"}))
+    result = asyncio.run(router.call(providers))
+    assert result == {"error": "second", "backend": "gemini:flash"}
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failures=2, cooldown=30.0, clock=clock)
+    breaker.on_failure()
+    assert breaker.state == CLOSED
+    breaker.on_failure()
+    assert breaker.state == OPEN and not breaker.available()
+
+    clock.now += 30.0
+    assert breaker.state == HALF_OPEN and breaker.available()
+    breaker.on_start()
+    assert not breaker.available()  # one probe at a time
+    breaker.on_failure()
+    assert breaker.state == OPEN  # a failed probe reopens at once
+
+    clock.now += 30.0
+    breaker.on_start()
+    breaker.on_cancel()
+    assert breaker.available()  # a cancelled probe frees the slot
+    breaker.on_start()
+    breaker.on_success()
+    assert breaker.state == CLOSED and breaker.available()
+
+
+def test_router_skips_open_backend_until_cooldown():
+    clock = FakeClock()
+    router = _router(hedge=False, breaker_failures=1, breaker_cooldown=30.0, clock=clock)
+    failing = FakeProviders(fast=(0, {"error": "down"}), flash=(0, {"output": "b"}))
+    asyncio.run(router.call(failing))
+    assert router.breakers[PRIMARY].state == OPEN
+    assert router.ranked() == [SECONDARY]
+
+    providers = FakeProviders(fast=(0, {"output": "a"}), flash=(0, {"output": "b"}))
+    assert asyncio.run(router.call(providers))["backend"] == "gemini:flash"
+    assert providers.calls == ["flash"]
+
+    # Half-open after the cooldown: the probe succeeds and closes the breaker
+    clock.now += 30.0
+    router.latency[SECONDARY].ewma = 1.0
+    assert router.ranked()[0] == PRIMARY
+    assert asyncio.run(router.call(providers))["backend"] == "ollama:fast"
+    assert router.breakers[PRIMARY].state == CLOSED
+
+
+def test_all_breakers_open_still_tries_every_backend():
+    clock = FakeClock()
+    router = _router(hedge=False, breaker_failures=1, clock=clock)
+    asyncio.run(router.call(FakeProviders(fast=(0, {"error": "x"}), flash=(0, {"error": "y"}))))
+    assert all(b.state == OPEN for b in router.breakers.values())
+    assert router.ranked() == [PRIMARY, SECONDARY]
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from app.services.shared_state import MemoryState
+from app.services.singleflight import SingleFlight
+
+
+class FakeProvider:
+    """Upstream call that counts invocations and answers after `delay`."""
+
+    def __init__(self, delay: float = 0.02, error: Optional[Exception] = None) -> None:
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"output": "ok", "call": self.calls}
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    provider = FakeProvider()
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(*(flight.do("k", provider) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert provider.calls == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(result == {"output": "ok", "call": 1} for result, _ in results)
+    stats = flight.stats()
+    assert (stats["calls"], stats["leaders"], stats["collapsed"], stats["inflight"]) == (5, 1, 4, 0)
+
+
+def test_distinct_keys_and_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    provider = FakeProvider()
+
+    async def main() -> None:
+        await asyncio.gather(flight.do("a", provider), flight.do("b", provider))
+        await flight.do("a", provider)
+
+    asyncio.run(main())
+    assert provider.calls == 3
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+    provider = FakeProvider(error=RuntimeError("upstream down"))
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(*(flight.do("k", provider) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert provider.calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "upstream down" for r in results)
+
+    provider.error = None
+    result, shared = asyncio.run(flight.do("k", provider))
+    assert result["output"] == "ok" and not shared
+    assert provider.calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+    provider = FakeProvider(delay=0.05)
+
+    async def main() -> Any:
+        first = asyncio.ensure_future(flight.do("k", provider))
+        second = asyncio.ensure_future(flight.do("k", provider))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    result, shared = asyncio.run(main())
+    assert result["output"] == "ok" and shared
+    assert provider.calls == 1
+
+
+def test_shared_state_coalesces_across_processes():
+    shared = MemoryState()
+    workers = [SingleFlight(shared, poll=0.005), SingleFlight(shared, poll=0.005)]
+    workers[1].owner = "other-host:1"
+    provider = FakeProvider(delay=0.05)
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(workers[0].do("k", provider), workers[1].do("k", provider))
+
+    results = asyncio.run(main())
+    assert provider.calls == 1
+    assert sorted(shared_flag for _, shared_flag in results) == [False, True]
+    assert results[0][0] == results[1][0]
+    assert sum(w.stats()["remote"] for w in workers) == 1
+
+
+def test_shared_state_waiter_takes_over_after_remote_failure():
+    shared = MemoryState()
+    workers = [SingleFlight(shared, poll=0.005), SingleFlight(shared, poll=0.005)]
+    failing = FakeProvider(delay=0.03, error=RuntimeError("boom"))
+    healthy = FakeProvider(delay=0.01)
+
+    async def main() -> List[Any]:
+        first = asyncio.ensure_future(workers[0].do("k", failing))
+        await asyncio.sleep(0.01)  # let the first worker take the lease
+        return await asyncio.gather(first, workers[1].do("k", healthy), return_exceptions=True)
+
+    failed, (result, _) = asyncio.run(main())
+    assert isinstance(failed, RuntimeError)
+    assert result["output"] == "ok"
+    assert failing.calls == 1 and healthy.calls == 1
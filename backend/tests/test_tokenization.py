@@ -0,0 +1,22 @@
+import pytest
+
+from app.services.tokenization import HeuristicTokenizer, TokenEstimationOptions, fit_prefix, get_tokenizer, register_tokenizer
+
+# Stands in for BPE on text that tokenizes far denser than the heuristic assumes
+DENSE = TokenEstimationOptions(backend="dense-test")
+register_tokenizer(DENSE.backend, lambda o: HeuristicTokenizer(1.0), replace=True)
+
+
+@pytest.mark.parametrize("max_tokens", [1, 7, 30, 99])
+def test_hard_cut_fits_the_active_backend(max_tokens):
+    text = "x" * 500 + " ends here."  # a single sentence far over the budget
+    cut = fit_prefix(text, max_tokens, DENSE)
+    assert 0 < cut <= max_tokens
+    assert get_tokenizer(DENSE).count(text[:cut]) <= max_tokens
+
+
+def test_sentences_still_win_over_the_hard_cut():
+    text = "One two. Three four five six seven."
+    assert fit_prefix(text, 10, DENSE) == len("One two.")
+    assert fit_prefix(text, 100, DENSE) == len(text)
+    assert fit_prefix(text, 4, DENSE) == len("One")  # trailing space dropped